@@ -4,70 +4,265 @@ Searches and applies French construction safety regulations
 """
 
 import logging
-from typing import Dict, Any, List
+import os
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from .base_agent import BaseSecuriSiteAgent
+from ..utils.inspection_scheduler import Inspection, InspectionScheduler
+from ..utils.regulation_kb import RegulationKnowledgeBase, load_knowledge_base
+from ..utils.regulation_search import RegulationSearchIndex, shared_search_index
+from ..utils.weather_index import parse_timestamp
+from ..utils.weather_windows import RiskWindow, RiskWindowIndex
+
+# (high wind, heavy rain, extreme temperature)
+WeatherBucket = Tuple[bool, bool, bool]
 
 class RegulationAgent(BaseSecuriSiteAgent):
     """Agent responsible for construction safety regulation research and compliance"""
     
-    def __init__(self):
+    def __init__(self, weather_windows: Optional[RiskWindowIndex] = None, planning_horizon_hours: int = 24,
+                 knowledge_base: Optional[RegulationKnowledgeBase] = None,
+                 search_index: Optional[RegulationSearchIndex] = None,
+                 modifier_cache_size: int = 1024,
+                 inspection_scheduler: Optional[InspectionScheduler] = None,
+                 aggregation_window_hours: int = 24):
         super().__init__("RegulationAgent")
-        self.french_regulations = {
-            'person_without_ppe': {
-                'articles': ['R4534-15', 'R4312-1', 'R4312-2'],
-                'severity': 'URGENTE',
-                'itv': 24,  # hours
-                'penalty': 'Amende 1 500€ par personne',
-                'referent': 'CNAMTS'
-            },
-            'tower_crane_operation': {
-                'articles': ['R4534-26', 'R4534-27', 'R4534-28'],
-                'severity': 'HAUTE',
-                'itv': 12,  # hours
-                'penalty': 'Arrêt du chantier',
-                'referent': 'CARSAT'
-            },
-            'equipment_positioning': {
-                'articles': ['R4215-1', 'R4215-2', 'R4215-3'],
-                'severity': 'MODÉRÉE',
-                'itv': 48,  # hours
-                'penalty': 'Mise en conformité',
-                'referent': 'Inspection Travail'
-            },
-            'container_obstruction': {
-                'articles': ['R4215-11', 'R4215-12'],
-                'severity': 'MAJEURE',
-                'itv': 24,  # hours
-                'penalty': 'Remplacement/relivraison',
-                'referent': 'Inspection Travail'
-            }
-        }
+        # Precomputed weather risk windows, used to plan around upcoming bad weather
+        self.weather_windows = weather_windows
+        self.planning_horizon = timedelta(hours=planning_horizon_hours)
+        # Read-only tables parsed once per process from data/regulations_fr.json
+        self.knowledge_base = knowledge_base or load_knowledge_base()
+        self.french_regulations = self.knowledge_base.regulations
+        # Local Code du Travail articles; persisted when SECURISITE_REGULATION_INDEX is set
+        if search_index is None:
+            index_path = os.getenv('SECURISITE_REGULATION_INDEX')
+            search_index = shared_search_index(index_path=os.path.abspath(index_path) if index_path else None)
+        self.search_index = search_index
+        # Weather modifiers per (scaled ITV, weather bucket): few distinct keys per site-day
+        self.modifier_cache_size = modifier_cache_size
+        self._modifier_cache: 'OrderedDict[Tuple[int, WeatherBucket], Dict[str, Any]]' = OrderedDict()
+        self.modifier_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+        # Open violations queued through schedule_inspections, ordered by deadline then priority
+        self.inspection_scheduler = inspection_scheduler or InspectionScheduler()
+        # Repeated violations (same article and zone) within a window are scored once;
+        # windows are aligned on midnight, so the length should divide 24
+        self.aggregation_window_hours = max(min(aggregation_window_hours, 24), 1)
     
     async def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Process risk findings and provide regulatory context"""
         self.log_info("Analyzing regulatory compliance for construction risks")
+        return self._analyze(data, self._match_regulation)
+    
+    async def process_batch(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Regulatory analysis of many images at once. Each item has the same
+        shape as process() input; risks sharing a (risk type, severity) pair
+        are matched only once across the whole batch.
+        """
+        self.log_info(f"Analyzing regulatory compliance for {len(batch)} images")
+        match = self._batch_matcher()
+        return [self._analyze(data, match) for data in batch]
+    
+    async def process_site(self, batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        One site-level analysis over many images (same item shape as process()):
+        violations repeated across images are grouped before scoring
+        """
+        self.log_info(f"Aggregating regulatory compliance over {len(batch)} images")
+        match = self._batch_matcher()
+        entries, inspections = [], []
+        for data in batch:
+            image_entries, image_inspections = self._evaluate_image(data, match)
+            entries.extend(image_entries)
+            inspections.extend(image_inspections)
+        times = [detected_at for _, detected_at in entries if detected_at is not None]
+        start = min(times) if times else None
+        site = next((data['site'] for data in batch if data.get('site')), None)
+        return self._summarize(entries, inspections, start, site)
+    
+    def _batch_matcher(self) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+        """Matcher sharing one regulation lookup per (risk type, severity)"""
+        matched: Dict[Tuple[str, Any], Dict[str, Any]] = {}
+        
+        def match(risk: Dict[str, Any]) -> Dict[str, Any]:
+            key = (risk.get('risk_type', 'unknown'), risk.get('severity', 0))
+            regulation = matched.get(key)
+            if regulation is None:
+                regulation = matched[key] = self._match_regulation(risk)
+            return regulation
         
+        return match
+    
+    def _analyze(self, data: Dict[str, Any],
+                 match: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Dict[str, Any]:
+        """Regulatory analysis of one image's risks using the given matcher"""
+        entries, inspections = self._evaluate_image(data, match)
+        return self._summarize(entries, inspections, data.get('timestamp'), data.get('site'))
+    
+    def _evaluate_image(self, data: Dict[str, Any], match: Callable[[Dict[str, Any]], Dict[str, Any]]
+                        ) -> Tuple[List[Tuple[Dict[str, Any], Optional[datetime]]], List[Inspection]]:
+        """
+        Weather-adjusted regulation of each risk of one image, and the inspections
+        it calls for (reported only: queueing them is up to schedule_inspections)
+        """
         risks = data.get('risks', [])
-        weather_conditions = data.get('weather_conditions', {})
+        weather_bucket = self._weather_bucket(data.get('weather_conditions', {}))
+        detected_at = self._detection_time(data.get('timestamp'))
         
-        regulatory_analysis = []
-        total_penalty_score = 0
+        entries = []
+        inspections = []
+        for position, risk in enumerate(risks):
+            reg_info = match(risk)
+            modified_reg = self._modified_regulation(reg_info, weather_bucket)
+            modified_reg['related_articles'] = self._related_articles(risk)
+            modified_reg['zone'] = self._zone(risk)
+            entries.append((modified_reg, detected_at))
+            if detected_at is not None:
+                inspections.append(self._inspection_for(
+                    risk, modified_reg, detected_at, data.get('site'), data.get('camera'),
+                    default_id=f"{data.get('site') or ''}:{data.get('camera') or ''}:{data['timestamp']}:{position}"
+                ))
+        return entries, inspections
+    
+    def _summarize(self, entries: List[Tuple[Dict[str, Any], Optional[datetime]]],
+                   inspections: List[Inspection], timestamp, site: Optional[str]) -> Dict[str, Any]:
+        """Score, recommendations and plan over the deduplicated violations"""
+        regulatory_analysis = [regulation for regulation, _ in entries]
+        groups = self._group_violations(entries)
+        distinct = [group['regulation'] for group in groups]
+        total_penalty_score = sum(self._calculate_penalty_score(regulation) for regulation in distinct)
+        inspections.sort(key=lambda i: (i.deadline, -i.priority))
         
-        for risk in risks:
-            reg_info = self._match_regulation(risk)
-            modified_reg = self._apply_weather_modifiers(reg_info, weather_conditions)
-            regulatory_analysis.append(modified_reg)
-            total_penalty_score += self._calculate_penalty_score(modified_reg)
+        upcoming_windows = self._upcoming_weather_windows(timestamp, site)
+        recommendations = self._generate_compliance_recommendations(distinct)
+        recommendations.extend(self._weather_window_recommendations(upcoming_windows))
         
         return {
             "regulatory_analysis": regulatory_analysis,
             "compliance_score": max(100 - total_penalty_score, 0),
             "total_penalty_score": total_penalty_score,
-            "critical_violations": [r for r in regulatory_analysis if r['severity'] == 'URGENTE'],
-            "recommendations": self._generate_compliance_recommendations(regulatory_analysis),
-            "next_inspection_schedule": self._schedule_inspection(regulatory_analysis)
+            "total_violations": len(regulatory_analysis),
+            "distinct_violations": len(groups),
+            "violation_groups": [
+                {key: value for key, value in group.items() if key != 'regulation'} for group in groups
+            ],
+            "critical_violations": [r for r in distinct if r['severity'] == 'URGENTE'],
+            "recommendations": recommendations,
+            "next_inspection_schedule": self._schedule_inspection(regulatory_analysis, inspections),
+            "inspection_plan": [i.to_dict() for i in inspections],
+            "weather_windows": [w.to_dict() for w in upcoming_windows],
+            "knowledge_base_version": self.knowledge_base.version
         }
     
+    @staticmethod
+    def _zone(risk: Dict[str, Any]) -> str:
+        """Zone of a risk; numbered areas (person_1, person_2...) share one zone"""
+        zone = risk.get('area') or risk.get('location') or 'site'
+        return re.sub(r'_\d+$', '', zone)
+    
+    def _time_window(self, detected_at: Optional[datetime]) -> Optional[datetime]:
+        """Start of the aggregation window containing detected_at"""
+        if detected_at is None:
+            return None
+        hours = self.aggregation_window_hours
+        day = detected_at.replace(hour=0, minute=0, second=0, microsecond=0)
+        return day + timedelta(hours=(detected_at.hour // hours) * hours)
+    
+    def _group_violations(self, entries: List[Tuple[Dict[str, Any], Optional[datetime]]]) -> List[Dict[str, Any]]:
+        """
+        Group violations by (primary article, zone, time window). The most
+        severe regulation of a group stands for it; groups keep first-seen order.
+        """
+        groups: Dict[Tuple[str, str, Optional[datetime]], Dict[str, Any]] = {}
+        for regulation, detected_at in entries:
+            article = regulation['articles'][0] if regulation['articles'] else regulation['original_risk']
+            window = self._time_window(detected_at)
+            key = (article, regulation['zone'], window)
+            group = groups.get(key)
+            if group is None:
+                groups[key] = {
+                    "article": article,
+                    "zone": regulation['zone'],
+                    "window_start": window.isoformat() if window else None,
+                    "occurrences": 1,
+                    "risk_types": [regulation['original_risk']],
+                    "regulation": regulation
+                }
+                continue
+            group['occurrences'] += 1
+            if regulation['original_risk'] not in group['risk_types']:
+                group['risk_types'].append(regulation['original_risk'])
+            current = group['regulation']
+            if ((self._calculate_penalty_score(regulation), -regulation['adjusted_itv'])
+                    > (self._calculate_penalty_score(current), -current['adjusted_itv'])):
+                group['regulation'] = regulation
+        return list(groups.values())
+    
+    def _detection_time(self, timestamp) -> Optional[datetime]:
+        if not timestamp:
+            return None
+        try:
+            return parse_timestamp(timestamp)
+        except (TypeError, ValueError):
+            return None
+    
+    def _inspection_for(self, risk: Dict[str, Any], regulation: Dict[str, Any], detected_at: datetime,
+                        site: Optional[str], camera: Optional[str], default_id: str) -> Inspection:
+        """Inspection due adjusted_itv hours after detection, prioritized by penalty"""
+        return Inspection(
+            violation_id=risk.get('id') or default_id,
+            deadline=detected_at + timedelta(hours=regulation['adjusted_itv']),
+            priority=self._calculate_penalty_score(regulation),
+            referent=regulation['referent'],
+            site=site,
+            camera=camera,
+            details={
+                "risk_type": regulation['original_risk'],
+                "severity": regulation['severity'],
+                "risk_severity": regulation['risk_severity'],
+                "articles": list(regulation['articles'])
+            }
+        )
+    
+    def schedule_inspections(self, risks: List[Dict[str, Any]], detected_at: datetime,
+                             weather: Dict[str, Any], site: Optional[str] = None,
+                             camera: Optional[str] = None) -> List[Inspection]:
+        """Queue an inspection for each risk of one image in the shared scheduler"""
+        bucket = self._weather_bucket(weather)
+        inspections = []
+        for position, risk in enumerate(risks):
+            regulation = self._modified_regulation(self._match_regulation(risk), bucket)
+            inspection = self._inspection_for(risk, regulation, detected_at, site, camera,
+                                              default_id=f"{site or ''}:{camera or ''}:{detected_at.isoformat()}:{position}")
+            self.inspection_scheduler.add(inspection)
+            inspections.append(inspection)
+        return inspections
+    
+    def _upcoming_weather_windows(self, timestamp, site: Optional[str] = None) -> List[RiskWindow]:
+        """Weather risk windows overlapping the planning horizon after timestamp"""
+        if self.weather_windows is None or not timestamp:
+            return []
+        try:
+            start = parse_timestamp(timestamp)
+        except (TypeError, ValueError):
+            return []
+        return self.weather_windows.overlapping(start, start + self.planning_horizon, site=site)
+    
+    def _weather_window_recommendations(self, windows: List[RiskWindow]) -> List[str]:
+        """Work stoppages to plan for the upcoming weather risk windows"""
+        recommendations = []
+        for window in windows:
+            period = f"du {window.start:%d/%m %H:%M} au {window.end:%d/%m %H:%M}"
+            if window.factor == 'high_wind':
+                recommendations.append(f"Suspendre les opérations de grutage {period} (vent fort)")
+            elif window.factor == 'heavy_rain':
+                recommendations.append(f"Reporter travaux électriques extérieurs {period} (pluie)")
+            elif window.factor == 'low_visibility':
+                recommendations.append(f"Limiter la circulation des engins {period} (visibilité réduite)")
+        return recommendations
+    
     def _match_regulation(self, risk: Dict[str, Any]) -> Dict[str, Any]:
         """Match risk with appropriate French regulations"""
         risk_type = risk.get('risk_type', 'unknown')
@@ -75,83 +270,105 @@ class RegulationAgent(BaseSecuriSiteAgent):
         
         # Map to closest regulation category
         regulation_key = self._categorize_risk(risk_type)
-        regulation_info = self.french_regulations.get(regulation_key, {
-            'articles': ['Code général'],
-            'severity': 'INCONNUE',
-            'itv': 72,
-            'penalty': 'Évaluation au cas par cas',
-            'referent': 'Inspection Travail'
-        })
+        regulation_info = self.knowledge_base.regulation(regulation_key)
         
         # Scale ITV based on severity
-        scaled_itv = int(regulation_info['itv'] * (1 - (severity - 1) / 20))
+        scaled_itv = self._scaled_itv(regulation_info['itv'], severity)
         
         return {
             **regulation_info,
+            'articles': list(regulation_info['articles']),
             'original_risk': risk_type,
             'risk_severity': severity,
             'scaled_itv_hours': scaled_itv,
             'deadline': f"{scaled_itv}h maximum"
         }
     
+    @staticmethod
+    def _scaled_itv(itv: int, severity: int) -> int:
+        return int(itv * (1 - (severity - 1) / 20))
+    
+    def _related_articles(self, risk: Dict[str, Any], k: int = 3) -> List[Dict[str, Any]]:
+        """Top Code du Travail articles for a risk, from its description or category"""
+        risk_type = risk.get('risk_type', 'unknown')
+        query = (risk.get('description')
+                 or self.knowledge_base.search_query(self._categorize_risk(risk_type))
+                 or risk_type.replace('_', ' '))
+        return self.search_index.search(query, k)
+    
     def _categorize_risk(self, risk_type: str) -> str:
         """Categorize risk type for regulation matching"""
-        risk_mapping = {
-            'person_without_ppe': 'person_without_ppe',
-            'person_missing_equipment': 'person_without_ppe',
-            'tower_crane_operation': 'tower_crane_operation',
-            'crane_near_people': 'tower_crane_operation',
-            'container_obstruction': 'container_obstruction',
-            'equipment_positioning': 'equipment_positioning',
-            'scaffolding_unstable': 'equipment_positioning',
-            'vehicle_placement': 'container_obstruction'
-        }
-        return risk_mapping.get(risk_type, 'equipment_positioning')
+        return self.knowledge_base.category(risk_type)
     
-    def _apply_weather_modifiers(self, regulation: Dict[str, Any], weather: Dict[str, Any]) -> Dict[str, Any]:
-        """Apply weather-based modifiers to regulatory recommendations"""
-        modified_reg = regulation.copy()
-        
+    def _weather_bucket(self, weather: Dict[str, Any]) -> WeatherBucket:
+        """Discretized weather: the only inputs the ITV modifiers depend on"""
         wind_speed = weather.get('wind_speed', 0)
         precipitation = weather.get('precipitation', 0)
         temperature = weather.get('temperature', 20)
+        return (wind_speed > 25, precipitation > 5, temperature > 35 or temperature < 0)
+    
+    def _weather_modifier(self, scaled_itv: int, bucket: WeatherBucket) -> Dict[str, Any]:
+        """Adjusted ITV and weather notes for (scaled ITV, weather bucket), memoized"""
+        key = (scaled_itv, bucket)
+        modifier = self._modifier_cache.get(key)
+        if modifier is not None:
+            self._modifier_cache.move_to_end(key)
+            self.modifier_cache_stats["hits"] += 1
+            return modifier
+        self.modifier_cache_stats["misses"] += 1
+        
+        high_wind, heavy_rain, extreme_temperature = bucket
         
         # Weather can increase urgency
         urgency_multiplier = 1.0
         weather_conditions = []
         
-        if wind_speed > 25:
+        if high_wind:
             urgency_multiplier *= 0.7  # Reduce ITV by 30%
             weather_conditions.append("vent fort")
         
-        if precipitation > 5:
+        if heavy_rain:
             urgency_multiplier *= 0.8  # Reduce ITV by 20%
-            weather_conditions.append("pluie"),
+            weather_conditions.append("pluie")
         
-        if temperature > 35 or temperature < 0:
+        if extreme_temperature:
             urgency_multiplier *= 0.9  # Reduce ITV by 10%
             weather_conditions.append("température extrême")
         
-        new_itv = int(modified_reg['scaled_itv_hours'] * urgency_multiplier)
+        new_itv = int(scaled_itv * urgency_multiplier)
         
-        modified_reg.update({
+        modifier = {
             'weather_modifier': f"Réduction ITV pour conditions météo: {', '.join(weather_conditions)}",
             'adjusted_itv': max(new_itv, 2),  # Minimum 2 hours
-            'weather_conditions': weather_conditions
-        })
-        
-        return modified_reg
+            'weather_conditions': tuple(weather_conditions)
+        }
+        self._modifier_cache[key] = modifier
+        if len(self._modifier_cache) > self.modifier_cache_size:
+            self._modifier_cache.popitem(last=False)
+            self.modifier_cache_stats["evictions"] += 1
+        return modifier
+    
+    def _modified_regulation(self, regulation: Dict[str, Any], bucket: WeatherBucket) -> Dict[str, Any]:
+        modifier = self._weather_modifier(regulation['scaled_itv_hours'], bucket)
+        return {**regulation, **modifier, 'weather_conditions': list(modifier['weather_conditions'])}
+    
+    def _apply_weather_modifiers(self, regulation: Dict[str, Any], weather: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply weather-based modifiers to regulatory recommendations"""
+        return self._modified_regulation(regulation, self._weather_bucket(weather))
+    
+    def adjusted_itvs(self, risks: List[Dict[str, Any]], weather: Dict[str, Any]) -> List[int]:
+        """Adjusted ITV (hours) of each risk under the same weather, as table lookups"""
+        bucket = self._weather_bucket(weather)
+        itvs = []
+        for risk in risks:
+            regulation = self.knowledge_base.regulation(self._categorize_risk(risk.get('risk_type', 'unknown')))
+            scaled_itv = self._scaled_itv(regulation['itv'], risk.get('severity', 0))
+            itvs.append(self._weather_modifier(scaled_itv, bucket)['adjusted_itv'])
+        return itvs
     
     def _calculate_penalty_score(self, regulation: Dict[str, Any]) -> int:
         """Calculate penalty score based on regulation severity"""
-        severity_mult = {
-            'URGENTE': 20,
-            'HAUTE': 15,
-            'MAJEURE': 10,
-            'MODÉRÉE': 5,
-            'INCONNUE': 8
-        }
-        return severity_mult.get(regulation['severity'], 8)
+        return self.knowledge_base.penalty(regulation['severity'])
     
     def _generate_compliance_recommendations(self, regulatory_analysis: List[Dict[str, Any]]) -> List[str]:
         """Generate compliance recommendations"""
@@ -173,13 +390,19 @@ class RegulationAgent(BaseSecuriSiteAgent):
             if 'pluie' in warning['weather_conditions']:
                 recommendations.append("Reporter travaux électriques extérieurs")
         
-        return list(set(recommendations))
+        # Ordered de-duplication so reports are stable from run to run
+        return list(dict.fromkeys(recommendations))
     
-    def _schedule_inspection(self, regulatory_analysis: List[Dict[str, Any]]) -> str:
+    def _schedule_inspection(self, regulatory_analysis: List[Dict[str, Any]],
+                             inspections: Optional[List[Inspection]] = None) -> str:
         """Schedule next inspection based on violations"""
         if not regulatory_analysis:
             return "Inspection sans préavis"
         
+        if inspections:
+            first = inspections[0]
+            return f"Inspection avant le {first.deadline:%d/%m/%Y %H:%M} ({first.referent})"
+        
         urgent_violations = [r for r in regulatory_analysis if r['severity'] == 'URGENTE']
         high_violations = [r for r in regulatory_analysis if r['severity'] == 'HAUTE']
         
@@ -3,23 +3,110 @@ Report Generation Agent
 Generates comprehensive security reports in French
 """
 
+import hashlib
 import json
 import logging
-from typing import Dict, Any, List
-from datetime import datetime
+import os
+import re
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+from datetime import date, datetime
 import jinja2
 from pathlib import Path
 from .base_agent import BaseSecuriSiteAgent
+from ..utils.report_history import ReportHistory
+
+# Templates ship inside the package, whatever the working directory
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates"
+REPORT_TEMPLATE = "report_template.md"
+# Template fragments joined into one chunk when streaming a report
+STREAM_BUFFER_SIZE = 64
+
+# Report data each template block is rendered from: a block is re-rendered
+# only when these inputs change (blocks not listed depend on everything)
+SECTION_INPUTS = {
+    'summary': ('timestamp', 'images_analyzed', 'total_risks', 'compliance_score'),
+    'changes': ('report_diff',),
+    'alerts': ('critical_violations',),
+    'risks': ('personnel_risks', 'structural_risks'),
+    'weather': ('weather_conditions', 'weather_modifiers'),
+    'regulatory': ('regulatory_analysis',),
+    'recommendations': ('immediate_recommendations', 'short_term_recommendations', 'medium_term_recommendations'),
+    'follow_up': ('next_inspection_date',)
+}
+# Cached fragments per site
+FRAGMENT_CACHE_SIZE = 64
+
+@lru_cache(maxsize=None)
+def _template_environment(templates_dir: str, bytecode_cache_dir: Optional[str]) -> jinja2.Environment:
+    """
+    One environment per template folder, shared by every agent: compiled
+    templates stay in memory and are recompiled only when their file changes
+    (auto_reload); compiled bytecode is also kept on disk across processes
+    """
+    if bytecode_cache_dir:
+        os.makedirs(bytecode_cache_dir, exist_ok=True)
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(templates_dir),
+        bytecode_cache=jinja2.FileSystemBytecodeCache(bytecode_cache_dir),
+        auto_reload=True
+    )
+
+class _RiskSelection:
+    """Personnel or structural risks of a risk list, filtered on each pass instead of copied"""
+    
+    def __init__(self, risks: Iterable[Dict[str, Any]], personnel: bool):
+        self.risks = risks
+        self.personnel = personnel
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (risk for risk in self.risks if _is_personnel_risk(risk) == self.personnel)
+
+def _is_personnel_risk(risk: Dict[str, Any]) -> bool:
+    return 'person' in risk.get('risk_type', '').lower()
+
+def _buffered(chunks: Iterable[str], size: int) -> Iterator[str]:
+    """Chunks joined size at a time, as Jinja2's buffered streams do"""
+    buffer = []
+    for chunk in chunks:
+        buffer.append(chunk)
+        if len(buffer) >= size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
 
 class ReportGenerationAgent(BaseSecuriSiteAgent):
     """Agent responsible for generating comprehensive French security reports"""
     
-    def __init__(self):
+    def __init__(self, templates_dir: Optional[Path] = None, bytecode_cache_dir: Optional[Path] = None,
+                 history: Optional[ReportHistory] = None):
         super().__init__("ReportGenerationAgent")
-        self.template_env = jinja2.Environment()
+        if bytecode_cache_dir is None:
+            # Unset: Jinja2's per-user folder in the system temp directory
+            bytecode_cache_dir = os.getenv("SECURISITE_TEMPLATE_CACHE")
+        self.template_env = _template_environment(
+            str(Path(templates_dir or TEMPLATES_DIR).resolve()),
+            str(bytecode_cache_dir) if bytecode_cache_dir else None
+        )
+        self._default_template: Optional[jinja2.Template] = None
+        # Per site: risk counts and compliance of recent reports by date, shared
+        # across processes when SECURISITE_REPORT_HISTORY names a directory
+        if history is None:
+            history = ReportHistory(os.getenv("SECURISITE_REPORT_HISTORY") or None)
+        self.history = history
+        # Per site: rendered blocks
+        self._fragments: Dict[str, 'OrderedDict[Tuple[str, str], str]'] = {}
+        self.section_stats = {"rendered": 0, "reused": 0}
         
     async def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """Process all agent results and generate final report"""
+        """
+        Process all agent results and generate final report. When data names a
+        site, the report is compared with the site's previous one (new, resolved
+        and persisting risks) and only the sections whose inputs changed are
+        rendered again.
+        """
         self.log_info("Generating security analysis report")
         
         # Prepare data for report template
@@ -29,10 +116,67 @@ class ReportGenerationAgent(BaseSecuriSiteAgent):
         template = await self._load_template()
         
         # Generate report
-        report = template.render(**report_data)
+        site = data.get('site')
+        if site is None:
+            report = template.render(**report_data)
+        else:
+            report = ''.join(self._iter_sections(template, report_data, self._fragments.setdefault(site, OrderedDict())))
+        self._remember(data, report_data)
         
+        return {"report": report, "diff": report_data['report_diff'], **self._report_metadata(report_data)}
+    
+    def stream(self, data: Dict[str, Any], buffer_size: int = STREAM_BUFFER_SIZE,
+               remember: bool = True) -> Iterator[str]:
+        """
+        Render the report chunk by chunk (Jinja2 generator interface), e.g. as a
+        Flask streaming response body: the full report is never held in memory.
+        Site reports reuse the cached sections, as in process(); with remember
+        False, the report is still compared with the previous one but not kept
+        in the site's history (e.g. exports of an existing report).
+        """
+        self.log_info("Streaming security analysis report")
+        report_data = self._prepare_report_data(data)
+        if remember:
+            self._remember(data, report_data)
+        template = self._get_template()
+        site = data.get('site')
+        if site is not None:
+            return _buffered(self._iter_sections(template, report_data, self._fragments.setdefault(site, OrderedDict())),
+                             buffer_size)
+        stream = template.stream(**report_data)
+        stream.enable_buffering(buffer_size)
+        return iter(stream)
+    
+    def write_report(self, data: Dict[str, Any], output: Union[str, Path, TextIO],
+                     buffer_size: int = STREAM_BUFFER_SIZE) -> Dict[str, Any]:
+        """
+        Stream the report to a path or an open text file; returns the same
+        metadata as process() without the report text
+        """
+        report_data = self._prepare_report_data(data)
+        self._remember(data, report_data)
+        template = self._get_template()
+        site = data.get('site')
+        if site is not None:
+            chunks = _buffered(self._iter_sections(template, report_data, self._fragments.setdefault(site, OrderedDict())),
+                               buffer_size)
+        else:
+            stream = template.stream(**report_data)
+            stream.enable_buffering(buffer_size)
+            chunks = iter(stream)
+        if isinstance(output, (str, Path)):
+            with open(output, 'w', encoding='utf-8') as f:
+                f.writelines(chunks)
+        else:
+            output.writelines(chunks)
+        return self._report_metadata(report_data)
+    
+    def summarize(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Report metadata (summary, actions) without rendering, for reports streamed later"""
+        return self._report_metadata(self._prepare_report_data(data))
+    
+    def _report_metadata(self, report_data: Dict[str, Any]) -> Dict[str, Any]:
         return {
-            "report": report,
             "report_type": "markdown",
             "generated_at": datetime.now().isoformat(),
             "summary": self._generate_summary(report_data),
@@ -45,17 +189,10 @@ class ReportGenerationAgent(BaseSecuriSiteAgent):
         weather_context = data.get('weather_context', {})
         regulatory_analysis = data.get('regulatory_analysis', {})
         
-        # Extract risks by type
+        # Extract risks by type (views over risk_scores, not copies)
         risk_scores = cv_analysis.get('risk_scores', [])
-        
-        personnel_risks = []
-        structural_risks = []
-        
-        for risk in risk_scores:
-            if 'person' in risk.get('risk_type', '').lower():
-                personnel_risks.append(risk)
-            else:
-                structural_risks.append(risk)
+        personnel_risks = _RiskSelection(risk_scores, personnel=True)
+        structural_risks = _RiskSelection(risk_scores, personnel=False)
         
         # Get compliance info
         regulatory_results = regulatory_analysis.get('regulatory_analysis', [])
@@ -80,22 +217,131 @@ class ReportGenerationAgent(BaseSecuriSiteAgent):
             'immediate_recommendations': immediate_rec,
             'short_term_recommendations': short_rec,
             'medium_term_recommendations': medium_rec,
-            'next_inspection_date': regulatory_analysis.get('next_inspection_schedule', 'À déterminer')
+            'next_inspection_date': regulatory_analysis.get('next_inspection_schedule', 'À déterminer'),
+            'report_diff': self._report_diff(data, risk_scores, regulatory_analysis.get('compliance_score', 0))
         }
     
+    # ------------------------------------------------------------ day-over-day
+    
+    @staticmethod
+    def _risk_key(risk: Dict[str, Any]) -> str:
+        """Identity of a risk across days: its type and zone (same zones as RegulationAgent)"""
+        zone = re.sub(r'_\d+$', '', risk.get('area') or risk.get('location') or 'site')
+        return f"{risk.get('risk_type', 'unknown')}|{zone}"
+    
+    @staticmethod
+    def _report_date(data: Dict[str, Any]) -> str:
+        return str(data.get('report_date') or date.today().isoformat())
+    
+    def _report_diff(self, data: Dict[str, Any], risk_scores: Iterable[Dict[str, Any]],
+                     compliance_score: int) -> Optional[Dict[str, Any]]:
+        """New, resolved and persisting risks and compliance change since the previous report"""
+        site = data.get('site')
+        previous = self.history.previous(site, self._report_date(data)) if site is not None else None
+        if previous is None:
+            return None
+        previous_date, snapshot = previous
+        counts = Counter(self._risk_key(risk) for risk in risk_scores)
+        before = snapshot['risks']
+        
+        def entry(key: str, **counts_) -> Dict[str, Any]:
+            risk_type, zone = key.split('|', 1)
+            return {"risk_type": risk_type, "zone": zone, **counts_}
+        
+        return {
+            "previous_date": datetime.strptime(previous_date, '%Y-%m-%d').strftime('%d/%m/%Y'),
+            "previous_compliance_score": snapshot['compliance_score'],
+            "compliance_score": compliance_score,
+            "compliance_change": compliance_score - snapshot['compliance_score'],
+            "new_risks": [entry(key, count=count) for key, count in counts.items() if key not in before],
+            "resolved_risks": [entry(key, previous_count=count) for key, count in before.items() if key not in counts],
+            "persisting_risks": [entry(key, count=count, previous_count=before[key])
+                                 for key, count in counts.items() if key in before]
+        }
+    
+    def _remember(self, data: Dict[str, Any], report_data: Dict[str, Any]) -> None:
+        """Keep the risk counts and compliance of a site report for the next day's diff"""
+        site = data.get('site')
+        if site is None:
+            return
+        self.history.remember(site, self._report_date(data), {
+            "risks": dict(Counter(self._risk_key(risk) for risk in data.get('cv_analysis', {}).get('risk_scores', []))),
+            "compliance_score": report_data['compliance_score']
+        })
+    
+    # ------------------------------------------------------ section rendering
+    
+    def _section_digest(self, template: jinja2.Template, name: str, report_data: Dict[str, Any]) -> str:
+        """
+        Digest of a block's template and inputs; risk selections are hashed one
+        risk at a time as they are iterated, never copied into a list
+        """
+        try:
+            template_version = os.stat(template.filename).st_mtime_ns if template.filename else None
+        except OSError:
+            template_version = None
+        digest = hashlib.sha1()
+        
+        def feed(value: Any) -> None:
+            # One JSON document per line (json.dumps never emits a raw newline)
+            digest.update(json.dumps(value, sort_keys=True, default=str).encode('utf-8'))
+            digest.update(b'\n')
+        
+        feed([template.name, template_version, name])
+        for key in SECTION_INPUTS.get(name, sorted(report_data)):
+            value = report_data.get(key)
+            if isinstance(value, _RiskSelection):
+                feed([key, 'risks'])
+                for risk in value:
+                    feed(risk)
+                feed(None)
+            else:
+                feed([key, value])
+        return digest.hexdigest()
+    
+    def _iter_sections(self, template: jinja2.Template, report_data: Dict[str, Any],
+                       fragments: 'OrderedDict[Tuple[str, str], str]') -> Iterator[str]:
+        """
+        Report text from its top-level blocks, reusing the cached text of blocks
+        whose inputs are unchanged; rendered blocks are yielded as they render.
+        Templates without blocks render whole.
+        """
+        if not template.blocks:
+            yield from template.generate(**report_data)
+            return
+        context = template.new_context(report_data)
+        for name, render_block in template.blocks.items():
+            key = (name, self._section_digest(template, name, report_data))
+            text = fragments.get(key)
+            if text is not None:
+                fragments.move_to_end(key)
+                self.section_stats["reused"] += 1
+                yield text
+                continue
+            parts = []
+            for chunk in render_block(context):
+                parts.append(chunk)
+                yield chunk
+            fragments[key] = ''.join(parts)
+            if len(fragments) > FRAGMENT_CACHE_SIZE:
+                fragments.popitem(last=False)
+            self.section_stats["rendered"] += 1
+    
     async def _load_template(self) -> jinja2.Template:
         """Load the Jinja2 template for report generation"""
-        template_path = Path("src/securisite/templates/report_template.md")
+        return self._get_template()
+    
+    def _get_template(self) -> jinja2.Template:
         try:
-            with open(template_path, 'r', encoding='utf-8') as f:
-                template_content = f.read()
-            return self.template_env.from_string(template_content)
+            return self.template_env.get_template(REPORT_TEMPLATE)
         except Exception as e:
             self.log_error(f"Error loading template: {e}")
             return self._create_default_template()
     
     def _create_default_template(self) -> jinja2.Template:
         """Create a default template if file template is not found"""
+        if self._default_template is not None:
+            return self._default_template
         default_template = """# Rapport SecuriSite
 
 ## Résumé
@@ -115,7 +361,8 @@ class ReportGenerationAgent(BaseSecuriSiteAgent):
 
 Généré le: {{timestamp}}
 """
-        return self.template_env.from_string(default_template)
+        self._default_template = self.template_env.from_string(default_template)
+        return self._default_template
     
     def _generate_summary(self, report_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a machine-readable summary"""
@@ -125,11 +372,11 @@ Généré le: {{timestamp}}
             "compliance_score": report_data['compliance_score'],
             "critical_violations": len(report_data['critical_violations']),
             "immediate_actions": len(report_data['immediate_recommendations']),
-            "risk_categories": list(set([
-                r.get('risk_type', 'unknown') 
-                for r in report_data.get('personnel_risks', []) + 
-                report_data.get('structural_risks', [])
-            ]))
+            "risk_categories": list(set(
+                r.get('risk_type', 'unknown')
+                for risks in (report_data.get('personnel_risks', []), report_data.get('structural_risks', []))
+                for r in risks
+            ))
         }
     
     def _identify_actions(self, report_data: Dict[str, Any]) -> List[Dict[str, Any]]:
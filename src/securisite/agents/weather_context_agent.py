@@ -3,16 +3,23 @@ Weather Context Agent
 Correlates weather conditions with construction safety risks
 """
 
-import json
 import logging
-from typing import Dict, Any, List
-from pathlib import Path
+import os
+from datetime import datetime, time, timedelta
+from typing import Dict, Any, List, Optional, Sequence
+import numpy as np
+import pandas as pd
 from .base_agent import BaseSecuriSiteAgent
+from ..utils.weather_index import WeatherTimeIndex, Timestamp, parse_timestamp
+from ..utils.weather_windows import RiskWindow, merge_active_spans, observation_spans
+from ..utils.weather_sources import (
+    WeatherSource, FileWeatherSource, HttpWeatherSource, CachedWeatherSource
+)
 
 class WeatherContextAgent(BaseSecuriSiteAgent):
     """Agent correlating weather data with construction site safety"""
     
-    def __init__(self):
+    def __init__(self, source: Optional[WeatherSource] = None, cache_ttl_seconds: float = None):
         super().__init__("WeatherContextAgent")
         self.weather_risk_factors = {
             'high_wind': {'threshold': 25, 'risk_multiplier': 1.5, 'affects': ['crane', 'scaffolding']},
@@ -21,21 +28,51 @@ class WeatherContextAgent(BaseSecuriSiteAgent):
             'extreme_heat': {'threshold': 35, 'risk_multiplier': 1.3, 'affects': ['fatigue', 'ppe']},
             'cold': {'threshold': 5, 'risk_multiplier': 1.2, 'affects': ['manual_dexterity', 'ppe']}
         }
+        self.default_weather = {
+            'temperature': 25,
+            'humidity': 60,
+            'wind_speed': 10,
+            'visibility': 8000,
+            'precipitation': 0,
+            'uv_index': 7,
+            'air_quality_index': 50
+        }
+        
+        # Weather source: live provider when WEATHER_API_URL is set, else assets/weather_info.json
+        if source is None:
+            api_url = os.getenv("WEATHER_API_URL")
+            if api_url:
+                source = HttpWeatherSource(api_url, api_key=os.getenv("WEATHER_API_KEY"))
+            else:
+                source = FileWeatherSource()
+        if cache_ttl_seconds is None:
+            cache_ttl_seconds = float(os.getenv("WEATHER_CACHE_TTL_SECONDS", "900"))
+        self.weather_source = source
+        self.weather_cache = CachedWeatherSource(source, ttl_seconds=cache_ttl_seconds)
+        
+        # Index of weather dicts passed in directly (not coming from the source)
+        self._adhoc_data: Optional[Dict[str, Any]] = None
+        self._adhoc_index: Optional[WeatherTimeIndex] = None
     
     async def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Process weather data against construction schedule and risks"""
         self.log_info("Analyzing weather context for construction risks")
         
         image_timestamp = data.get('timestamp')
-        weather_data = await self._load_weather_data()
+        relevant_weather = None
+        if image_timestamp:
+            try:
+                relevant_weather = await self.weather_cache.get(parse_timestamp(image_timestamp))
+            except Exception as e:
+                self.log_error(f"Error fetching weather for {image_timestamp}: {e}")
         
-        if not image_timestamp or not weather_data:
+        if not image_timestamp or not relevant_weather:
             return {"error": "Missing required data for weather analysis"}
         
-        relevant_weather = self._get_weather_for_time(image_timestamp, weather_data)
         risk_context = self._assess_weather_risks(relevant_weather)
         
         return {
+            "timestamp": image_timestamp,
             "weather_conditions": relevant_weather,
             "risk_modifiers": risk_context,
             "recommendations": self._generate_weather_recommendations(risk_context),
@@ -43,32 +80,72 @@ class WeatherContextAgent(BaseSecuriSiteAgent):
         }
     
     async def _load_weather_data(self) -> Dict[str, Any]:
-        """Load weather data from JSON files"""
-        weather_file = Path("assets/weather_info.json")
+        """Load weather data from JSON files (empty for non-file sources)"""
+        if not isinstance(self.weather_source, FileWeatherSource):
+            return {}
         try:
-            with open(weather_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return self.weather_source.load()
         except Exception as e:
             self.log_error(f"Error loading weather data: {e}")
             return {}
     
-    def _get_weather_for_time(self, timestamp: str, weather_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Find weather data for specific timestamp"""
-        # For now, return latest weather data as placeholder
-        if 'weather_by_date' in weather_data:
-            if weather_data['weather_by_date']:
-                latest_date = max(weather_data['weather_by_date'].keys())
-                return weather_data['weather_by_date'][latest_date]
-        
-        return {
-            'temperature': 25,
-            'humidity': 60,
-            'wind_speed': 10,
-            'visibility': 8000,
-            'precipitation': 0,
-            'uv_index': 7,
-            'air_quality_index': 50
-        }
+    def _index_for(self, weather_data: Dict[str, Any]) -> WeatherTimeIndex:
+        """Time index of weather_data, reusing the file source's index when it matches"""
+        source = self.weather_source
+        if isinstance(source, FileWeatherSource) and weather_data is source.data:
+            return source.index
+        if weather_data is not self._adhoc_data or self._adhoc_index is None:
+            self._adhoc_data = weather_data
+            self._adhoc_index = WeatherTimeIndex.from_weather_data(weather_data)
+        return self._adhoc_index
+    
+    def _get_weather_for_time(self, timestamp: Timestamp, weather_data: Dict[str, Any],
+                              interpolate: bool = False) -> Dict[str, Any]:
+        """Find weather data for specific timestamp (nearest hourly observation)"""
+        try:
+            weather = self._index_for(weather_data).lookup(timestamp, interpolate)
+        except ValueError as e:
+            self.log_error(f"Unparseable timestamp {timestamp!r}: {e}")
+            weather = None
+        return weather if weather is not None else dict(self.default_weather)
+    
+    def hourly_weather_table(self, weather_data: Dict[str, Any]) -> Dict[str, List[Optional[Dict[str, Any]]]]:
+        """
+        Observation in effect at each hour (0-23) of the days some observation
+        covers; None for hours no observation is close enough to. Days without
+        any covered hour are left out. Entries are the index's own observation
+        dicts, shared rather than copied.
+        """
+        index = self._index_for(weather_data)
+        days = set()
+        for start, end in index.coverage:
+            day = start.date()
+            while datetime.combine(day, time()) < end:
+                days.add(day)
+                day += timedelta(days=1)
+        table = {}
+        for day in sorted(days):
+            start = datetime.combine(day, time())
+            hours = index.lookup_many([start + timedelta(hours=h) for h in range(24)])
+            if any(hours):
+                table[day.isoformat()] = hours
+        return table
+    
+    async def get_weather_for_times(self, timestamps: Sequence[Timestamp],
+                                    interpolate: bool = False) -> List[Dict[str, Any]]:
+        """Batch lookup of the weather for many image timestamps in one pass"""
+        parsed = [parse_timestamp(ts) for ts in timestamps]
+        if interpolate:
+            weather_data = await self._load_weather_data()
+            results = self._index_for(weather_data).lookup_many(parsed, interpolate=True)
+        else:
+            try:
+                results = await self.weather_cache.get_many(parsed)
+            except Exception as e:
+                self.log_error(f"Error fetching weather batch: {e}")
+                results = [None] * len(parsed)
+        return [weather if weather is not None else dict(self.default_weather)
+                for weather in results]
     
     def _assess_weather_risks(self, weather: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Assess weather-based risk factors"""
@@ -123,6 +200,158 @@ class WeatherContextAgent(BaseSecuriSiteAgent):
         
         return risks
     
+    # Order and inputs of the factors, as evaluated by _assess_weather_risks
+    _BATCH_FACTORS = ('high_wind', 'heavy_rain', 'low_visibility', 'extreme_heat', 'cold')
+    _BATCH_DEFAULTS = {'wind_speed': 0, 'precipitation': 0, 'visibility': 10000, 'temperature': 20}
+    
+    def join_weather(self, timestamps: Sequence[Timestamp], weather_data: Dict[str, Any]) -> pd.DataFrame:
+        """
+        As-of join of image timestamps (snapped to the hour) to the nearest weather
+        observation, with the index's own rules (same results as lookup()): the
+        closest of the observations just before and from the hour on that covers
+        it, ties to the earlier one. Rows keep the input order; without a
+        covering observation, 'weather_time' is NaT and the default weather is used.
+        """
+        images = pd.DataFrame({
+            'timestamp': pd.to_datetime([parse_timestamp(ts) for ts in timestamps])
+        })
+        # Same rule as round_to_hour: half past snaps up (Series.dt.round rounds half to even)
+        images['hour'] = (images['timestamp'] + pd.Timedelta(minutes=30)).dt.floor('h')
+        index = self._index_for(weather_data)
+        if not len(index) or images.empty:
+            frame = images.assign(weather_time=pd.NaT, **self.default_weather)
+            return frame.drop(columns='hour')
+        
+        series = pd.DataFrame({
+            'position': np.arange(len(index)),
+            'weather_time': pd.to_datetime(index.times),
+            'start': pd.to_datetime([start for start, _ in index.coverage]),
+            'end': pd.to_datetime([end for _, end in index.coverage])
+        })
+        ordered = images.reset_index().sort_values('hour', kind='stable')
+        # Candidates of _nearest_position: last observation before the hour, first one from it
+        before = pd.merge_asof(ordered, series, left_on='hour', right_on='weather_time',
+                               direction='backward', allow_exact_matches=False)
+        after = pd.merge_asof(ordered, series, left_on='hour', right_on='weather_time', direction='forward')
+        hour = before['hour']
+        covered_before = (before['start'] <= hour) & (hour < before['end'])
+        covered_after = (after['start'] <= hour) & (hour < after['end'])
+        take_before = covered_before & (~covered_after | (hour - before['weather_time'] <= after['weather_time'] - hour))
+        chosen = np.where(take_before, before['position'].fillna(-1),
+                          np.where(covered_after, after['position'].fillna(-1), -1)).astype(int)
+        positions = np.empty(len(images), dtype=int)
+        positions[ordered['index'].to_numpy()] = chosen
+        
+        # Last row: the default weather, for hours no observation covers
+        table = pd.DataFrame(index.observations + [self.default_weather])
+        table['weather_time'] = pd.to_datetime(list(index.times) + [None])
+        rows = table.iloc[np.where(positions < 0, len(index), positions)].reset_index(drop=True)
+        rows.insert(0, 'timestamp', images['timestamp'])
+        return rows
+    
+    def assess_weather_frame(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Vectorized _assess_weather_risks: adds <factor>_severity (0 when inactive),
+        risk_multiplier (product over active factors) and max_severity columns.
+        """
+        factors = self.weather_risk_factors
+        values = {
+            column: pd.to_numeric(frame[column], errors='coerce').fillna(default).to_numpy(dtype=float)
+            if column in frame else np.full(len(frame), float(default))
+            for column, default in self._BATCH_DEFAULTS.items()
+        }
+        wind, rain = values['wind_speed'], values['precipitation']
+        visibility, temperature = values['visibility'], values['temperature']
+        
+        with np.errstate(divide='ignore'):
+            low_visibility_severity = np.minimum(np.floor(1000 / visibility * 10), 10)
+        heat = temperature > factors['extreme_heat']['threshold']
+        active = {
+            'high_wind': wind > factors['high_wind']['threshold'],
+            'heavy_rain': rain > factors['heavy_rain']['threshold'],
+            'low_visibility': visibility < factors['low_visibility']['threshold'],
+            'extreme_heat': heat,
+            'cold': ~heat & (temperature < factors['cold']['threshold']),
+        }
+        severity = {
+            'high_wind': np.minimum(np.floor(wind / 5), 10),
+            'heavy_rain': np.minimum(np.floor(rain * 2), 10),
+            'low_visibility': low_visibility_severity,
+            'extreme_heat': np.minimum(np.floor((temperature - 35) * 2), 10),
+            'cold': np.minimum(np.floor((5 - temperature) * 2), 10),
+        }
+        
+        result = frame.copy()
+        multiplier = np.ones(len(frame))
+        max_severity = np.zeros(len(frame))
+        for factor in self._BATCH_FACTORS:
+            factor_severity = np.where(active[factor], severity[factor], 0)
+            result[f'{factor}_severity'] = factor_severity.astype(int)
+            multiplier *= np.where(active[factor], factors[factor]['risk_multiplier'], 1.0)
+            max_severity = np.maximum(max_severity, factor_severity)
+        result['risk_multiplier'] = multiplier.round(3)
+        result['max_severity'] = max_severity.astype(int)
+        return result
+    
+    def compute_risk_windows(self, weather_data: Dict[str, Any], site: str) -> List[RiskWindow]:
+        """
+        Walk the weather series once and return the contiguous periods during
+        which each risk factor is active, with their peak severity
+        """
+        index = self._index_for(weather_data)
+        if not len(index):
+            return []
+        assessed = self.assess_weather_frame(pd.DataFrame(index.observations))
+        spans = observation_spans(index.times, index.coverage)
+        windows = []
+        for factor in self._BATCH_FACTORS:
+            windows.extend(merge_active_spans(
+                site, factor, spans, assessed[f'{factor}_severity'].tolist(),
+                self.weather_risk_factors[factor]['risk_multiplier']
+            ))
+        self.log_info(f"{len(windows)} weather risk windows computed for {site}")
+        return windows
+    
+    def _frame_to_contexts(self, frame: pd.DataFrame) -> List[Dict[str, Any]]:
+        """Per-image weather context in the same shape as process()"""
+        weather_columns = [c for c in frame.columns
+                           if c not in ('timestamp', 'weather_time', 'risk_multiplier', 'max_severity')
+                           and not c.endswith('_severity')]
+        contexts = []
+        for row in frame.to_dict('records'):
+            risk_modifiers = [
+                {
+                    "weather_factor": factor,
+                    "severity": int(row[f'{factor}_severity']),
+                    "affected_equipment": self.weather_risk_factors[factor]['affects'],
+                    "risk_multiplier": self.weather_risk_factors[factor]['risk_multiplier']
+                }
+                for factor in self._BATCH_FACTORS if row[f'{factor}_severity'] > 0
+            ]
+            contexts.append({
+                "timestamp": row['timestamp'].isoformat(),
+                # Plain Python scalars so contexts stay JSON serializable
+                "weather_conditions": {c: getattr(row[c], 'item', lambda: row[c])()
+                                       for c in weather_columns if not pd.isna(row[c])},
+                "risk_modifiers": risk_modifiers,
+                "risk_multiplier": float(row['risk_multiplier']),
+                "max_severity": int(row['max_severity'])
+            })
+        return contexts
+    
+    async def process_batch(self, timestamps: Sequence[Timestamp]) -> List[Dict[str, Any]]:
+        """Weather context for many images (e.g. a whole site history) in one pass"""
+        self.log_info(f"Analyzing weather context for {len(timestamps)} images")
+        weather_data = await self._load_weather_data()
+        if weather_data:
+            frame = self.join_weather(timestamps, weather_data)
+        else:
+            # Non-file sources: one cached fetch per distinct hour, then the same vectorized pass
+            conditions = await self.get_weather_for_times(timestamps)
+            frame = pd.DataFrame(conditions)
+            frame['timestamp'] = pd.to_datetime([parse_timestamp(ts) for ts in timestamps])
+        return self._frame_to_contexts(self.assess_weather_frame(frame))
+    
     def _generate_weather_recommendations(self, risk_context: List[Dict[str, Any]]) -> List[str]:
         """Generate weather-related safety recommendations"""
         recommendations = []
@@ -0,0 +1,247 @@
+"""
+Batch report generation for SecuriSite-IA
+One Markdown report per (site, camera, day), rendered in parallel worker
+processes and listed in an index file. Reruns skip the partitions whose
+inputs (detections, weather, template, knowledge base) have not changed.
+
+Usage:
+    python -m securisite.batch_reports --output reports [--camera EST-1]
+        [--start 2025-06-10] [--end 2025-06-30] [--workers 4] [--force]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .agents.report_agent import REPORT_TEMPLATE, TEMPLATES_DIR
+from .agents.weather_context_agent import WeatherContextAgent
+from .orchestrator import SecuriSiteOrchestrator
+from .utils.data_loader import SecuriSiteDataLoader
+from .utils.regulation_kb import load_knowledge_base
+from .utils.weather_sources import FileWeatherSource
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
+INDEX_NAME = "index.json"
+INDEX_FORMAT_VERSION = 1
+
+
+class Partition(NamedTuple):
+    """Images of one camera on one day, with their detections and weather"""
+    site: str
+    camera: str
+    date: str
+    records: List[Dict[str, Any]]
+    weather: List[Dict[str, Any]]
+
+    @property
+    def key(self) -> str:
+        return f"{self.site}/{self.camera}/{self.date}"
+
+    @property
+    def report_name(self) -> str:
+        return f"{self.site}/{self.camera}/{self.date}.md"
+
+
+def collect_partitions(loader: SecuriSiteDataLoader, site: str, weather_agent: WeatherContextAgent,
+                       cameras: Optional[Iterable[str]] = None, start_date: Optional[str] = None,
+                       end_date: Optional[str] = None) -> List[Partition]:
+    """Split the dataset by (camera, day); weather is joined in one pass over all images"""
+    images = []
+    for camera in cameras or loader.cameras:
+        try:
+            images.extend(loader.iter_images(camera=camera, start_date=start_date, end_date=end_date))
+        except FileNotFoundError as e:
+            print(f"⚠️  Caméra {camera} ignorée: {e}")
+    if not images:
+        return []
+
+    try:
+        weather = asyncio.run(weather_agent.process_batch([image.timestamp for image in images]))
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Météo indisponible, rapports sans contexte météo: {e}")
+        weather = [{} for _ in images]
+    grouped: Dict[Tuple[str, str], Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]] = {}
+    for image, context in zip(images, weather):
+        records, contexts = grouped.setdefault((image.camera, image.date_str), ([], []))
+        records.append({
+            "photo_id": image.image_id,
+            "filename": image.filename,
+            "image_shooting": image.timestamp.strftime('%Y:%m:%d %H:%M:%S'),
+            "detections": image.detections
+        })
+        contexts.append(context)
+    return [Partition(site, camera, date, records, contexts)
+            for (camera, date), (records, contexts) in sorted(grouped.items())]
+
+
+def _template_signature() -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(TEMPLATES_DIR / REPORT_TEMPLATE)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def input_hash(partition: Partition, template_signature: Optional[Tuple[int, int]], kb_version: str) -> str:
+    """Hash of everything a partition's report is rendered from"""
+    payload = json.dumps([INDEX_FORMAT_VERSION, template_signature, kb_version,
+                          partition.records, partition.weather], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def load_index(output_dir: Path) -> Dict[str, Any]:
+    """Index of an earlier run (empty if missing, unreadable or of another format)"""
+    try:
+        with open(Path(output_dir) / INDEX_NAME, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('version') == INDEX_FORMAT_VERSION:
+            return index
+    except (OSError, ValueError):
+        pass
+    return {"version": INDEX_FORMAT_VERSION, "partitions": {}}
+
+
+def write_index(output_dir: Path, index: Dict[str, Any]) -> Path:
+    """Atomically write the index, partitions sorted by key"""
+    index_path = Path(output_dir) / INDEX_NAME
+    tmp_path = index_path.with_suffix('.json.tmp')
+    index = dict(index, partitions=dict(sorted(index['partitions'].items())))
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+# One orchestrator per worker process, reused for all its partitions
+_worker_orchestrator: Optional[SecuriSiteOrchestrator] = None
+
+
+def render_partition(partition: Partition, report_path: str) -> Dict[str, Any]:
+    """Analyze one partition and stream its report to report_path (runs in a worker)"""
+    global _worker_orchestrator
+    if _worker_orchestrator is None:
+        _worker_orchestrator = SecuriSiteOrchestrator()
+    orchestrator = _worker_orchestrator
+
+    analysis = asyncio.run(orchestrator.analyze_image_batch(
+        partition.records, partition.weather, site=partition.site, camera=partition.camera))
+
+    report_path = Path(report_path)
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = report_path.with_suffix('.md.tmp')
+    metadata = orchestrator.report_agent.write_report(analysis, tmp_path)
+    os.replace(tmp_path, report_path)
+
+    regulatory = analysis['regulatory_analysis']
+    return {
+        "images": len(partition.records),
+        "risks": len(analysis['cv_analysis']['risk_scores']),
+        "compliance_score": regulatory['compliance_score'],
+        "critical_violations": len(regulatory['critical_violations']),
+        "generated_at": metadata['generated_at']
+    }
+
+
+def run_batch(output_dir: Path, partitions: List[Partition], workers: Optional[int] = None,
+              force: bool = False) -> Dict[str, Any]:
+    """
+    Render the reports of the partitions whose inputs changed since the last run
+    (all of them with force). The index is rewritten after each report, so an
+    interrupted run resumes where it stopped. workers=1 renders in-process.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    index = load_index(output_dir)
+    entries = index['partitions']
+    template_signature = _template_signature()
+    kb_version = load_knowledge_base().version
+
+    pending = []
+    for partition in partitions:
+        digest = input_hash(partition, template_signature, kb_version)
+        entry = entries.get(partition.key)
+        if (not force and entry is not None and entry.get('input_hash') == digest
+                and (output_dir / entry['report']).exists()):
+            continue
+        pending.append((partition, digest))
+
+    def record(partition: Partition, digest: str, result: Dict[str, Any]) -> None:
+        entries[partition.key] = {
+            "site": partition.site,
+            "camera": partition.camera,
+            "date": partition.date,
+            "report": partition.report_name,
+            "input_hash": digest,
+            **result
+        }
+        write_index(output_dir, index)
+
+    failed = []
+    if workers == 1:
+        for partition, digest in pending:
+            try:
+                record(partition, digest, render_partition(partition, str(output_dir / partition.report_name)))
+            except Exception as e:
+                print(f"❌ {partition.key}: {e}")
+                failed.append(partition.key)
+    elif pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(render_partition, partition, str(output_dir / partition.report_name)): (partition, digest)
+                for partition, digest in pending
+            }
+            for future in as_completed(futures):
+                partition, digest = futures[future]
+                try:
+                    record(partition, digest, future.result())
+                except Exception as e:
+                    print(f"❌ {partition.key}: {e}")
+                    failed.append(partition.key)
+
+    index_path = write_index(output_dir, index)
+    return {
+        "rendered": len(pending) - len(failed),
+        "skipped": len(partitions) - len(pending),
+        "failed": failed,
+        "index": str(index_path)
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rapports SecuriSite par site, caméra et jour")
+    parser.add_argument('--output', default='reports', help="Dossier des rapports et de l'index")
+    parser.add_argument('--site', default=os.getenv('SECURISITE_SITE', 'chantier'))
+    parser.add_argument('--camera', action='append', help="Caméra à traiter (répétable, défaut: toutes)")
+    parser.add_argument('--start', help="Premier jour (YYYY-MM-DD)")
+    parser.add_argument('--end', help="Dernier jour inclus (YYYY-MM-DD)")
+    parser.add_argument('--workers', type=int, default=None, help="Processus de rendu (défaut: un par cœur)")
+    parser.add_argument('--force', action='store_true', help="Régénérer même les rapports à jour")
+    args = parser.parse_args(argv)
+
+    loader = SecuriSiteDataLoader(project_root=PROJECT_ROOT)
+    weather_agent = WeatherContextAgent(source=FileWeatherSource(loader.assets_dir / "weather_info.json"))
+
+    started = datetime.now()
+    print(f"🚀 Génération des rapports {args.site} → {args.output}")
+    partitions = collect_partitions(loader, args.site, weather_agent, cameras=args.camera,
+                                    start_date=args.start, end_date=args.end)
+    print(f"📂 {len(partitions)} partition(s) (caméra × jour)")
+    summary = run_batch(Path(args.output), partitions, workers=args.workers, force=args.force)
+
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"✅ {summary['rendered']} rapport(s) générés, {summary['skipped']} à jour ({elapsed:.1f}s)")
+    if summary['failed']:
+        print(f"❌ {len(summary['failed'])} échec(s): {', '.join(summary['failed'])}")
+    print(f"📋 Index: {summary['index']}")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,10 +5,11 @@ Main orchestrator for SecuriSite-IA multi-agent system
 import asyncio
 import json
 import logging
+import os
 from datetime import datetime
 from pathlib import Path
 import sys
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 # Import agents
 from securisite.agents.cv_risk_detector import ComputerVisionRiskDetector
@@ -33,9 +34,12 @@ class SecuriSiteOrchestrator:
         self.report_agent = ReportGenerationAgent()
         self.evaluator = PerformanceEvaluator()
     
-    async def analyze_site_risks(self, image_id: str = None) -> Dict[str, Any]:
+    async def analyze_site_risks(self, image_id: str = None, render_report: bool = True,
+                                 site: Optional[str] = None) -> Dict[str, Any]:
         """
         Complete multi-agent risk analysis for construction site
+        (render_report=False: report text left to save_report, which streams it).
+        With a site, the report is compared with the site's previous day.
         """
         self.logger.info("Starting comprehensive site risk analysis")
         
@@ -49,7 +53,7 @@ class SecuriSiteOrchestrator:
         regulatory_result = await self._run_regulatory_analysis(cv_result, weather_result)
         
         # Step 4: Generate Report
-        report_result = await self._generate_report(cv_result, weather_result, regulatory_result)
+        report_result = await self._generate_report(cv_result, weather_result, regulatory_result, render_report, site)
         
         # Step 5: Performance Evaluation
         evaluation_result = await self._evaluate_performance(report_result)
@@ -59,6 +63,7 @@ class SecuriSiteOrchestrator:
                 "cv_analysis": cv_result,
                 "weather_context": weather_result,
                 "regulatory_analysis": regulatory_result,
+                "site": site,
                 "report": report_result,
                 "performance_evaluation": evaluation_result
             },
@@ -85,19 +90,58 @@ class SecuriSiteOrchestrator:
         """Run regulatory compliance analysis"""
         data = {
             "risks": cv_result.get('risk_scores', []),
-            "weather_conditions": weather_result.get('weather_conditions', {})
+            "weather_conditions": weather_result.get('weather_conditions', {}),
+            "timestamp": weather_result.get('timestamp')
         }
         return await self.regulation_agent.process(data)
     
-    async def _generate_report(self, cv_result: Dict[str, Any], weather_result: Dict[str, Any], regulatory_result: Dict[str, Any]) -> Dict[str, Any]:
+    async def _generate_report(self, cv_result: Dict[str, Any], weather_result: Dict[str, Any], regulatory_result: Dict[str, Any],
+                               render_report: bool = True, site: Optional[str] = None) -> Dict[str, Any]:
         """Generate comprehensive report"""
         data = {
             "cv_analysis": cv_result,
             "weather_context": weather_result,
-            "regulatory_analysis": regulatory_result
+            "regulatory_analysis": regulatory_result,
+            "site": site
         }
+        if not render_report:
+            return self.report_agent.summarize(data)
         return await self.report_agent.process(data)
     
+    async def analyze_image_batch(self, records: List[Dict[str, Any]], weather_contexts: List[Dict[str, Any]],
+                                  site: Optional[str] = None, camera: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Agent results for many images at once (e.g. one camera-day), from their
+        detection records and precomputed weather contexts; the result has the
+        shape of the "analysis" part of analyze_site_risks, minus the report
+        """
+        image_analysis = {}
+        risk_scores = []
+        batch = []
+        for record, weather in zip(records, weather_contexts):
+            analysis = self.cv_agent._analyze_image(record)
+            scores = [
+                dict(score.dict(), image_id=analysis.image_id, timestamp=analysis.timestamp)
+                for score in self.cv_agent._calculate_risk_scores(analysis)
+            ]
+            image_analysis[analysis.image_id] = analysis.dict()
+            risk_scores.extend(scores)
+            batch.append({
+                "risks": scores,
+                "timestamp": analysis.timestamp,
+                "weather_conditions": weather.get('weather_conditions', {}),
+                "site": site,
+                "camera": camera
+            })
+        regulatory_result = await self.regulation_agent.process_site(batch)
+        # The report shows the worst weather of the batch
+        weather_result = max(weather_contexts, key=lambda context: context.get('max_severity', 0), default={})
+        return {
+            "cv_analysis": {"image_analysis": image_analysis, "risk_scores": risk_scores},
+            "weather_context": weather_result,
+            "regulatory_analysis": regulatory_result
+        }
+    
     async def _evaluate_performance(self, report_result: Dict[str, Any]) -> Dict[str, Any]:
         """Evaluate system performance"""
         data = {
@@ -108,13 +152,22 @@ class SecuriSiteOrchestrator:
         return await self.evaluator.evaluate(data)
     
     def save_report(self, results: Dict[str, Any], filename: str = None) -> str:
-        """Save the generated report to file"""
+        """
+        Save the report to file: the text rendered by analyze_site_risks if
+        any, otherwise streamed from the agent results chunk by chunk so that
+        memory stays flat however many risks the report covers
+        """
         if filename is None:
             filename = f"securisite_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
         
         report_path = Path(filename)
-        with open(report_path, 'w', encoding='utf-8') as f:
-            f.write(results['analysis']['report']['report'])
+        analysis = results['analysis']
+        report_text = analysis.get('report', {}).get('report')
+        if report_text is not None:
+            with open(report_path, 'w', encoding='utf-8') as f:
+                f.write(report_text)
+        else:
+            self.report_agent.write_report(analysis, report_path)
         
         self.logger.info(f"Report saved to {report_path}")
         return str(report_path)
@@ -136,7 +189,8 @@ async def main():
     print("🚀 Démarrage du système SecuriSite-IA...")
     
     # Run complete analysis
-    results = await orchestrator.analyze_site_risks()
+    # The report is streamed to its file by save_report, not rendered here
+    results = await orchestrator.analyze_site_risks(render_report=False, site=os.getenv('SECURISITE_SITE', 'chantier'))
     
     # Display summary
     print("\n📊 Résumé Analyse:")
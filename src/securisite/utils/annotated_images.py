@@ -0,0 +1,169 @@
+"""
+Annotated images for SecuriSite-IA
+Draws risk annotations (circles and boxes in normalized coordinates, as
+built by the web app) onto camera images, in several sizes, and keeps the
+rendered JPEGs in a content-addressed disk cache with LRU eviction
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from PIL import Image, ImageDraw
+
+logger = logging.getLogger(__name__)
+
+# Stroke width at 1000px on the shorter side, scaled with the image
+LINE_WIDTH = 3
+
+# Maximum width of each rendition (None: original size)
+RENDITIONS = {"thumbnail": 320, "tablet": 1280, "full": None}
+JPEG_QUALITY = {"thumbnail": 70, "tablet": 80, "full": 90}
+# Bump when drawing changes, so that cached renderings are not reused
+RENDER_VERSION = 1
+
+
+def draw_annotations(image: Image.Image, annotations: Iterable[Dict[str, Any]]) -> Image.Image:
+    """RGB copy of image with the annotations drawn on it"""
+    annotated = image.convert('RGB')
+    width, height = annotated.size
+    line_width = max(1, round(LINE_WIDTH * min(width, height) / 1000))
+    draw = ImageDraw.Draw(annotated)
+    for annotation in annotations:
+        color = annotation.get('color', '#D32F2F')
+        if annotation.get('type') == 'circle':
+            x, y = annotation['x'] * width, annotation['y'] * height
+            radius = annotation['radius'] * min(width, height)
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius), outline=color, width=line_width)
+        elif annotation.get('type') == 'box':
+            x1, x2 = sorted((annotation['x1'] * width, annotation['x2'] * width))
+            y1, y2 = sorted((annotation['y1'] * height, annotation['y2'] * height))
+            draw.rectangle((x1, y1, x2, y2), outline=color, width=line_width)
+    return annotated
+
+
+def annotate_image(image_path: Path, annotations: Iterable[Dict[str, Any]]) -> Image.Image:
+    """Camera image from disk with its risk annotations drawn"""
+    with Image.open(image_path) as image:
+        return draw_annotations(image, annotations)
+
+
+def render_rendition(image_path: Path, annotations: Iterable[Dict[str, Any]], size: str) -> bytes:
+    """JPEG bytes of the annotated image, downscaled to a RENDITIONS size"""
+    max_width = RENDITIONS[size]
+    with Image.open(image_path) as image:
+        if max_width and image.width > max_width:
+            # JPEG: decode at the smallest power-of-two scale still above the target
+            image.draft('RGB', (max_width, max_width * image.height // image.width))
+        if max_width and image.width > max_width:
+            image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+        annotated = draw_annotations(image, annotations)
+    buffer = io.BytesIO()
+    annotated.save(buffer, format='JPEG', quality=JPEG_QUALITY[size], optimize=True)
+    return buffer.getvalue()
+
+
+def rendition_key(image_path: Path, annotations: Iterable[Dict[str, Any]], size: str) -> Optional[str]:
+    """
+    Content address of a rendering: image file (name, size, mtime), annotations
+    and size. None if the image does not exist.
+    """
+    try:
+        stat = os.stat(image_path)
+    except OSError:
+        return None
+    payload = json.dumps([RENDER_VERSION, Path(image_path).name, stat.st_size, stat.st_mtime_ns,
+                          list(annotations), size], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AnnotatedImageCache:
+    """
+    Rendered images on disk under their content address. The least recently
+    served files are deleted once the cache grows past max_bytes; recency
+    survives restarts through the files' mtime.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, int]' = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._scan()
+
+    def _scan(self) -> None:
+        """Rebuild the LRU order of the files already in the cache folder"""
+        if not self.cache_dir.is_dir():
+            return
+        files = []
+        for path in self.cache_dir.glob('*.jpg'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime_ns, path.stem, stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total += size
+
+    def path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.jpg"
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def get(self, image_path: Path, annotations: List[Dict[str, Any]], size: str) -> Optional[Path]:
+        """Path of the cached rendering, rendered first on a miss; None if the image is missing"""
+        if size not in RENDITIONS:
+            raise ValueError(f"Unknown image size {size}")
+        key = rendition_key(image_path, annotations, size)
+        if key is None:
+            return None
+        path = self.path(key)
+        with self._lock:
+            if key in self._entries and path.exists():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                return path
+
+        # Rendered outside the lock: concurrent misses of one key write the same bytes
+        data = render_rendition(image_path, annotations, size)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{key}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.stats["misses"] += 1
+            self._total += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict(keep=key)
+        return path
+
+    def _evict(self, keep: str) -> None:
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            key, size = next(iter(self._entries.items()))
+            if key == keep:
+                break
+            del self._entries[key]
+            self._total -= size
+            self.stats["evictions"] += 1
+            try:
+                self.path(key).unlink()
+            except OSError as e:
+                logger.warning(f"Could not evict cached image {key}: {e}")
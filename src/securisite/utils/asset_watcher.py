@@ -0,0 +1,188 @@
+"""
+Polling watcher for incremental ingestion of new camera images
+Detects changes with stat/mtime only and hands new or modified image
+records (and the names of removed ones) to callbacks, without reloading
+the whole dataset
+"""
+
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Any, Mapping, Optional, Set, Tuple
+
+from .data_preprocessing import iter_export_records
+from .image_manifest import AssetsManifest, CAMERAS
+
+logger = logging.getLogger(__name__)
+
+ImageRecords = Dict[str, Dict[str, Any]]
+
+
+class AssetsWatcher:
+    """Watches the assets directory and camera JSON files for new image records"""
+
+    def __init__(self, assets_dir: Path, images: Mapping[str, Dict[str, Any]],
+                 on_change: Callable[[ImageRecords, Dict[str, str]], None],
+                 manifest: Optional[AssetsManifest] = None,
+                 interval: float = 60.0,
+                 on_remove: Optional[Callable[[Set[str]], None]] = None):
+        """
+        images is the live mapping of already ingested records (filename -> record);
+        it is only read, to decide which parsed records are new or changed.
+        on_change receives the changed records and the camera of each one
+        (filename -> camera of the images_<camera>.json it was read from);
+        on_remove receives the ingested filenames no export lists any more.
+        Cameras of new exports are added to manifest.
+        """
+        self.assets_dir = Path(assets_dir)
+        self.images = images
+        self.on_change = on_change
+        self.on_remove = on_remove
+        self.manifest = manifest
+        self.interval = interval
+
+        self._metadata_files: Set[Path] = {
+            self.assets_dir / f"images_{camera}.json" for camera in CAMERAS
+        }
+        self._signatures: Dict[Path, Optional[Tuple[int, int]]] = {}
+        # Filenames listed by each export at its current signature, read when first needed
+        self._export_names: Dict[Path, Set[str]] = {}
+        # Other files (e.g. weather_info.json), with the callback run when they change
+        self._watched_files: Dict[Path, Callable[[], None]] = {}
+        self._dir_mtime_ns: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Current files are assumed to be already ingested by the caller
+        self._discover_metadata_files()
+        for path in self._metadata_files:
+            self._signatures[path] = self._signature(path)
+
+    @staticmethod
+    def _signature(path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _discover_metadata_files(self) -> None:
+        """Pick up new images_<camera>.json files when the assets directory changes"""
+        try:
+            dir_mtime_ns = os.stat(self.assets_dir).st_mtime_ns
+        except OSError:
+            return
+        if dir_mtime_ns == self._dir_mtime_ns:
+            return
+        self._dir_mtime_ns = dir_mtime_ns
+        with os.scandir(self.assets_dir) as it:
+            for entry in it:
+                if entry.name.startswith('images_') and entry.name.endswith('.json'):
+                    self._metadata_files.add(Path(entry.path))
+        if self.manifest is not None:
+            for path in self._metadata_files:
+                # Registers new cameras so that their images can be located
+                self.manifest.camera(path.stem[len('images_'):])
+
+    def watch_file(self, path: Path, on_change: Callable[[], None]) -> None:
+        """
+        Also watch path: on_change is called after a pass that finds it modified,
+        created or deleted (its current content is assumed loaded by the caller)
+        """
+        path = Path(path)
+        self._watched_files[path] = on_change
+        self._signatures[path] = self._signature(path)
+
+    def poll(self) -> ImageRecords:
+        """Run one polling pass and return the records handed to on_change"""
+        self._discover_metadata_files()
+        if self.manifest is not None:
+            self.manifest.refresh()
+
+        changed: ImageRecords = {}
+        cameras: Dict[str, str] = {}
+        exports_changed = skipped = False
+        for path in sorted(self._metadata_files):
+            signature = self._signature(path)
+            if signature == self._signatures.get(path):
+                continue
+            if signature is None:
+                # Export deleted: none of its records is listed any more
+                self._signatures[path] = None
+                self._export_names[path] = set()
+                exports_changed = True
+                continue
+            # Streamed: only the names and the new or changed records are kept
+            names: Set[str] = set()
+            export_changed: ImageRecords = {}
+            try:
+                for filename, record in iter_export_records(path):
+                    names.add(filename)
+                    if self.images.get(filename) != record:
+                        export_changed[filename] = record
+            except (OSError, ValueError) as e:
+                # Probably caught mid-write; retry on the next pass
+                logger.warning(f"Skipping {path.name} this pass: {e}")
+                skipped = True
+                continue
+            self._signatures[path] = signature
+            self._export_names[path] = names
+            exports_changed = True
+
+            camera = path.stem[len('images_'):]
+            changed.update(export_changed)
+            cameras.update(dict.fromkeys(export_changed, camera))
+
+        if changed:
+            self.on_change(changed, cameras)
+        # Only once every export could be read: a record may move between exports
+        if exports_changed and not skipped and self.on_remove is not None:
+            self._check_removals()
+
+        for path, on_file_change in self._watched_files.items():
+            signature = self._signature(path)
+            if signature != self._signatures.get(path):
+                self._signatures[path] = signature
+                on_file_change()
+        return changed
+
+    def _check_removals(self) -> None:
+        """Hand the ingested filenames that no export lists any more to on_remove"""
+        listed: Set[str] = set()
+        for path in self._metadata_files:
+            names = self._export_names.get(path)
+            if names is None:
+                if self._signatures.get(path) is None:
+                    continue
+                try:
+                    names = {filename for filename, _ in iter_export_records(path)}
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Removals not checked this pass: {path.name}: {e}")
+                    return
+                self._export_names[path] = names
+            listed |= names
+        removed = {filename for filename in self.images if filename not in listed}
+        if removed:
+            self.on_remove(removed)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Asset watcher pass failed: {e}")
+
+    def start(self) -> None:
+        """Start polling in a daemon thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="AssetsWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
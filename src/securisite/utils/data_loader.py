@@ -5,10 +5,16 @@ Handles date parsing, validation, and data integrity
 
 import json
 import os
+from bisect import bisect_left, bisect_right
 from pathlib import Path
-from datetime import datetime
-from typing import Dict, List, Any, Optional
-from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Any, NamedTuple, Optional, Tuple, Union
+from dataclasses import dataclass, field
+
+from .image_manifest import AssetsManifest, CAMERAS
+from .data_preprocessing import SHARD_INDEX_NAME, iter_shard_records
+
+DateBound = Union[str, date, datetime, None]
 
 @dataclass
 class ImageData:
@@ -19,17 +25,43 @@ class ImageData:
     camera: str
     detections: List[Dict[str, Any]]
     file_path: Path
+    label_scores: Dict[str, float] = field(default_factory=dict, repr=False)
+    
+    def __post_init__(self):
+        """Index the best detection score per label for cheap filtering"""
+        if not self.label_scores:
+            for detection in self.detections:
+                label = detection.get('label', 'unknown')
+                score = detection.get('score', 0.0)
+                if score > self.label_scores.get(label, -1.0):
+                    self.label_scores[label] = score
     
     @property
     def date_str(self) -> str:
         """Return date in YYYY-MM-DD format"""
         return self.timestamp.strftime('%Y-%m-%d')
+    
+    @property
+    def has_person(self) -> bool:
+        return 'person' in self.label_scores
+
+class _CameraDataset(NamedTuple):
+    """Parsed images of one camera, sorted by timestamp"""
+    signature: Tuple[int, int]
+    images: List[ImageData]
+    timestamps: List[datetime]
 
 class SecuriSiteDataLoader:
     """Reliable data loader with full integrity validation"""
     
-    def __init__(self, project_root: Path = None):
-        """Initialize with correct path calculation"""
+    def __init__(self, project_root: Path = None, shards_dir: Path = None, store=None):
+        """
+        Initialize with correct path calculation.
+        When shards_dir is given, records are read lazily from the NDJSON shards
+        produced by data_preprocessing.convert_to_ndjson_shards instead of the
+        images_<camera>.json exports. When store (a SecuriSiteStore) is given,
+        queries run as indexed SQL lookups and nothing is kept in memory.
+        """
         if project_root:
             self.project_root = project_root
         else:
@@ -37,6 +69,13 @@ class SecuriSiteDataLoader:
             self.project_root = Path(__file__).parent.parent.parent
         
         self.assets_dir = self.project_root / 'assets'
+        self.manifest = AssetsManifest(self.assets_dir)
+        self.cameras = CAMERAS
+        self.shards_dir = Path(shards_dir) if shards_dir else None
+        self.store = store
+        
+        # Parsed datasets per camera, keyed by the metadata file (mtime, size)
+        self._datasets: Dict[str, _CameraDataset] = {}
         
     def load_est1_metadata(self) -> Dict[str, Any]:
         """Load EST-1 metadata with date parsing"""
@@ -64,37 +103,144 @@ class SecuriSiteDataLoader:
     
     def get_image_data(self) -> List[ImageData]:
         """Get all image data with full validation"""
-        images = []
+        return self.query()
+    
+    def _camera_dataset(self, camera_name: str) -> _CameraDataset:
+        """Return the memoized dataset of a camera, reparsing only if its source changed"""
+        if self.shards_dir is not None:
+            source_path = self.shards_dir / SHARD_INDEX_NAME
+        else:
+            source_path = self.assets_dir / f'images_{camera_name}.json'
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            raise FileNotFoundError(f"Metadata file not found: {source_path}")
         
-        # Load EST-1 data
-        est1_data = self.load_est1_metadata()
-        est1_images = self._process_camera_images(
-            est1_data, 'EST-1', self.assets_dir / 'images_EST-1'
-        )
-        images.extend(est1_images)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._datasets.get(camera_name)
+        if cached is not None and cached.signature == signature:
+            return cached
         
-        # Load EST-2 data  
-        est2_data = self.load_est2_metadata()
-        est2_images = self._process_camera_images(
-            est2_data, 'EST-2', self.assets_dir / 'images_EST-2'
-        )
-        images.extend(est2_images)
+        images_dir = self.assets_dir / f'images_{camera_name}'
+        if self.shards_dir is not None:
+            records = iter_shard_records(self.shards_dir, camera=camera_name)
+        else:
+            metadata = self._load_metadata(source_path)
+            records = metadata.get('images', metadata).items()
+        images = self._process_records(records, camera_name, images_dir)
+        images.sort(key=lambda img: img.timestamp)
+        dataset = _CameraDataset(signature, images, [img.timestamp for img in images])
+        self._datasets[camera_name] = dataset
+        return dataset
+    
+    def iter_images(self, camera: Union[str, Iterable[str], None] = None,
+                    min_score: Optional[float] = None,
+                    labels: Optional[Iterable[str]] = None,
+                    start_date: DateBound = None, end_date: DateBound = None,
+                    has_person: Optional[bool] = None) -> Iterator[ImageData]:
+        """
+        Yield memoized images matching every given predicate.
         
-        return images
+        Camera and date range prune the scan (per-camera lists are sorted by
+        timestamp), label/score/person predicates use the per-image label index.
+        A date-only end bound includes the whole day. Yielded objects are shared
+        with the cache and must not be mutated.
+        """
+        if camera is None:
+            cameras = self.cameras
+        elif isinstance(camera, str):
+            cameras = (camera,)
+        else:
+            cameras = tuple(camera)
+        
+        label_set = frozenset(labels) if labels is not None else None
+        threshold = min_score if min_score is not None else float('-inf')
+        start = self._to_datetime(start_date)
+        end = self._to_datetime(end_date)
+        end_inclusive = isinstance(end_date, datetime)
+        if end is not None and not end_inclusive:
+            end += timedelta(days=1)
+        
+        if self.store is not None:
+            yield from self._iter_store_images(cameras, start, end, end_inclusive,
+                                               label_set, min_score, has_person)
+            return
+        
+        for camera_name in cameras:
+            dataset = self._camera_dataset(camera_name)
+            lo = bisect_left(dataset.timestamps, start) if start is not None else 0
+            if end is None:
+                hi = len(dataset.images)
+            elif end_inclusive:
+                hi = bisect_right(dataset.timestamps, end)
+            else:
+                hi = bisect_left(dataset.timestamps, end)
+            
+            for index in range(lo, hi):
+                img = dataset.images[index]
+                if has_person is not None and img.has_person != has_person:
+                    continue
+                scores = img.label_scores
+                if label_set is not None:
+                    if not any(label in scores and scores[label] >= threshold
+                               for label in label_set):
+                        continue
+                elif min_score is not None:
+                    if not any(score >= threshold for score in scores.values()):
+                        continue
+                yield img
+    
+    def _iter_store_images(self, cameras, start, end, end_inclusive,
+                           labels, min_score, has_person) -> Iterator[ImageData]:
+        """Run the predicates as an indexed query against the SQLite store"""
+        rows = self.store.iter_image_rows(
+            cameras=list(cameras), start=start, end=end, end_inclusive=end_inclusive,
+            labels=labels, min_score=min_score, has_person=has_person
+        )
+        for filename, camera_name, timestamp, detections in rows:
+            yield ImageData(
+                image_id=filename.replace('.jpg', ''),
+                filename=filename,
+                timestamp=datetime.fromisoformat(timestamp),
+                camera=camera_name,
+                detections=detections,
+                file_path=self.assets_dir / f'images_{camera_name}' / filename
+            )
+    
+    def query(self, **predicates) -> List[ImageData]:
+        """List of images matching the predicates accepted by iter_images"""
+        return list(self.iter_images(**predicates))
+    
+    @staticmethod
+    def _to_datetime(value: DateBound) -> Optional[datetime]:
+        """Normalize a date bound (YYYY-MM-DD string, date or datetime)"""
+        if value is None or isinstance(value, datetime):
+            return value
+        if isinstance(value, date):
+            return datetime(value.year, value.month, value.day)
+        return datetime.strptime(value, '%Y-%m-%d')
     
     def _process_camera_images(self, metadata: Dict[str, Any], 
                                camera_name: str, images_dir: Path) -> List[ImageData]:
         """Process images for a specific camera with full validation"""
+        image_metadata = metadata.get('images', metadata)
+        return self._process_records(image_metadata.items(), camera_name, images_dir)
+    
+    def _process_records(self, records: Iterable[Tuple[str, Dict[str, Any]]],
+                         camera_name: str, images_dir: Path) -> List[ImageData]:
+        """Validate (filename, record) pairs of a camera into ImageData"""
         images = []
         
+        # One scandir pass per directory instead of one stat per image
+        manifest = self.manifest.camera(camera_name)
+        manifest.refresh()
+        
         # Ensure we're using the correct directory
-        if not images_dir.exists():
+        if not manifest.exists:
             print(f"Warning: Directory {images_dir} does not exist")
             return images
-            
-        image_metadata = metadata.get('images', metadata)
         
-        for filename, image_data in image_metadata.items():
+        for filename, image_data in records:
             try:
                 # The key IS the filename (e.g., '651424718_16424f3e...jpg')
                 file_path = images_dir / filename
@@ -112,7 +258,7 @@ class SecuriSiteDataLoader:
                 timestamp = datetime.strptime(fixed_timestamp, '%Y-%m-%d %H:%M:%S')
                 
                 # Validate file exists (optional for testing)
-                exists = file_path.exists()
+                exists = filename in manifest
                 if not exists:
                     print(f"⚠️  Warn: Image file missing: {filename}")
                 
@@ -136,13 +282,8 @@ class SecuriSiteDataLoader:
     
     def get_risk_annotated_images(self, min_confidence: float = 0.5) -> List[ImageData]:
         """Get images with actual detections for risk analysis"""
-        all_images = self.get_image_data()
-        
-        # Filter images with actual detections
-        risky_images = []
-        for img in all_images:
-            if img.detections and len(img.detections) > 0:
-                risky_images.append(img)
+        # Keep images with at least one detection at or above min_confidence
+        risky_images = self.query(min_score=min_confidence)
                 
         print(f"Found {len(risky_images)} images with detections")
         return risky_images
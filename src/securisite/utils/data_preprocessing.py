@@ -5,7 +5,16 @@ Fixes JSON format issues and prepares data for agent analysis
 
 import json
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, Optional, Set, Tuple
+
+SHARD_INDEX_NAME = 'index.json'
+SHARD_INDEX_VERSION = 1
+UNDATED_SHARD = 'undated'
+
+_WHITESPACE = ' \t\n\r'
 
 def fix_json_format_single_line(input_path, output_path=None):
     """
@@ -24,4 +33,245 @@ def fix_json_format_single_line(input_path, output_path=None):
             json.dump(data, f, indent=2, ensure_ascii=False, sort_keys=True)
         
         print(f"✅ Fixed JSON format: {input_path} -> {output_path}")
-        return {"status": "success", "output_path": output_path, "original_size": os.path.getsize(input_path)}
\ No newline at end of file
+        return {"status": "success", "output_path": output_path, "original_size": os.path.getsize(input_path)}
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"❌ Could not fix {input_path}: {e}")
+        return {"status": "error", "error": str(e)}
+
+class _JsonStream:
+    """Incremental reader that decodes one JSON value at a time from a file"""
+
+    def __init__(self, f: IO[str], chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size: Optional[int] = None) -> bool:
+        chunk = self.f.read(size or self.chunk_size)
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found '{found or 'EOF'}'")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Value larger than the buffer: read at least as much again, so that
+                # a value spanning many chunks is decoded a logarithmic number of times
+                if not self._fill(max(self.chunk_size, len(self.buf) - self.pos)):
+                    raise
+                continue
+            # A number or literal touching the end of the buffer may be cut short
+            if end == len(self.buf) and not isinstance(obj, (dict, list, str)) and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+def iter_export_records(input_path, chunk_size: int = 1 << 16) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Stream (filename, record) pairs from a camera export without loading it whole.
+    Accepts both {"images": {...}} and the flat {filename: record} layouts.
+    """
+    with open(input_path, 'r', encoding='utf-8') as f:
+        stream = _JsonStream(f, chunk_size)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+
+        while True:
+            key = stream.value()
+            stream.expect(':')
+            if key == 'images' and stream.peek() == '{':
+                stream.expect('{')
+                if stream.peek() != '}':
+                    while True:
+                        filename = stream.value()
+                        stream.expect(':')
+                        yield filename, stream.value()
+                        if stream.peek() != ',':
+                            break
+                        stream.expect(',')
+                stream.expect('}')
+            else:
+                value = stream.value()
+                if isinstance(value, dict) and ('image_shooting' in value or 'detections' in value):
+                    yield key, value
+
+            if stream.peek() != ',':
+                break
+            stream.expect(',')
+        stream.expect('}')
+
+def _shard_date(record: Dict[str, Any]) -> str:
+    """Shard key of a record: its shooting day as YYYY-MM-DD"""
+    shooting = record.get('image_shooting', '')
+    if len(shooting) < 10:
+        return UNDATED_SHARD
+    return shooting[:10].replace(':', '-')
+
+def load_shard_index(shards_dir) -> Dict[str, Any]:
+    """Load the shard index, or an empty one if the directory has none"""
+    index_path = Path(shards_dir) / SHARD_INDEX_NAME
+    if not index_path.exists():
+        return {"version": SHARD_INDEX_VERSION, "shards": {}}
+    with open(index_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _write_shard_index(shards_dir: Path, index: Dict[str, Any]) -> None:
+    """Atomically replace the shard index"""
+    index_path = shards_dir / SHARD_INDEX_NAME
+    tmp_path = index_path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, index_path)
+
+def _shard_filenames(shard_path: Path) -> Set[str]:
+    """Filenames already written to a shard (empty if it does not exist yet)"""
+    try:
+        return {filename for filename, _ in read_shard(shard_path)}
+    except FileNotFoundError:
+        return set()
+
+def append_to_shards(shards_dir, camera: str,
+                     records: Iterable[Tuple[str, Dict[str, Any]]]) -> Dict[str, int]:
+    """
+    Append records to the per-day NDJSON shards of a camera and update the index.
+    Records whose filename is already in their day's shard are skipped, so
+    appending the same export twice writes nothing (re-convert without append
+    to pick up modified records). Returns the number of records written per
+    day. Only one process should write to a given shards directory at a time.
+    """
+    shards_dir = Path(shards_dir)
+    camera_dir = shards_dir / camera
+    camera_dir.mkdir(parents=True, exist_ok=True)
+
+    counts: Dict[str, int] = {}
+    handles: Dict[str, IO[str]] = {}
+    # Per day: filenames in the shard, read once when the shard is first appended to
+    written: Dict[str, Set[str]] = {}
+    try:
+        for filename, record in records:
+            day = _shard_date(record)
+            handle = handles.get(day)
+            if handle is None:
+                shard_path = camera_dir / f"{day}.ndjson"
+                written[day] = _shard_filenames(shard_path)
+                handle = open(shard_path, 'a', encoding='utf-8')
+                handles[day] = handle
+            if filename in written[day]:
+                continue
+            written[day].add(filename)
+            handle.write(json.dumps({"filename": filename, "record": record}, ensure_ascii=False))
+            handle.write('\n')
+            counts[day] = counts.get(day, 0) + 1
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    index = load_shard_index(shards_dir)
+    camera_shards = index["shards"].setdefault(camera, {})
+    for day, count in counts.items():
+        entry = camera_shards.setdefault(day, {"path": f"{camera}/{day}.ndjson", "records": 0})
+        entry["records"] += count
+    _write_shard_index(shards_dir, index)
+    return counts
+
+def convert_to_ndjson_shards(input_path, shards_dir, camera: str, append: bool = False) -> Dict[str, Any]:
+    """
+    Stream a camera export into one NDJSON shard per day with an index file.
+    Unless append is set, existing shards of the camera are replaced; when
+    appending, records already in the shards are skipped.
+    """
+    shards_dir = Path(shards_dir)
+    try:
+        if not append:
+            shutil.rmtree(shards_dir / camera, ignore_errors=True)
+            index = load_shard_index(shards_dir)
+            if index["shards"].pop(camera, None) is not None:
+                _write_shard_index(shards_dir, index)
+
+        counts = append_to_shards(shards_dir, camera, iter_export_records(input_path))
+
+        print(f"✅ Sharded {input_path}: {sum(counts.values())} records in {len(counts)} shard(s) -> {shards_dir}")
+        return {"status": "success", "shards_dir": str(shards_dir), "camera": camera, "shards": counts}
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not shard {input_path}: {e}")
+        return {"status": "error", "error": str(e)}
+
+def read_shard(shard_path) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Lazily yield (filename, record) pairs from one NDJSON shard"""
+    with open(shard_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry["filename"], entry["record"]
+
+def iter_shards(shards_dir, camera: Optional[str] = None,
+                start_date: Optional[str] = None, end_date: Optional[str] = None) -> Iterator[Tuple[str, str, Path]]:
+    """Yield (camera, day, path) for indexed shards within an inclusive YYYY-MM-DD range"""
+    shards_dir = Path(shards_dir)
+    index = load_shard_index(shards_dir)
+    for shard_camera, days in sorted(index["shards"].items()):
+        if camera is not None and shard_camera != camera:
+            continue
+        for day, entry in sorted(days.items()):
+            if day == UNDATED_SHARD:
+                if start_date or end_date:
+                    continue
+            elif (start_date and day < start_date) or (end_date and day > end_date):
+                continue
+            yield shard_camera, day, shards_dir / entry["path"]
+
+def iter_shard_records(shards_dir, camera: Optional[str] = None,
+                       start_date: Optional[str] = None,
+                       end_date: Optional[str] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Lazily yield (filename, record) pairs across the selected shards"""
+    for _, _, path in iter_shards(shards_dir, camera, start_date, end_date):
+        yield from read_shard(path)
+
+def map_shards(shards_dir, func: Callable[[Path], Any], max_workers: Optional[int] = None,
+               **shard_filters) -> Dict[Tuple[str, str], Any]:
+    """
+    Run func(shard_path) on every selected shard in worker processes.
+    func must be a picklable module-level function.
+    """
+    shards = list(iter_shards(shards_dir, **shard_filters))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(func, [path for _, _, path in shards])
+        return {(camera, day): result for (camera, day, _), result in zip(shards, results)}
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert a camera export into per-day NDJSON shards")
+    parser.add_argument('input_path', help="images_<camera>.json export")
+    parser.add_argument('shards_dir', help="Output directory for shards and index.json")
+    parser.add_argument('--camera', required=True, help="Camera name, e.g. EST-1")
+    parser.add_argument('--append', action='store_true', help="Append to existing shards")
+    args = parser.parse_args()
+
+    result = convert_to_ndjson_shards(args.input_path, args.shards_dir, args.camera, append=args.append)
+    raise SystemExit(0 if result["status"] == "success" else 1)
@@ -0,0 +1,124 @@
+"""
+Image directory manifests for SecuriSite-IA
+Lists each images_<camera> directory in a single os.scandir pass so that
+file validation and image routing never stat individual files
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+CAMERAS = ('EST-1', 'EST-2')
+
+
+def discover_cameras(assets_dir: Path) -> Tuple[str, ...]:
+    """CAMERAS plus every other camera with an images_<camera>.json export in assets_dir"""
+    try:
+        with os.scandir(assets_dir) as it:
+            found = {entry.name[len('images_'):-len('.json')] for entry in it
+                     if entry.name.startswith('images_') and entry.name.endswith('.json')}
+    except OSError:
+        found = set()
+    return CAMERAS + tuple(sorted(found - set(CAMERAS)))
+
+
+class DirectoryManifest:
+    """Snapshot of the file names present in one image directory"""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.exists = False
+        self._files: FrozenSet[str] = frozenset()
+        self._dir_mtime_ns: Optional[int] = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self) -> Tuple[Set[str], Set[str]]:
+        """Rescan the directory if its mtime changed; return (added, removed) names"""
+        with self._lock:
+            try:
+                dir_mtime_ns = os.stat(self.directory).st_mtime_ns
+            except OSError:
+                removed = set(self._files)
+                self.exists = False
+                self._files = frozenset()
+                self._dir_mtime_ns = None
+                return set(), removed
+
+            if dir_mtime_ns == self._dir_mtime_ns:
+                return set(), set()
+
+            try:
+                with os.scandir(self.directory) as it:
+                    # DirEntry.is_file() uses the d_type from readdir, no extra stat
+                    files = frozenset(entry.name for entry in it if entry.is_file())
+            except OSError:
+                return set(), set()
+
+            added = set(files - self._files)
+            removed = set(self._files - files)
+            self.exists = True
+            self._files = files
+            self._dir_mtime_ns = dir_mtime_ns
+            return added, removed
+
+    @property
+    def files(self) -> FrozenSet[str]:
+        return self._files
+
+    def __contains__(self, filename: str) -> bool:
+        return filename in self._files
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def path_for(self, filename: str) -> Optional[Path]:
+        """Return the full path of a listed file, or None if it is not present"""
+        if filename in self._files:
+            return self.directory / filename
+        return None
+
+
+class AssetsManifest:
+    """Manifests for every images_<camera> directory under the assets folder"""
+
+    def __init__(self, assets_dir: Path, cameras: Iterable[str] = CAMERAS):
+        self.assets_dir = Path(assets_dir)
+        self.cameras: Dict[str, DirectoryManifest] = {
+            camera: DirectoryManifest(self.assets_dir / f"images_{camera}")
+            for camera in cameras
+        }
+        # Cameras are added by the watcher thread while request threads iterate
+        # over them: added under the lock, iterated over snapshots
+        self._lock = threading.Lock()
+
+    def camera(self, camera_name: str) -> DirectoryManifest:
+        """Manifest for a camera, created on first use for unknown cameras"""
+        manifest = self.cameras.get(camera_name)
+        if manifest is None:
+            with self._lock:
+                manifest = self.cameras.get(camera_name)
+                if manifest is None:
+                    manifest = DirectoryManifest(self.assets_dir / f"images_{camera_name}")
+                    self.cameras[camera_name] = manifest
+        return manifest
+
+    def _snapshot(self) -> Tuple[Tuple[str, DirectoryManifest], ...]:
+        with self._lock:
+            return tuple(self.cameras.items())
+
+    def refresh(self) -> Dict[str, Tuple[Set[str], Set[str]]]:
+        """Refresh every camera manifest; one directory stat each when unchanged"""
+        return {name: manifest.refresh() for name, manifest in self._snapshot()}
+
+    def locate(self, filename: str) -> Optional[Tuple[str, Path]]:
+        """Find which camera holds a file, refreshing once on a miss"""
+        for attempt in range(2):
+            for name, manifest in self._snapshot():
+                path = manifest.path_for(filename)
+                if path is not None:
+                    return name, path
+            if attempt == 0:
+                self.refresh()
+        return None
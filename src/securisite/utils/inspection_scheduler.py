@@ -0,0 +1,137 @@
+"""
+Inspection scheduler for SecuriSite-IA
+Open violations of every site and camera in one heap-ordered queue
+(earliest deadline first, then highest priority), with O(log n) insert and
+complete, and "due in the next N hours" answered in time proportional to
+the number of violations returned
+"""
+
+import heapq
+import itertools
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional
+
+
+class Inspection(NamedTuple):
+    """An open violation waiting for its inspection"""
+    violation_id: str
+    deadline: datetime
+    priority: int
+    referent: str
+    site: Optional[str] = None
+    camera: Optional[str] = None
+    details: Optional[Dict[str, Any]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "violation_id": self.violation_id,
+            "deadline": self.deadline.isoformat(),
+            "priority": self.priority,
+            "referent": self.referent,
+            "site": self.site,
+            "camera": self.camera,
+            **(self.details or {})
+        }
+
+
+class InspectionScheduler:
+    """
+    Heap of (deadline, -priority, sequence, id) entries. Completing or
+    rescheduling a violation leaves a stale heap entry behind; stale entries
+    are skipped on read and purged once they outnumber live ones.
+    """
+
+    def __init__(self):
+        self._heap: List[tuple] = []
+        self._live: Dict[str, tuple] = {}
+        self._inspections: Dict[str, Inspection] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def __contains__(self, violation_id: object) -> bool:
+        return violation_id in self._live
+
+    def add(self, inspection: Inspection) -> None:
+        """Queue a violation, replacing any earlier entry with the same id"""
+        entry = (inspection.deadline, -inspection.priority, next(self._sequence), inspection.violation_id)
+        with self._lock:
+            self._live[inspection.violation_id] = entry
+            self._inspections[inspection.violation_id] = inspection
+            heapq.heappush(self._heap, entry)
+            self._maybe_compact()
+
+    def complete(self, violation_id: str) -> bool:
+        """Remove a violation once inspected or fixed; False if it was not queued"""
+        with self._lock:
+            if self._live.pop(violation_id, None) is None:
+                return False
+            del self._inspections[violation_id]
+            self._maybe_compact()
+            return True
+
+    def discard(self, violation_id: str) -> bool:
+        """Remove a violation whose risk no longer exists; False if it was not queued"""
+        return self.complete(violation_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap.clear()
+            self._live.clear()
+            self._inspections.clear()
+
+    def _is_live(self, entry: tuple) -> bool:
+        return self._live.get(entry[3]) is entry
+
+    def _maybe_compact(self) -> None:
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._live):
+            self._heap = list(self._live.values())
+            heapq.heapify(self._heap)
+
+    def peek(self) -> Optional[Inspection]:
+        """Most urgent open violation"""
+        with self._lock:
+            while self._heap and not self._is_live(self._heap[0]):
+                heapq.heappop(self._heap)
+            return self._inspections[self._heap[0][3]] if self._heap else None
+
+    def plan(self, limit: Optional[int] = None) -> List[Inspection]:
+        """Open violations in inspection order (all of them, or the first limit)"""
+        with self._lock:
+            live = list(self._live.values())
+            entries = heapq.nsmallest(limit, live) if limit is not None else sorted(live)
+            return [self._inspections[entry[3]] for entry in entries]
+
+    def due_within(self, hours: float, now: Optional[datetime] = None) -> List[Inspection]:
+        """
+        Open violations due by now + hours (overdue ones included), in inspection
+        order. Walks only the part of the heap whose deadlines fall before the cutoff.
+        """
+        cutoff = (now or datetime.now()) + timedelta(hours=hours)
+        with self._lock:
+            heap = self._heap
+            found = []
+            stack = [0] if heap else []
+            while stack:
+                position = stack.pop()
+                entry = heap[position]
+                if entry[0] > cutoff:
+                    # Children of a heap node never have an earlier deadline
+                    continue
+                if self._is_live(entry):
+                    found.append(entry)
+                for child in (2 * position + 1, 2 * position + 2):
+                    if child < len(heap):
+                        stack.append(child)
+            found.sort()
+            return [self._inspections[entry[3]] for entry in found]
+
+    def by_referent(self, limit: Optional[int] = None) -> Dict[str, List[Inspection]]:
+        """Inspection plan split per referent (CARSAT, Inspection Travail...)"""
+        plan: Dict[str, List[Inspection]] = {}
+        for inspection in self.plan(limit):
+            plan.setdefault(inspection.referent, []).append(inspection)
+        return plan
@@ -0,0 +1,248 @@
+"""
+PDF export for SecuriSite-IA
+Markdown reports rendered to PDF (reportlab) with their annotated images,
+in a pool of worker processes outside the request path. Rendered PDFs are
+kept on disk under the hash of their content, so a report is rendered once.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import markdown
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import HRFlowable, Image as PdfImage, Paragraph, SimpleDocTemplate, Spacer
+
+from .annotated_images import annotate_image
+
+logger = logging.getLogger(__name__)
+
+# The pool starts inside the multithreaded web process: forking it could leave
+# the workers with locks held by other threads, so workers are started clean
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+PAGE_MARGIN = 2 * cm
+# Embedded images are downscaled to this width in pixels before going into the PDF
+IMAGE_MAX_WIDTH = 1600
+
+_BLOCK_STYLES = {'h1': 'Title', 'h2': 'Heading2', 'h3': 'Heading3', 'h4': 'Heading4',
+                 'h5': 'Heading5', 'h6': 'Heading6', 'p': 'BodyText', 'li': 'BodyText'}
+_INLINE_TAGS = {'strong', 'b', 'em', 'i', 'code'}
+_CONTENT_KEY = re.compile(r'[0-9a-f]{64}')
+
+
+def _pdf_text(text: str) -> str:
+    """Keep what the standard PDF fonts can draw (emojis and symbols are dropped)"""
+    return ''.join(c for c in text if c.encode('cp1252', 'ignore') or c == '\n')
+
+
+class _MarkdownBlocks(HTMLParser):
+    """Block-level elements (headings, paragraphs, list items, rules) of Markdown HTML"""
+
+    def __init__(self):
+        super().__init__()
+        self.blocks: List[tuple] = []
+        self._tag: Optional[str] = None
+        self._parts: List[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _BLOCK_STYLES:
+            self._flush()
+            self._tag = tag
+        elif tag == 'hr':
+            self._flush()
+            self.blocks.append(('hr', ''))
+        elif tag in _INLINE_TAGS and self._tag:
+            self._parts.append(f'<{tag}>')
+        elif tag == 'br' and self._tag:
+            self._parts.append('<br/>')
+
+    def handle_endtag(self, tag):
+        if tag in _BLOCK_STYLES:
+            self._flush()
+        elif tag in _INLINE_TAGS and self._tag:
+            self._parts.append(f'</{tag}>')
+
+    def handle_data(self, data):
+        if self._tag:
+            self._parts.append(data.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;'))
+
+    def _flush(self):
+        text = ''.join(self._parts).strip()
+        if self._tag and text:
+            self.blocks.append((self._tag, text))
+        self._tag, self._parts = None, []
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def markdown_flowables(markdown_text: str) -> List[Any]:
+    """reportlab flowables for a Markdown document"""
+    styles = getSampleStyleSheet()
+    bullet = ParagraphStyle('Bullet', parent=styles['BodyText'], leftIndent=12, bulletIndent=2)
+    parser = _MarkdownBlocks()
+    parser.feed(markdown.markdown(_pdf_text(markdown_text), extensions=['sane_lists']))
+    parser.close()
+
+    flowables: List[Any] = []
+    for tag, text in parser.blocks:
+        if tag == 'hr':
+            flowables.append(HRFlowable(width='100%', spaceBefore=6, spaceAfter=6))
+        elif tag == 'li':
+            flowables.append(Paragraph(text, bullet, bulletText='•'))
+        else:
+            flowables.append(Paragraph(text, styles[_BLOCK_STYLES[tag]]))
+    return flowables
+
+
+def image_flowables(images: Sequence[Dict[str, Any]], max_width: float) -> List[Any]:
+    """Annotated images, one per {"path", "annotations", "caption"} entry"""
+    styles = getSampleStyleSheet()
+    flowables: List[Any] = []
+    for entry in images:
+        try:
+            image = annotate_image(Path(entry['path']), entry.get('annotations', []))
+        except OSError as e:
+            logger.warning(f"Image {entry['path']} not embedded: {e}")
+            continue
+        if image.width > IMAGE_MAX_WIDTH:
+            image = image.resize((IMAGE_MAX_WIDTH, round(image.height * IMAGE_MAX_WIDTH / image.width)))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=85)
+        buffer.seek(0)
+        flowables.append(PdfImage(buffer, width=max_width, height=max_width * image.height / image.width))
+        if entry.get('caption'):
+            flowables.append(Paragraph(_pdf_text(entry['caption']), styles['Italic']))
+        flowables.append(Spacer(1, 0.4 * cm))
+    return flowables
+
+
+def render_pdf(markdown_text: str, images: Sequence[Dict[str, Any]], output_path: str, title: str = "") -> str:
+    """
+    Render a Markdown report and its annotated images to output_path.
+    Runs in a worker process: arguments and result are plain picklable values.
+    """
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(f"{output_path.name}.{os.getpid()}.tmp")
+    document = SimpleDocTemplate(str(tmp_path), pagesize=A4, title=title,
+                                 leftMargin=PAGE_MARGIN, rightMargin=PAGE_MARGIN,
+                                 topMargin=PAGE_MARGIN, bottomMargin=PAGE_MARGIN)
+    story = markdown_flowables(markdown_text)
+    if images:
+        story.append(Paragraph("Images annotées", getSampleStyleSheet()['Heading2']))
+        story.extend(image_flowables(images, document.width))
+    document.build(story)
+    os.replace(tmp_path, output_path)
+    return str(output_path)
+
+
+def content_key(*parts: Any) -> str:
+    """Hash of the JSON-serialized report inputs, used as job id and cache file name"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def image_fingerprint(path: Path) -> Optional[tuple]:
+    """(size, mtime) of an image, so that a replaced image gives a new content key"""
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+class PdfExportPool:
+    """
+    PDF rendering jobs keyed by content hash, run in a process pool.
+    A job already rendered (now or by an earlier process) is served from the
+    cache directory; a job already queued is not queued twice. Only pending
+    and failed jobs are tracked in memory.
+    """
+
+    def __init__(self, cache_dir: Path, max_workers: Optional[int] = None):
+        self.cache_dir = Path(cache_dir)
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def pdf_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pdf"
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # Started on first use: importing the web app does not fork workers
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context(START_METHOD))
+        return self._executor
+
+    def submit(self, key: str, markdown_text: str, images: Sequence[Dict[str, Any]] = (),
+               title: str = "") -> Dict[str, Any]:
+        """Queue a PDF unless it is cached or already queued; returns the job status"""
+        with self._lock:
+            future = self._jobs.get(key)
+            if self.pdf_path(key).exists() or (future is not None and not future.done()):
+                return self._status(key)
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            future = self._pool().submit(
+                render_pdf, markdown_text, [dict(entry, path=str(entry['path'])) for entry in images],
+                str(self.pdf_path(key)), title)
+            self._jobs[key] = future
+            status = self._status(key)
+        # Outside the lock: runs at once if the job already ended
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return status
+
+    def _forget(self, key: str, future: Future) -> None:
+        """Drop a finished job once its PDF is on disk (failed jobs stay, to report the error)"""
+        if future.exception() is None:
+            with self._lock:
+                if self._jobs.get(key) is future:
+                    del self._jobs[key]
+
+    def status(self, key: str) -> Optional[Dict[str, Any]]:
+        """{"job_id", "status": queued|running|done|failed, "error"?}, None for unknown jobs"""
+        with self._lock:
+            return self._status(key)
+
+    def _status(self, key: str) -> Optional[Dict[str, Any]]:
+        if not _CONTENT_KEY.fullmatch(key):
+            return None
+        future = self._jobs.get(key)
+        if future is None:
+            return {"job_id": key, "status": "done"} if self.pdf_path(key).exists() else None
+        if not future.done():
+            return {"job_id": key, "status": "running" if future.running() else "queued"}
+        error = future.exception()
+        if error is not None:
+            return {"job_id": key, "status": "failed", "error": str(error)}
+        return {"job_id": key, "status": "done"}
+
+    def wait(self, key: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Block until a job ends (or timeout), then return its status"""
+        with self._lock:
+            future = self._jobs.get(key)
+        if future is not None:
+            try:
+                future.exception(timeout=timeout)
+            except FutureTimeoutError:
+                pass
+        return self.status(key)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
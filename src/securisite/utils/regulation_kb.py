@@ -0,0 +1,77 @@
+"""
+Regulation knowledge base for SecuriSite-IA
+French construction safety rules loaded once from a versioned data file
+into read-only lookup tables shared by every RegulationAgent
+"""
+
+import json
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+
+DEFAULT_KB_PATH = Path(__file__).resolve().parent.parent / "data" / "regulations_fr.json"
+
+REQUIRED_KEYS = ('version', 'regulations', 'default_regulation', 'risk_mapping',
+                 'default_category', 'severity_penalties', 'default_penalty')
+
+
+def _freeze_regulation(entry: Dict[str, Any]) -> Mapping[str, Any]:
+    """Read-only view of a regulation entry; articles become a tuple"""
+    frozen = dict(entry)
+    frozen['articles'] = tuple(entry.get('articles', ()))
+    return MappingProxyType(frozen)
+
+
+class RegulationKnowledgeBase:
+    """Immutable regulation tables: categories, regulations and penalty scores"""
+
+    def __init__(self, data: Dict[str, Any]):
+        missing = [key for key in REQUIRED_KEYS if key not in data]
+        if missing:
+            raise ValueError(f"Regulation knowledge base is missing {', '.join(missing)}")
+        if data['default_category'] not in data['regulations']:
+            raise ValueError(f"Unknown default category {data['default_category']}")
+
+        self.version: str = str(data['version'])
+        self.regulations: Mapping[str, Mapping[str, Any]] = MappingProxyType({
+            key: _freeze_regulation(entry) for key, entry in data['regulations'].items()
+        })
+        self.default_regulation = _freeze_regulation(data['default_regulation'])
+        self.risk_mapping: Mapping[str, str] = MappingProxyType(dict(data['risk_mapping']))
+        self.default_category: str = data['default_category']
+        self.severity_penalties: Mapping[str, int] = MappingProxyType(dict(data['severity_penalties']))
+        self.default_penalty: int = int(data['default_penalty'])
+        # Free-text queries used to look categories up in the article search index
+        self.search_queries: Mapping[str, str] = MappingProxyType(dict(data.get('search_queries', {})))
+
+    @classmethod
+    def from_file(cls, path: Path) -> 'RegulationKnowledgeBase':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def category(self, risk_type: str) -> str:
+        """Regulation category of a risk type"""
+        return self.risk_mapping.get(risk_type, self.default_category)
+
+    def regulation(self, category: str) -> Mapping[str, Any]:
+        """Regulation entry of a category (the default entry for unknown ones)"""
+        return self.regulations.get(category, self.default_regulation)
+
+    def search_query(self, category: str) -> Optional[str]:
+        """Article search query of a category, if the knowledge base has one"""
+        return self.search_queries.get(category)
+
+    def penalty(self, severity_label: str) -> int:
+        """Penalty score of a regulation severity label (URGENTE, HAUTE...)"""
+        return self.severity_penalties.get(severity_label, self.default_penalty)
+
+
+@lru_cache(maxsize=None)
+def _load_cached(path: Path) -> RegulationKnowledgeBase:
+    return RegulationKnowledgeBase.from_file(path)
+
+
+def load_knowledge_base(path: Optional[Path] = None) -> RegulationKnowledgeBase:
+    """Knowledge base from path (default: the bundled file), parsed once per process"""
+    return _load_cached(Path(path or DEFAULT_KB_PATH).resolve())
@@ -0,0 +1,228 @@
+"""
+Offline regulation search for SecuriSite-IA
+Inverted index with BM25 ranking over a local corpus of Code du Travail
+articles, persisted to disk and re-indexed incrementally when articles change
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import unicodedata
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CORPUS_PATH = Path(__file__).resolve().parent.parent / "data" / "code_du_travail.json"
+INDEX_FORMAT_VERSION = 1
+
+STOPWORDS = frozenset("""
+a au aux avec ce ces cette dans de des du elle en est et il ils la le les leur leurs
+lors ou par pas pour qu que qui sa sans se ses son sont sur un une y l d s n
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+Article = Tuple[str, str]  # (title, text)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent-free terms without stopwords; plural 's'/'x' stripped"""
+    folded = unicodedata.normalize('NFKD', text.lower())
+    folded = ''.join(c for c in folded if not unicodedata.combining(c))
+    terms = []
+    for token in _TOKEN.findall(folded):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token[-1] in 'sx':
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+def _article_hash(title: str, text: str) -> str:
+    return hashlib.sha1(f"{title}\n{text}".encode('utf-8')).hexdigest()
+
+
+def load_corpus(corpus_path: Path) -> Dict[str, Article]:
+    """
+    Read article texts: a JSON file {"articles": [{"id", "title", "text"}]}
+    or a directory of <article id>.txt files whose first line is the title
+    """
+    corpus_path = Path(corpus_path)
+    articles: Dict[str, Article] = {}
+    if corpus_path.is_dir():
+        for path in sorted(corpus_path.glob('*.txt')):
+            title, _, text = path.read_text(encoding='utf-8').partition('\n')
+            articles[path.stem] = (title.strip(), text.strip())
+    else:
+        with open(corpus_path, 'r', encoding='utf-8') as f:
+            for entry in json.load(f).get('articles', []):
+                articles[entry['id']] = (entry.get('title', ''), entry.get('text', ''))
+    return articles
+
+
+class RegulationSearchIndex:
+    """BM25 inverted index over regulation articles with an LRU query cache"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, cache_size: int = 256):
+        self.k1 = k1
+        self.b = b
+        self.cache_size = cache_size
+        self.articles: Dict[str, Dict[str, Any]] = {}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.total_length = 0
+        self._cache: 'OrderedDict[Tuple[Tuple[str, ...], int], List[Dict[str, Any]]]' = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def __len__(self) -> int:
+        return len(self.articles)
+
+    # ------------------------------------------------------------------ updates
+
+    def add_article(self, article_id: str, title: str, text: str) -> bool:
+        """Index or re-index an article; returns False if it is unchanged"""
+        digest = _article_hash(title, text)
+        existing = self.articles.get(article_id)
+        if existing is not None:
+            if existing['hash'] == digest:
+                return False
+            self.remove_article(article_id)
+
+        # The title counts twice: it names what the article is about
+        counts = Counter(tokenize(title) * 2 + tokenize(text))
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[article_id] = tf
+        length = sum(counts.values())
+        self.articles[article_id] = {"title": title, "text": text, "hash": digest, "length": length}
+        self.total_length += length
+        self._cache.clear()
+        return True
+
+    def remove_article(self, article_id: str) -> bool:
+        article = self.articles.pop(article_id, None)
+        if article is None:
+            return False
+        for term in set(tokenize(article['title']) + tokenize(article['text'])):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(article_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= article['length']
+        self._cache.clear()
+        return True
+
+    def sync(self, corpus: Mapping[str, Article]) -> Tuple[int, int]:
+        """Bring the index in line with a corpus; returns (re-indexed, removed) counts"""
+        reindexed = sum(self.add_article(article_id, title, text)
+                        for article_id, (title, text) in corpus.items())
+        removed = sum(self.remove_article(article_id)
+                      for article_id in [a for a in self.articles if a not in corpus])
+        return reindexed, removed
+
+    # ------------------------------------------------------------------ queries
+
+    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        """Top-k articles for a free-text query: [{"article", "title", "score"}]"""
+        key = (tuple(sorted(set(tokenize(query)))), k)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.stats["hits"] += 1
+            return cached
+
+        self.stats["misses"] += 1
+        results = self._rank(key[0], k)
+        self._cache[key] = results
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return results
+
+    def _rank(self, terms: Iterable[str], k: int) -> List[Dict[str, Any]]:
+        n = len(self.articles)
+        if not n:
+            return []
+        average_length = self.total_length / n
+        scores: Dict[str, float] = {}
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for article_id, tf in postings.items():
+                length = self.articles[article_id]['length']
+                norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[article_id] = scores.get(article_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [
+            {"article": article_id, "title": self.articles[article_id]['title'], "score": round(score, 4)}
+            for article_id, score in ranked
+        ]
+
+    # -------------------------------------------------------------- persistence
+
+    def save(self, index_path: Path) -> None:
+        """Atomically write the index to disk"""
+        index_path = Path(index_path)
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = index_path.with_suffix(index_path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": INDEX_FORMAT_VERSION,
+                "k1": self.k1,
+                "b": self.b,
+                "articles": self.articles,
+                "postings": self.postings
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+
+    @classmethod
+    def load(cls, index_path: Path, cache_size: int = 256) -> 'RegulationSearchIndex':
+        with open(index_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported regulation index version {data.get('version')}")
+        index = cls(k1=data['k1'], b=data['b'], cache_size=cache_size)
+        index.articles = data['articles']
+        index.postings = data['postings']
+        index.total_length = sum(article['length'] for article in index.articles.values())
+        return index
+
+
+def open_search_index(corpus_path: Path = DEFAULT_CORPUS_PATH,
+                      index_path: Optional[Path] = None) -> RegulationSearchIndex:
+    """
+    Load the persisted index (if any), re-index only the articles that changed
+    in the corpus, and write it back when something was updated
+    """
+    index = None
+    if index_path is not None and Path(index_path).exists():
+        try:
+            index = RegulationSearchIndex.load(index_path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Rebuilding regulation index {index_path}: {e}")
+    if index is None:
+        index = RegulationSearchIndex()
+
+    reindexed, removed = index.sync(load_corpus(corpus_path))
+    if index_path is not None and (reindexed or removed or not Path(index_path).exists()):
+        try:
+            index.save(index_path)
+        except OSError as e:
+            logger.warning(f"Could not persist regulation index to {index_path}: {e}")
+    logger.info(f"Regulation index: {len(index)} articles ({reindexed} re-indexed, {removed} removed)")
+    return index
+
+
+@lru_cache(maxsize=None)
+def shared_search_index(corpus_path: Path = DEFAULT_CORPUS_PATH,
+                        index_path: Optional[Path] = None) -> RegulationSearchIndex:
+    """One index per (corpus, index file) per process, shared by every agent"""
+    return open_search_index(corpus_path, index_path)
@@ -0,0 +1,101 @@
+"""
+Report history for SecuriSite-IA
+Risk counts and compliance score of the recent reports of each site, used
+to diff a report against the site's previous day. With a directory, each
+(site, day) snapshot is its own JSON file, so every process (web workers,
+batch runs) sees the reports of the others and no write races another;
+without one, snapshots are kept in memory.
+"""
+
+import json
+import os
+import threading
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+# Reports remembered per site
+HISTORY_DAYS = 7
+
+Snapshot = Dict[str, Any]
+
+
+def _valid_day(day: str) -> Optional[str]:
+    """day as YYYY-MM-DD, or None if it is not a date (never used as a file name then)"""
+    try:
+        return date.fromisoformat(str(day)).isoformat()
+    except ValueError:
+        return None
+
+
+class ReportHistory:
+    """Per-site report snapshots ({"risks": {key: count}, "compliance_score": n}) by day"""
+
+    def __init__(self, directory: Optional[Path] = None, days: int = HISTORY_DAYS):
+        self.directory = Path(directory) if directory else None
+        self.days = days
+        self._memory: Dict[str, Dict[str, Snapshot]] = {}
+        self._lock = threading.Lock()
+
+    def _site_dir(self, site: str) -> Path:
+        return self.directory / quote(site, safe='')
+
+    def dates(self, site: str) -> List[str]:
+        """Remembered days of site, oldest first"""
+        if self.directory is None:
+            with self._lock:
+                return sorted(self._memory.get(site, {}))
+        try:
+            names = os.listdir(self._site_dir(site))
+        except OSError:
+            return []
+        return sorted(name[:-len('.json')] for name in names
+                      if name.endswith('.json') and _valid_day(name[:-len('.json')]))
+
+    def get(self, site: str, day: str) -> Optional[Snapshot]:
+        day = _valid_day(day)
+        if day is None:
+            return None
+        if self.directory is None:
+            with self._lock:
+                return self._memory.get(site, {}).get(day)
+        try:
+            with open(self._site_dir(site) / f"{day}.json", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def previous(self, site: str, report_date: str) -> Optional[Tuple[str, Snapshot]]:
+        """Latest remembered report of site dated before report_date"""
+        for day in reversed([day for day in self.dates(site) if day < report_date]):
+            snapshot = self.get(site, day)
+            if snapshot is not None:
+                return day, snapshot
+        return None
+
+    def remember(self, site: str, day: str, snapshot: Snapshot) -> None:
+        """Keep the snapshot of site's report of day, dropping all but the last days"""
+        day = _valid_day(day)
+        if day is None:
+            return
+        if self.directory is None:
+            with self._lock:
+                history = self._memory.setdefault(site, {})
+                history[day] = snapshot
+                for old in sorted(history)[:-self.days]:
+                    del history[old]
+            return
+
+        site_dir = self._site_dir(site)
+        site_dir.mkdir(parents=True, exist_ok=True)
+        path = site_dir / f"{day}.json"
+        tmp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_path, path)
+        for old in self.dates(site)[:-self.days]:
+            try:
+                os.remove(site_dir / f"{old}.json")
+            except OSError:
+                pass
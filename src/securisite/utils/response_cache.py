@@ -0,0 +1,72 @@
+"""
+HTTP response cache for the SecuriSite-IA web app
+Serialized bodies of read-only routes (dashboard, report and risk API) kept
+in memory under (route, arguments, data version). The data version changes
+whenever the risk data is reloaded, which drops every cached body and gives
+new ETags, so tablets polling unchanged data get a 304 without any rendering.
+"""
+
+import hashlib
+import json
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, NamedTuple, Optional, Tuple
+
+
+class CachedBody(NamedTuple):
+    body: bytes
+    content_type: str
+
+
+class ResponseCache:
+    """
+    LRU cache of response bodies for the current data version. ETags depend
+    on the key and version only (plus a per-process token, since versions
+    restart at 0), so they are known before the body is rendered.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.version = 0
+        # HTTP dates have a one-second resolution
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self._token = secrets.token_hex(8)
+        self._entries: 'OrderedDict[Tuple[Any, ...], Tuple[int, CachedBody]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0}
+
+    def invalidate(self) -> None:
+        """The data changed: new version, new ETags, cached bodies dropped"""
+        with self._lock:
+            self.version += 1
+            self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+            self._entries.clear()
+
+    def etag(self, key: Tuple[Any, ...], version: Optional[int] = None) -> str:
+        payload = json.dumps([self._token, self.version if version is None else version, key], default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple[Any, ...], render: Callable[[], CachedBody]) -> Tuple[CachedBody, int]:
+        """Cached body of key, rendered on a miss; returns (body, data version it belongs to)"""
+        with self._lock:
+            version = self.version
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1], version
+
+        cached = render()
+        with self._lock:
+            self.stats["misses"] += 1
+            # Not kept if the data changed while rendering
+            if self.version == version:
+                self._entries[key] = (version, cached)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return cached, version
@@ -0,0 +1,155 @@
+"""
+In-memory risk index for the SecuriSite-IA web app
+Risks by id and by day, with per-day aggregates (count, mean severity,
+level), rebuilt once per data refresh so that routes never scan the list.
+Also pages of risks ordered by severity or time, with opaque cursors.
+"""
+
+import base64
+import json
+import threading
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+# Shown for a day without any risk
+NO_RISK_SCORE = 2.0
+
+# Both orders are descending: most severe / most recent first, ties broken by id
+PAGE_ORDERS = {
+    "severity": lambda risk: (risk['severity'], risk['timestamp'], risk['id']),
+    "time": lambda risk: (risk['timestamp'], risk['severity'], risk['id'])
+}
+# Types of the sort key elements of each order, checked when a cursor is decoded
+_NUMBER = (int, float)
+PAGE_KEY_TYPES = {
+    "severity": (_NUMBER, str, str),
+    "time": (str, _NUMBER, str)
+}
+
+
+class DaySummary(NamedTuple):
+    """Aggregates of the risks of one day, as shown on the dashboard"""
+    count: int
+    mean_severity: float
+    level: str
+    color: str
+
+
+def summarize(risks: List[Dict[str, Any]]) -> DaySummary:
+    """Global score (mean severity), level and color of a list of risks"""
+    if not risks:
+        return DaySummary(0, NO_RISK_SCORE, "AUCUN RISQUE", "#388E3C")
+    score = sum(r['severity'] for r in risks) / len(risks)
+    level = "RISQUE ÉLEVÉ" if score >= 7 else "RISQUE MODÉRÉ" if score >= 5 else "RISQUE FAIBLE"
+    color = "#D32F2F" if score >= 7 else "#F57C00" if score >= 5 else "#388E3C"
+    return DaySummary(len(risks), score, level, color)
+
+
+class _Snapshot(NamedTuple):
+    by_id: Dict[str, Dict[str, Any]]
+    by_date: Dict[str, List[Dict[str, Any]]]
+    summaries: Dict[str, DaySummary]
+    version: int
+
+
+class RiskIndex:
+    """
+    Read-mostly index over the risk list. rebuild() prepares new tables and
+    swaps them in at once: concurrent readers see either the old or the new
+    data, never a mix.
+    """
+
+    def __init__(self, risks: Iterable[Dict[str, Any]] = ()):
+        self._lock = threading.Lock()
+        self._snapshot = _Snapshot({}, {}, {}, 0)
+        self.rebuild(risks)
+
+    def rebuild(self, risks: Iterable[Dict[str, Any]]) -> None:
+        by_id: Dict[str, Dict[str, Any]] = {}
+        by_date: Dict[str, List[Dict[str, Any]]] = {}
+        for risk in risks:
+            by_id[risk['id']] = risk
+            # Timestamps are "YYYY-MM-DD HH:MM"
+            by_date.setdefault(risk['timestamp'][:10], []).append(risk)
+        summaries = {day: summarize(day_risks) for day, day_risks in by_date.items()}
+        with self._lock:
+            self._snapshot = _Snapshot(by_id, by_date, summaries, self._snapshot.version + 1)
+
+    @property
+    def version(self) -> int:
+        """Incremented on every rebuild"""
+        return self._snapshot.version
+
+    def __len__(self) -> int:
+        return len(self._snapshot.by_id)
+
+    def get(self, risk_id: str) -> Optional[Dict[str, Any]]:
+        return self._snapshot.by_id.get(risk_id)
+
+    def for_date(self, date_str: str) -> List[Dict[str, Any]]:
+        """
+        Risks of a YYYY-MM-DD day (the indexed list itself: do not mutate);
+        a shorter prefix (YYYY-MM) spans several days
+        """
+        snapshot = self._snapshot
+        if len(date_str) == 10:
+            return snapshot.by_date.get(date_str, [])
+        return [risk for day, risks in snapshot.by_date.items() if day.startswith(date_str) for risk in risks]
+
+    def summary(self, date_str: str) -> DaySummary:
+        """Precomputed aggregates of a day (computed on the fly for prefixes)"""
+        summary = self._snapshot.summaries.get(date_str)
+        if summary is not None:
+            return summary
+        return summarize(self.for_date(date_str)) if len(date_str) != 10 else summarize([])
+
+
+class RiskPage(NamedTuple):
+    risks: List[Dict[str, Any]]
+    next_cursor: Optional[str]
+
+
+def encode_cursor(order: str, key: Tuple[Any, ...]) -> str:
+    payload = json.dumps([order, list(key)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, order: str) -> Tuple[Any, ...]:
+    """Sort key encoded in a cursor; ValueError if malformed or of another order"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_order, key = json.loads(payload)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from None
+    if cursor_order != order or not isinstance(key, list) or len(key) != 3:
+        raise ValueError("Cursor does not match this order")
+    # Compared with the risks' keys: any other type would raise TypeError while paging
+    for value, expected in zip(key, PAGE_KEY_TYPES[order]):
+        if isinstance(value, bool) or not isinstance(value, expected):
+            raise ValueError("Cursor does not match this order")
+    return tuple(key)
+
+
+def page_risks(risks: Sequence[Dict[str, Any]], order: str = "severity", limit: int = 50,
+               cursor: Optional[str] = None) -> RiskPage:
+    """
+    Up to limit risks after cursor in the given order. Cursors hold the sort
+    key of the last risk returned, so pages stay consistent when risks are
+    added or removed between two requests.
+    """
+    if order not in PAGE_ORDERS:
+        raise ValueError(f"Unknown order {order}")
+    sort_key = PAGE_ORDERS[order]
+    ordered = sorted(risks, key=sort_key, reverse=True)
+    if cursor:
+        after = decode_cursor(cursor, order)
+        ordered = [risk for risk in ordered if sort_key(risk) < after]
+    page = ordered[:limit]
+    next_cursor = encode_cursor(order, sort_key(page[-1])) if len(ordered) > limit else None
+    return RiskPage(page, next_cursor)
+
+
+def project(risk: Dict[str, Any], fields: Optional[Sequence[str]]) -> Dict[str, Any]:
+    """Only the requested top-level fields of a risk (always with its id)"""
+    if not fields:
+        return risk
+    return {field: risk[field] for field in ['id', *fields] if field in risk}
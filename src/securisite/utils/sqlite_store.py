@@ -0,0 +1,437 @@
+"""
+Embedded SQLite store for SecuriSite-IA
+Keeps images, detections, computed risks and their inspections on disk
+with secondary indexes, so date/camera/label/severity filters and due
+inspections are indexed lookups and web workers do not need the whole
+dataset in memory
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .data_preprocessing import iter_export_records
+from .inspection_scheduler import Inspection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    filename   TEXT PRIMARY KEY,
+    camera     TEXT NOT NULL,
+    timestamp  TEXT NOT NULL,
+    record     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_images_camera_timestamp ON images (camera, timestamp);
+
+CREATE TABLE IF NOT EXISTS detections (
+    id         INTEGER PRIMARY KEY,
+    filename   TEXT NOT NULL REFERENCES images (filename) ON DELETE CASCADE,
+    label      TEXT NOT NULL,
+    score      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_detections_label ON detections (label, score);
+CREATE INDEX IF NOT EXISTS idx_detections_filename ON detections (filename);
+
+CREATE TABLE IF NOT EXISTS risks (
+    id         TEXT PRIMARY KEY,
+    filename   TEXT NOT NULL,
+    camera     TEXT,
+    timestamp  TEXT NOT NULL,
+    severity   INTEGER NOT NULL,
+    data       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_risks_timestamp ON risks (timestamp);
+CREATE INDEX IF NOT EXISTS idx_risks_camera_timestamp ON risks (camera, timestamp);
+CREATE INDEX IF NOT EXISTS idx_risks_severity ON risks (severity);
+CREATE INDEX IF NOT EXISTS idx_risks_filename ON risks (filename);
+
+CREATE TABLE IF NOT EXISTS exports (
+    camera     TEXT PRIMARY KEY,
+    mtime_ns   INTEGER NOT NULL,
+    size       INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS inspections (
+    violation_id  TEXT PRIMARY KEY,
+    deadline      TEXT NOT NULL,
+    priority      INTEGER NOT NULL,
+    referent      TEXT NOT NULL,
+    site          TEXT,
+    camera        TEXT,
+    details       TEXT,
+    acknowledged  INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_inspections_due ON inspections (acknowledged, deadline, priority DESC);
+"""
+
+# Fixed-width, so that deadlines sort as text
+DEADLINE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+ImageRow = Tuple[str, str, str, List[Dict[str, Any]]]
+ExportSignature = Tuple[int, int]
+
+
+def export_signature(path: Path) -> Optional[ExportSignature]:
+    """(mtime_ns, size) of a camera export, None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _parse_shooting(shooting: str) -> Optional[str]:
+    """Convert 'YYYY:MM:DD HH:MM:SS' into a sortable ISO 'YYYY-MM-DD HH:MM:SS'"""
+    if not shooting:
+        return None
+    try:
+        return datetime.strptime(shooting, "%Y:%m:%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+class _RecordsView(Mapping):
+    """Read-only filename -> raw image record mapping backed by the store"""
+
+    def __init__(self, store: 'SecuriSiteStore'):
+        self.store = store
+
+    def __getitem__(self, filename: str) -> Dict[str, Any]:
+        row = self.store.connection.execute(
+            "SELECT record FROM images WHERE filename = ?", (filename,)).fetchone()
+        if row is None:
+            raise KeyError(filename)
+        return json.loads(row[0])
+
+    def __contains__(self, filename: object) -> bool:
+        return self.store.connection.execute(
+            "SELECT 1 FROM images WHERE filename = ?", (filename,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for (filename,) in self.store.connection.execute("SELECT filename FROM images"):
+            yield filename
+
+    def __len__(self) -> int:
+        return self.store.count_images()
+
+
+class _StoredInspections:
+    """
+    Inspection queue backed by the store, with the InspectionScheduler
+    interface: every worker reads the same open violations, and
+    acknowledged ones stay closed when their risks are scheduled again
+    (e.g. on restart)
+    """
+
+    COLUMNS = "violation_id, deadline, priority, referent, site, camera, details"
+    ORDER = "ORDER BY deadline, priority DESC, rowid"
+
+    def __init__(self, store: 'SecuriSiteStore'):
+        self.store = store
+
+    @staticmethod
+    def _inspection(row: tuple) -> Inspection:
+        violation_id, deadline, priority, referent, site, camera, details = row
+        return Inspection(violation_id, datetime.fromisoformat(deadline), priority, referent,
+                          site, camera, json.loads(details) if details else None)
+
+    def _open(self, where: str = "", params: Sequence[Any] = (), limit: Optional[int] = None) -> List[Inspection]:
+        sql = f"SELECT {self.COLUMNS} FROM inspections WHERE acknowledged = 0{where} {self.ORDER}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = (*params, limit)
+        return [self._inspection(row) for row in self.store.connection.execute(sql, params)]
+
+    def __len__(self) -> int:
+        return self.store.connection.execute(
+            "SELECT COUNT(*) FROM inspections WHERE acknowledged = 0").fetchone()[0]
+
+    def __contains__(self, violation_id: object) -> bool:
+        return self.store.connection.execute(
+            "SELECT 1 FROM inspections WHERE violation_id = ? AND acknowledged = 0",
+            (violation_id,)).fetchone() is not None
+
+    def add(self, inspection: Inspection) -> None:
+        """Queue or update a violation; one already acknowledged stays closed"""
+        with self.store.connection as conn:
+            conn.execute(
+                f"INSERT INTO inspections ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (violation_id) DO UPDATE SET deadline = excluded.deadline, "
+                "priority = excluded.priority, referent = excluded.referent, site = excluded.site, "
+                "camera = excluded.camera, details = excluded.details",
+                (inspection.violation_id, inspection.deadline.strftime(DEADLINE_FORMAT), inspection.priority,
+                 inspection.referent, inspection.site, inspection.camera,
+                 json.dumps(inspection.details, ensure_ascii=False) if inspection.details is not None else None))
+
+    def complete(self, violation_id: str) -> bool:
+        """Acknowledge a violation once inspected or fixed; False if it was not open"""
+        with self.store.connection as conn:
+            return conn.execute("UPDATE inspections SET acknowledged = 1 WHERE violation_id = ? AND acknowledged = 0",
+                                (violation_id,)).rowcount > 0
+
+    def discard(self, violation_id: str) -> bool:
+        """Forget a violation whose risk no longer exists; False if it was not open"""
+        with self.store.connection as conn:
+            row = conn.execute("SELECT acknowledged FROM inspections WHERE violation_id = ?",
+                               (violation_id,)).fetchone()
+            conn.execute("DELETE FROM inspections WHERE violation_id = ?", (violation_id,))
+        return row == (0,)
+
+    def clear(self) -> None:
+        with self.store.connection as conn:
+            conn.execute("DELETE FROM inspections")
+
+    def peek(self) -> Optional[Inspection]:
+        """Most urgent open violation"""
+        plan = self._open(limit=1)
+        return plan[0] if plan else None
+
+    def plan(self, limit: Optional[int] = None) -> List[Inspection]:
+        """Open violations in inspection order (all of them, or the first limit)"""
+        return self._open(limit=limit)
+
+    def due_within(self, hours: float, now: Optional[datetime] = None) -> List[Inspection]:
+        """Open violations due by now + hours (overdue ones included), in inspection order"""
+        cutoff = (now or datetime.now()) + timedelta(hours=hours)
+        return self._open(" AND deadline <= ?", (cutoff.strftime(DEADLINE_FORMAT),))
+
+    def by_referent(self, limit: Optional[int] = None) -> Dict[str, List[Inspection]]:
+        """Inspection plan split per referent (CARSAT, Inspection Travail...)"""
+        plan: Dict[str, List[Inspection]] = {}
+        for inspection in self.plan(limit):
+            plan.setdefault(inspection.referent, []).append(inspection)
+        return plan
+
+
+class SecuriSiteStore:
+    """SQLite (WAL) store for images, detections, risks and inspections"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self.records = _RecordsView(self)
+        self.inspections = _StoredInspections(self)
+        with self.connection as conn:
+            conn.executescript(SCHEMA)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets readers run alongside the writer"""
+        if os.getpid() != self._pid:
+            # Connections must not be shared with forked (e.g. gunicorn) workers
+            self._local = threading.local()
+            self._pid = os.getpid()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ------------------------------------------------------------------ writes
+
+    def upsert_records(self, camera: str, records: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """Bulk insert or replace raw image records of one camera with their detections"""
+        image_rows = []
+        detection_rows = []
+        for filename, record in records:
+            timestamp = _parse_shooting(record.get('image_shooting', ''))
+            if timestamp is None:
+                continue
+            image_rows.append((filename, camera, timestamp, json.dumps(record, ensure_ascii=False)))
+            for detection in record.get('detections', []):
+                detection_rows.append((filename, detection.get('label', 'unknown'),
+                                       detection.get('score', 0.0)))
+
+        with self.connection as conn:
+            conn.executemany("DELETE FROM detections WHERE filename = ?",
+                             [(row[0],) for row in image_rows])
+            conn.executemany("INSERT OR REPLACE INTO images (filename, camera, timestamp, record) "
+                             "VALUES (?, ?, ?, ?)", image_rows)
+            conn.executemany("INSERT INTO detections (filename, label, score) VALUES (?, ?, ?)",
+                             detection_rows)
+        return len(image_rows)
+
+    def import_assets(self, assets_dir: Path, cameras: Sequence[str]) -> int:
+        """Stream every images_<camera>.json export of the assets folder into the store"""
+        total = 0
+        signatures = {}
+        for camera in cameras:
+            export_path = Path(assets_dir) / f"images_{camera}.json"
+            signature = export_signature(export_path)
+            if signature is not None:
+                total += self.upsert_records(camera, iter_export_records(export_path))
+                signatures[camera] = signature
+        self.mark_exports(signatures)
+        return total
+
+    def mark_exports(self, signatures: Dict[str, ExportSignature]) -> None:
+        """Record the exports whose records are now all in the store"""
+        with self.connection as conn:
+            conn.executemany("INSERT OR REPLACE INTO exports (camera, mtime_ns, size) VALUES (?, ?, ?)",
+                             [(camera, *signature) for camera, signature in signatures.items()])
+
+    def upsert_risks(self, risks: Iterable[Dict[str, Any]]) -> int:
+        """Bulk insert or replace web-app risk dicts; camera is taken from the image"""
+        rows = [
+            (risk['id'], risk['image_path'], risk['image_path'], risk['timestamp'],
+             risk['severity'], json.dumps(risk, ensure_ascii=False))
+            for risk in risks
+        ]
+        with self.connection as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO risks (id, filename, camera, timestamp, severity, data) "
+                "VALUES (?, ?, (SELECT camera FROM images WHERE filename = ?), ?, ?, ?)", rows)
+        return len(rows)
+
+    def replace_risks_for_images(self, filenames: Iterable[str], risks: Iterable[Dict[str, Any]]) -> None:
+        """Drop the risks of re-analyzed images, then store their new risks"""
+        with self.connection as conn:
+            conn.executemany("DELETE FROM risks WHERE filename = ?", [(name,) for name in filenames])
+        self.upsert_risks(risks)
+
+    def delete_images(self, filenames: Iterable[str]) -> None:
+        """Drop images no export lists any more, with their detections and risks"""
+        rows = [(name,) for name in filenames]
+        with self.connection as conn:
+            conn.executemany("DELETE FROM risks WHERE filename = ?", rows)
+            conn.executemany("DELETE FROM images WHERE filename = ?", rows)
+
+    # ------------------------------------------------------------------- reads
+
+    def export_changes(self, assets_dir: Path, cameras: Sequence[str]
+                       ) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, str], Dict[str, ExportSignature]]:
+        """
+        Records of the camera exports modified since they were last imported that
+        differ from the stored ones: (filename -> record, filename -> camera,
+        camera -> export signature to mark once they are ingested)
+        """
+        recorded = {camera: (mtime_ns, size) for camera, mtime_ns, size
+                    in self.connection.execute("SELECT camera, mtime_ns, size FROM exports")}
+        records: Dict[str, Dict[str, Any]] = {}
+        record_cameras: Dict[str, str] = {}
+        signatures: Dict[str, ExportSignature] = {}
+        for camera in cameras:
+            export_path = Path(assets_dir) / f"images_{camera}.json"
+            signature = export_signature(export_path)
+            if signature is None or signature == recorded.get(camera):
+                continue
+            for filename, record in iter_export_records(export_path):
+                if self.records.get(filename) != record:
+                    records[filename] = record
+                    record_cameras[filename] = camera
+            signatures[camera] = signature
+        return records, record_cameras, signatures
+
+    def count_images(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def count_risks(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM risks").fetchone()[0]
+
+    def iter_image_rows(self, cameras: Optional[Sequence[str]] = None,
+                        start: Optional[datetime] = None,
+                        end: Optional[datetime] = None, end_inclusive: bool = False,
+                        labels: Optional[Iterable[str]] = None,
+                        min_score: Optional[float] = None,
+                        has_person: Optional[bool] = None) -> Iterator[ImageRow]:
+        """Yield (filename, camera, timestamp, detections) ordered by camera and time"""
+        clauses = []
+        params: List[Any] = []
+        if cameras is not None:
+            clauses.append(f"i.camera IN ({', '.join('?' * len(cameras))})")
+            params.extend(cameras)
+        if start is not None:
+            clauses.append("i.timestamp >= ?")
+            params.append(start.strftime("%Y-%m-%d %H:%M:%S"))
+        if end is not None:
+            clauses.append("i.timestamp <= ?" if end_inclusive else "i.timestamp < ?")
+            params.append(end.strftime("%Y-%m-%d %H:%M:%S"))
+        if labels is not None or min_score is not None:
+            detection_clauses = ["d.filename = i.filename"]
+            if labels is not None:
+                labels = list(labels)
+                detection_clauses.append(f"d.label IN ({', '.join('?' * len(labels))})")
+                params.extend(labels)
+            if min_score is not None:
+                detection_clauses.append("d.score >= ?")
+                params.append(min_score)
+            clauses.append(f"EXISTS (SELECT 1 FROM detections d WHERE {' AND '.join(detection_clauses)})")
+        if has_person is not None:
+            clauses.append(("" if has_person else "NOT ") +
+                           "EXISTS (SELECT 1 FROM detections d "
+                           "WHERE d.filename = i.filename AND d.label = 'person')")
+
+        sql = "SELECT i.filename, i.camera, i.timestamp, i.record FROM images i"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY i.camera, i.timestamp"
+
+        for filename, camera, timestamp, record in self.connection.execute(sql, params):
+            yield filename, camera, timestamp, json.loads(record).get('detections', [])
+
+    def risks_for_date(self, date_str: str, camera: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Risks of one YYYY-MM-DD day, in insertion order"""
+        sql = "SELECT data FROM risks WHERE timestamp >= ? AND timestamp < ?"
+        # Prefix range on the indexed timestamp, same semantics as startswith()
+        params: List[Any] = [date_str, date_str + "\uffff"]
+        if camera is not None:
+            sql += " AND camera = ?"
+            params.append(camera)
+        sql += " ORDER BY rowid"
+        return [json.loads(data) for (data,) in self.connection.execute(sql, params)]
+
+    def risks_by_severity(self, min_severity: int) -> List[Dict[str, Any]]:
+        """Risks at or above a severity, most severe first"""
+        rows = self.connection.execute(
+            "SELECT data FROM risks WHERE severity >= ? ORDER BY severity DESC, rowid",
+            (min_severity,))
+        return [json.loads(data) for (data,) in rows]
+
+    def risk_ids_for_images(self, filenames: Iterable[str]) -> List[str]:
+        """Ids of the risks computed from the given images"""
+        ids = []
+        for filename in filenames:
+            rows = self.connection.execute("SELECT id FROM risks WHERE filename = ?", (filename,))
+            ids.extend(risk_id for (risk_id,) in rows)
+        return ids
+
+    def all_risks(self) -> Iterator[Dict[str, Any]]:
+        """Every stored risk, in insertion order"""
+        for (data,) in self.connection.execute("SELECT data FROM risks ORDER BY rowid"):
+            yield json.loads(data)
+
+    def iter_risk_batches(self, size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """Every stored risk, size at a time; each page is read in full before it is yielded"""
+        last_rowid = 0
+        while True:
+            rows = self.connection.execute(
+                "SELECT rowid, data FROM risks WHERE rowid > ? ORDER BY rowid LIMIT ?", (last_rowid, size)).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield [json.loads(data) for _, data in rows]
+
+    def update_risks(self, risks: Iterable[Dict[str, Any]]) -> None:
+        """Rewrite the data of stored risks in place (same id, image, time and severity)"""
+        rows = [(json.dumps(risk, ensure_ascii=False), risk['id']) for risk in risks]
+        with self.connection as conn:
+            conn.executemany("UPDATE risks SET data = ? WHERE id = ?", rows)
+
+    def get_risk(self, risk_id: str) -> Optional[Dict[str, Any]]:
+        row = self.connection.execute("SELECT data FROM risks WHERE id = ?", (risk_id,)).fetchone()
+        return json.loads(row[0]) if row else None
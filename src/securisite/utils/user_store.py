@@ -0,0 +1,181 @@
+"""
+User store for SecuriSite-IA
+users.toml parsed once and kept in memory, reloaded when the file changes.
+Passwords are stored as salted PBKDF2 hashes and checked in constant time;
+verified sessions are cached so that authenticated requests touch no file.
+
+Usage (hash for the "password" field of users.toml):
+    python -m securisite.utils.user_store
+"""
+
+import getpass
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import toml
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_SCHEME = "pbkdf2_sha256"
+PBKDF2_ITERATIONS = 260_000
+# Seconds between two checks of users.toml for changes
+CHECK_INTERVAL = 2.0
+SESSION_CACHE_SIZE = 256
+DEFAULT_SESSION_TIMEOUT_MINUTES = 480
+
+_DEFAULT_DATA = {"users": {}, "config": {"require_authentication": False}}
+
+
+def hash_password(password: str, salt: Optional[str] = None, iterations: int = PBKDF2_ITERATIONS) -> str:
+    """"pbkdf2_sha256$<iterations>$<salt>$<hash>" for users.toml"""
+    salt = salt or secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), iterations)
+    return f"{PASSWORD_SCHEME}${iterations}${salt}${digest.hex()}"
+
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith(PASSWORD_SCHEME + "$")
+
+
+def check_password(password: str, stored: str) -> bool:
+    """
+    Constant-time comparison against a stored hash. Plain-text entries of
+    older users.toml files are still accepted (and reported when loaded).
+    """
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+    try:
+        _, iterations, salt, expected = stored.split('$')
+        candidate = hash_password(password, salt, int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(candidate.rsplit('$', 1)[1], expected)
+
+
+class UserStore:
+    """
+    Users and authentication settings from users.toml. The file is checked
+    at most every check_interval seconds and parsed again only if its mtime
+    or size changed; a reload drops the verified sessions.
+    """
+
+    def __init__(self, path: Path, check_interval: float = CHECK_INTERVAL,
+                 session_cache_size: int = SESSION_CACHE_SIZE, clock: Callable[[], float] = time.monotonic):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self.session_cache_size = session_cache_size
+        self.clock = clock
+        self.version = 0
+        self._data: Dict[str, Any] = _DEFAULT_DATA
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked_at: Optional[float] = None
+        self._sessions: 'OrderedDict[Tuple[str, str], datetime]' = OrderedDict()
+        self._lock = threading.Lock()
+        # Hashed for unknown users, so that their login takes as long as a wrong password
+        self._dummy_hash = hash_password(secrets.token_hex(8))
+
+    def _refresh(self) -> Dict[str, Any]:
+        now = self.clock()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self._data
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+                signature = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                signature = None
+            if signature == self._signature:
+                return self._data
+            data = _DEFAULT_DATA
+            if signature is not None:
+                try:
+                    data = toml.load(self.path)
+                except Exception as e:
+                    print(f"Error loading users.toml: {e}")
+            plain = [name for name, user in data.get("users", {}).items()
+                     if not is_hashed(user.get("password", ""))]
+            if plain:
+                logger.warning(f"users.toml: plain-text password for {', '.join(plain)} "
+                               f"(hash with python -m securisite.utils.user_store)")
+            self._data, self._signature = data, signature
+            self._sessions.clear()
+            self.version += 1
+            return self._data
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return self._refresh().get("config", {})
+
+    @property
+    def require_authentication(self) -> bool:
+        return bool(self.config.get("require_authentication", False))
+
+    def user_info(self, username: str) -> Optional[Dict[str, Any]]:
+        """User fields (without the password) plus "username", or None"""
+        user = self._refresh().get("users", {}).get(username)
+        if user is None:
+            return None
+        info = {key: value for key, value in user.items() if key != "password"}
+        info["username"] = username
+        return info
+
+    def verify_password(self, username: str, password: str) -> bool:
+        user = self._refresh().get("users", {}).get(username)
+        if user is None:
+            check_password(password, self._dummy_hash)
+            return False
+        return check_password(password, user.get("password", ""))
+
+    def session_expiry(self, username: str, login_time: Optional[str]) -> Optional[datetime]:
+        """
+        End of validity of a session opened by username at login_time (ISO
+        format), or None if the user no longer exists. Cached per session
+        until users.toml changes.
+        """
+        data = self._refresh()
+        key = (username, login_time or "")
+        with self._lock:
+            expiry = self._sessions.get(key)
+            if expiry is not None:
+                self._sessions.move_to_end(key)
+                return expiry
+        if username not in data.get("users", {}):
+            return None
+        if login_time:
+            try:
+                started = datetime.fromisoformat(login_time)
+            except ValueError:
+                return None
+            timeout = data.get("config", {}).get("session_timeout_minutes", DEFAULT_SESSION_TIMEOUT_MINUTES)
+            expiry = started + timedelta(minutes=timeout)
+        else:
+            expiry = datetime.max
+        with self._lock:
+            self._sessions[key] = expiry
+            while len(self._sessions) > self.session_cache_size:
+                self._sessions.popitem(last=False)
+        return expiry
+
+
+def main() -> int:
+    password = getpass.getpass("Mot de passe: ")
+    if not password or password != getpass.getpass("Confirmation: "):
+        print("❌ Mots de passe vides ou différents")
+        return 1
+    print(hash_password(password))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
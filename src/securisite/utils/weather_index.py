@@ -0,0 +1,179 @@
+"""
+Time index over weather observations for SecuriSite-IA
+Sorted once, then answers nearest / interpolated lookups by image
+timestamp in O(log n), and batches of lookups in a single merge pass.
+An observation only stands for the hours around it: further away, a
+lookup finds no data rather than the closest observation.
+"""
+
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+Timestamp = Union[str, datetime]
+
+# A daily summary stands for the middle of its day, so nearest lookup picks the right day
+DAILY_ANCHOR_HOUR = 12
+# How far from its time an hourly observation is used (a daily summary covers its own day)
+MAX_OBSERVATION_GAP = timedelta(hours=3)
+
+
+def parse_timestamp(value: Timestamp) -> datetime:
+    """Parse camera ('YYYY:MM:DD HH:MM:SS'), ISO or datetime timestamps"""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    text = value.strip()
+    if len(text) >= 10 and text[4] == ':' and text[7] == ':':
+        text = text[:10].replace(':', '-') + text[10:]
+    return datetime.fromisoformat(text).replace(tzinfo=None)
+
+
+def round_to_hour(timestamp: datetime) -> datetime:
+    """Snap a timestamp to the nearest hour (index granularity)"""
+    floored = timestamp.replace(minute=0, second=0, microsecond=0)
+    if timestamp - floored >= timedelta(minutes=30):
+        return floored + timedelta(hours=1)
+    return floored
+
+
+def _hourly_time(day: str, entry: Dict[str, Any]) -> Optional[datetime]:
+    """Time of an hourly entry given as 'time' (HH:MM or ISO) or 'hour' (int)"""
+    if 'hour' in entry:
+        return datetime.fromisoformat(day) + timedelta(hours=int(entry['hour']))
+    value = entry.get('time') or entry.get('datetime') or entry.get('timestamp')
+    if not value:
+        return None
+    if len(str(value)) <= 5:
+        return datetime.fromisoformat(f"{day}T{value}")
+    return parse_timestamp(str(value))
+
+
+class WeatherTimeIndex:
+    """
+    Sorted (time, observation) series built from weather_info.json. Items may
+    carry a third element, the [start, end) period the observation covers
+    (default: max_gap either side of its time); lookups outside every covered
+    period return None.
+    """
+
+    def __init__(self, observations: Iterable[Tuple[Any, ...]], max_gap: timedelta = MAX_OBSERVATION_GAP):
+        ordered = sorted(observations, key=lambda item: item[0])
+        self.times: List[datetime] = [item[0] for item in ordered]
+        self.observations: List[Dict[str, Any]] = [item[1] for item in ordered]
+        self.coverage: List[Tuple[datetime, datetime]] = [
+            item[2] if len(item) > 2 else (item[0] - max_gap, item[0] + max_gap + timedelta.resolution)
+            for item in ordered
+        ]
+
+    @classmethod
+    def from_weather_data(cls, weather_data: Dict[str, Any]) -> 'WeatherTimeIndex':
+        """
+        Index daily summaries under weather_by_date (anchored at noon) and any
+        hourly entries, either in a day's 'hourly' list or a top-level 'hourly' list.
+        """
+        observations = []
+        for day, summary in weather_data.get('weather_by_date', {}).items():
+            if not isinstance(summary, dict):
+                continue
+            hourly = summary.get('hourly')
+            if hourly:
+                for entry in hourly:
+                    time = _hourly_time(day, entry)
+                    if time is not None:
+                        observations.append((time, {k: v for k, v in entry.items()
+                                                    if k not in ('hour', 'time', 'datetime', 'timestamp')}))
+            else:
+                start = datetime.fromisoformat(day)
+                observations.append((start + timedelta(hours=DAILY_ANCHOR_HOUR), summary,
+                                     (start, start + timedelta(days=1))))
+
+        for entry in weather_data.get('hourly', []):
+            value = entry.get('datetime') or entry.get('timestamp') or entry.get('time')
+            if value:
+                observations.append((parse_timestamp(value), {k: v for k, v in entry.items()
+                                                              if k not in ('datetime', 'timestamp', 'time')}))
+        return cls(observations)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def _covers(self, pos: int, timestamp: datetime) -> bool:
+        start, end = self.coverage[pos]
+        return start <= timestamp < end
+
+    def _nearest_position(self, timestamp: datetime, hint: int = 0) -> Optional[int]:
+        """
+        Index of the closest observation covering timestamp (None if none does);
+        hint is a lower bound for bisection
+        """
+        pos = bisect_left(self.times, timestamp, hint)
+        candidates = [p for p in (pos - 1, pos) if 0 <= p < len(self.times) and self._covers(p, timestamp)]
+        if not candidates:
+            return None
+        # Ties go to the earlier observation
+        return min(candidates, key=lambda p: (abs(timestamp - self.times[p]), p))
+
+    def _interpolate_at(self, timestamp: datetime, hint: int = 0) -> Optional[Dict[str, Any]]:
+        pos = bisect_left(self.times, timestamp, hint)
+        if pos == 0 or pos == len(self.times) or self.times[pos] == timestamp:
+            nearest = self._nearest_position(timestamp, max(pos - 1, 0))
+            return None if nearest is None else self.observations[nearest]
+        if self.coverage[pos - 1][1] < self.coverage[pos][0]:
+            # A gap in the series: no blending across it
+            nearest = self._nearest_position(timestamp, pos - 1)
+            return None if nearest is None else self.observations[nearest]
+        before, after = self.observations[pos - 1], self.observations[pos]
+        span = (self.times[pos] - self.times[pos - 1]).total_seconds()
+        ratio = (timestamp - self.times[pos - 1]).total_seconds() / span
+        nearest = before if ratio <= 0.5 else after
+        blended = dict(nearest)
+        for key, low in before.items():
+            high = after.get(key)
+            if (isinstance(low, (int, float)) and isinstance(high, (int, float))
+                    and not isinstance(low, bool) and not isinstance(high, bool)):
+                blended[key] = round(low + (high - low) * ratio, 2)
+        return blended
+
+    def lookup(self, timestamp: Timestamp, interpolate: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Weather at a timestamp (snapped to the hour): nearest observation or
+        interpolated; None when no observation is close enough
+        """
+        if not self.times:
+            return None
+        at = round_to_hour(parse_timestamp(timestamp))
+        if interpolate:
+            return self._interpolate_at(at)
+        pos = self._nearest_position(at)
+        return None if pos is None else self.observations[pos]
+
+    def nearest_positions(self, timestamps: Sequence[Timestamp]) -> List[Optional[int]]:
+        """Position of the observation lookup() would return for each timestamp (None: no data)"""
+        if not self.times:
+            return [None] * len(timestamps)
+        parsed = [round_to_hour(parse_timestamp(ts)) for ts in timestamps]
+        order = sorted(range(len(parsed)), key=parsed.__getitem__)
+        positions: List[Optional[int]] = [None] * len(parsed)
+        hint = 0
+        for i in order:
+            # Each bisection starts just before the previous query time
+            positions[i] = self._nearest_position(parsed[i], hint)
+            hint = max(bisect_left(self.times, parsed[i], hint) - 1, 0)
+        return positions
+
+    def lookup_many(self, timestamps: Sequence[Timestamp],
+                    interpolate: bool = False) -> List[Optional[Dict[str, Any]]]:
+        """Batch lookup: query times are sorted and walked in one forward pass"""
+        if not self.times:
+            return [None] * len(timestamps)
+        if not interpolate:
+            return [None if pos is None else self.observations[pos] for pos in self.nearest_positions(timestamps)]
+        parsed = [round_to_hour(parse_timestamp(ts)) for ts in timestamps]
+        order = sorted(range(len(parsed)), key=parsed.__getitem__)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(parsed)
+        hint = 0
+        for i in order:
+            at = parsed[i]
+            results[i] = self._interpolate_at(at, hint)
+            hint = max(bisect_left(self.times, at, hint) - 1, 0)
+        return results
@@ -0,0 +1,275 @@
+"""
+Weather sources for SecuriSite-IA
+Local weather_info.json or a live HTTP provider behind a common interface,
+with an in-memory TTL cache that coalesces concurrent requests per hour
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+
+from .weather_index import WeatherTimeIndex, round_to_hour
+
+logger = logging.getLogger(__name__)
+
+Weather = Optional[Dict[str, Any]]
+
+
+class WeatherSource(ABC):
+    """Provides the weather observed (or forecast) for a given hour"""
+
+    @abstractmethod
+    async def fetch(self, hour: datetime) -> Weather:
+        """Weather for one hour, or None when the source has nothing"""
+
+    async def fetch_many(self, hours: Sequence[datetime]) -> List[Weather]:
+        """Weather for several hours; sources with a cheaper batch path override this"""
+        return list(await asyncio.gather(*(self.fetch(hour) for hour in hours)))
+
+    async def close(self) -> None:
+        """Release connections held by the source"""
+
+
+class FileWeatherSource(WeatherSource):
+    """weather_info.json, parsed and indexed again only when the file changes"""
+
+    def __init__(self, path: Path = Path("assets/weather_info.json")):
+        self.path = Path(path)
+        self.data: Dict[str, Any] = {}
+        self.index = WeatherTimeIndex([])
+        self._signature: Optional[Tuple[int, int]] = None
+
+    def load(self) -> Dict[str, Any]:
+        """Return the parsed file; raises OSError/ValueError if it cannot be read"""
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature != self._signature:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+            self.index = WeatherTimeIndex.from_weather_data(self.data)
+            self._signature = signature
+        return self.data
+
+    async def fetch(self, hour: datetime) -> Weather:
+        self.load()
+        return self.index.lookup(hour)
+
+    async def fetch_many(self, hours: Sequence[datetime]) -> List[Weather]:
+        self.load()
+        return self.index.lookup_many(hours)
+
+
+class HttpWeatherSource(WeatherSource):
+    """
+    Live provider queried over HTTP with a pooled aiohttp session. Requests
+    run on an event loop owned by the source (in a daemon thread), so callers
+    that each use their own short-lived loop (one asyncio.run per web request
+    or batch partition) share one session and its connection pool.
+    """
+
+    def __init__(self, url: str, api_key: Optional[str] = None,
+                 timeout: float = 10.0, max_connections: int = 8):
+        self.url = url
+        self.api_key = api_key
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_connections = max_connections
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _source_loop(self) -> asyncio.AbstractEventLoop:
+        """The source's event loop, started on first use"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._run_loop, args=(loop,),
+                                          name="HttpWeatherSource", daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop) -> None:
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+        loop.close()
+
+    async def _on_source_loop(self, coro) -> Any:
+        """Run coro on the source's loop; cancelling the caller cancels it there too"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._source_loop()))
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """The session (and connection pool) of the source's loop"""
+        if self._session is None or self._session.closed:
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else None
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=self.timeout,
+                headers=headers
+            )
+        return self._session
+
+    async def _request(self, hour: datetime) -> Weather:
+        async with self._get_session().get(self.url, params={"datetime": hour.isoformat()}) as response:
+            response.raise_for_status()
+            payload = await response.json()
+        return payload.get('weather', payload) if isinstance(payload, dict) else None
+
+    async def fetch(self, hour: datetime) -> Weather:
+        return await self._on_source_loop(self._request(hour))
+
+    async def _close_session(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def close(self) -> None:
+        """Close the session and stop the source's loop (restarted if fetched again)"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._close_session(), loop))
+        loop.call_soon_threadsafe(loop.stop)
+        await asyncio.get_running_loop().run_in_executor(None, thread.join)
+
+
+class CachedWeatherSource:
+    """
+    TTL cache in front of a WeatherSource, keyed by hour.
+    Concurrent requests for an hour that is being fetched share that fetch.
+    """
+
+    def __init__(self, source: WeatherSource, ttl_seconds: float = 900.0,
+                 max_entries: int = 4096, clock: Callable[[], float] = time.monotonic):
+        self.source = source
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: Dict[datetime, Tuple[float, Dict[str, Any]]] = {}
+        self._in_flight: Dict[datetime, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    def _cached(self, hour: datetime) -> Weather:
+        entry = self._entries.get(hour)
+        if entry is not None:
+            if entry[0] > self.clock():
+                return entry[1]
+            del self._entries[hour]
+        return None
+
+    def _store(self, hour: datetime, weather: Weather) -> None:
+        if weather is None:
+            return
+        if len(self._entries) >= self.max_entries:
+            now = self.clock()
+            self._entries = {h: e for h, e in self._entries.items() if e[0] > now}
+            if len(self._entries) >= self.max_entries:
+                # Still full of live entries: evict the oldest-expiring one
+                del self._entries[min(self._entries, key=lambda h: self._entries[h][0])]
+        self._entries[hour] = (self.clock() + self.ttl_seconds, weather)
+
+    def _settle(self, hour: datetime, future: asyncio.Future, weather: Weather = None,
+                error: Optional[BaseException] = None) -> None:
+        """Resolve an in-flight fetch for its waiters, whatever way the fetch ended"""
+        if self._in_flight.get(hour) is future:
+            del self._in_flight[hour]
+        if future.done():
+            return
+        if isinstance(error, asyncio.CancelledError):
+            # The fetching task was cancelled: waiters fetch again themselves
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+            # Mark retrieved so a failure nobody else awaited is not reported as unhandled
+            future.exception()
+        else:
+            future.set_result(weather)
+
+    async def _join(self, hour: datetime, pending: asyncio.Future) -> Weather:
+        """Wait for another task's fetch of hour"""
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                # This task itself was cancelled
+                raise
+        return await self.get(hour)
+
+    async def get(self, timestamp: datetime) -> Weather:
+        """Weather for the hour of timestamp"""
+        hour = round_to_hour(timestamp)
+        weather = self._cached(hour)
+        if weather is not None:
+            self.stats["hits"] += 1
+            return weather
+
+        pending = self._in_flight.get(hour)
+        if pending is not None:
+            self.stats["coalesced"] += 1
+            return await self._join(hour, pending)
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[hour] = future
+        try:
+            weather = await self.source.fetch(hour)
+        except BaseException as e:
+            self._settle(hour, future, error=e)
+            raise
+        self._store(hour, weather)
+        self._settle(hour, future, weather)
+        return weather
+
+    async def get_many(self, timestamps: Sequence[datetime]) -> List[Weather]:
+        """
+        Weather for many timestamps: cached hours are served, hours already being
+        fetched are shared, and the rest fetched in one batch (itself shared)
+        """
+        hours = [round_to_hour(ts) for ts in timestamps]
+        results: Dict[datetime, Weather] = {}
+        missing = []
+        waiting: Dict[datetime, asyncio.Future] = {}
+        for hour in dict.fromkeys(hours):
+            weather = self._cached(hour)
+            if weather is not None:
+                self.stats["hits"] += 1
+                results[hour] = weather
+            elif hour in self._in_flight:
+                self.stats["coalesced"] += 1
+                waiting[hour] = self._in_flight[hour]
+            else:
+                missing.append(hour)
+
+        if missing:
+            self.stats["misses"] += len(missing)
+            loop = asyncio.get_running_loop()
+            futures = {hour: loop.create_future() for hour in missing}
+            self._in_flight.update(futures)
+            try:
+                fetched = await self.source.fetch_many(missing)
+            except BaseException as e:
+                for hour, future in futures.items():
+                    self._settle(hour, future, error=e)
+                raise
+            for hour, weather in zip(missing, fetched):
+                self._store(hour, weather)
+                self._settle(hour, futures[hour], weather)
+                results[hour] = weather
+        for hour, pending in waiting.items():
+            results[hour] = await self._join(hour, pending)
+        return [results[hour] for hour in hours]
+
+    def clear(self) -> None:
+        self._entries.clear()
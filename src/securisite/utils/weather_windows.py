@@ -0,0 +1,146 @@
+"""
+Weather risk windows for SecuriSite-IA
+Contiguous periods during which a weather factor (high wind, heavy rain...)
+is active, precomputed once per weather series and indexed per site and
+factor so "which windows overlap T / [a, b]" is answered in O(log n)
+"""
+
+import threading
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from .weather_index import Timestamp, parse_timestamp
+
+
+class RiskWindow(NamedTuple):
+    """Period [start, end) during which a weather factor is active on a site"""
+    site: str
+    factor: str
+    start: datetime
+    end: datetime
+    max_severity: int
+    risk_multiplier: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "site": self.site,
+            "factor": self.factor,
+            "start": self.start.isoformat(),
+            "end": self.end.isoformat(),
+            "max_severity": self.max_severity,
+            "risk_multiplier": self.risk_multiplier
+        }
+
+
+def observation_spans(times: Sequence[datetime],
+                      coverage: Sequence[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
+    """
+    Period [start, end) each observation stands for under the index's lookup
+    rules: its own coverage period, less the part where a neighbour that also
+    covers it is closer (ties go to the earlier observation). Spans may be
+    empty (start >= end) and leave gaps where no observation covers.
+    """
+    spans = []
+    for i, (time, (start, end)) in enumerate(zip(times, coverage)):
+        if i > 0:
+            # The previous observation wins up to the midpoint, included, while it covers
+            tie = times[i - 1] + (time - times[i - 1]) / 2 + timedelta.resolution
+            start = max(start, min(coverage[i - 1][1], tie))
+        if i + 1 < len(times):
+            # The next one wins after the midpoint, from where it covers
+            tie = time + (times[i + 1] - time) / 2 + timedelta.resolution
+            end = min(end, max(coverage[i + 1][0], tie))
+        spans.append((start, end))
+    return spans
+
+
+def merge_active_spans(site: str, factor: str, spans: Sequence[Tuple[datetime, datetime]],
+                       severities: Sequence[int], risk_multiplier: float) -> List[RiskWindow]:
+    """Merge consecutive, touching spans with a non-zero severity into windows"""
+    windows = []
+    current = None
+    for (start, end), severity in zip(spans, severities):
+        if start >= end:
+            # Observation never returned by a lookup
+            continue
+        if current is not None and (severity <= 0 or start > current[1]):
+            # Inactive, or a period without data: the window ends
+            windows.append(RiskWindow(site, factor, *current, risk_multiplier))
+            current = None
+        if severity <= 0:
+            continue
+        if current is None:
+            current = [start, end, int(severity)]
+        else:
+            current[1] = end
+            current[2] = max(current[2], int(severity))
+    if current is not None:
+        windows.append(RiskWindow(site, factor, *current, risk_multiplier))
+    return windows
+
+
+class _FactorWindows:
+    """Disjoint windows of one (site, factor), sorted: starts and ends both ascend"""
+
+    def __init__(self, windows: Iterable[RiskWindow]):
+        self.windows = sorted(windows, key=lambda w: w.start)
+        self.starts = [w.start for w in self.windows]
+        self.ends = [w.end for w in self.windows]
+
+    def overlapping(self, start: datetime, end: datetime) -> List[RiskWindow]:
+        # window.end > start and window.start <= end
+        return self.windows[bisect_right(self.ends, start):bisect_right(self.starts, end)]
+
+
+class RiskWindowIndex:
+    """
+    Interval index of weather risk windows per site and factor.
+    A site's windows are replaced as a whole, so readers never see a partial update.
+    """
+
+    def __init__(self):
+        self._sites: Dict[str, Dict[str, _FactorWindows]] = {}
+        self._lock = threading.Lock()
+
+    def replace_site(self, site: str, windows: Iterable[RiskWindow]) -> None:
+        """Install the freshly computed windows of a site"""
+        by_factor: Dict[str, List[RiskWindow]] = {}
+        for window in windows:
+            by_factor.setdefault(window.factor, []).append(window)
+        factors = {factor: _FactorWindows(items) for factor, items in by_factor.items()}
+        with self._lock:
+            sites = dict(self._sites)
+            sites[site] = factors
+            self._sites = sites
+
+    @property
+    def sites(self) -> List[str]:
+        return sorted(self._sites)
+
+    def overlapping(self, start: Timestamp, end: Optional[Timestamp] = None,
+                    site: Optional[str] = None, factor: Optional[str] = None) -> List[RiskWindow]:
+        """
+        Windows active at start (when end is None) or overlapping [start, end],
+        optionally for one site / factor, ordered by start time
+        """
+        start = parse_timestamp(start)
+        end = start if end is None else parse_timestamp(end)
+        sites = self._sites
+        if site is None:
+            selected = list(sites.values())
+        else:
+            selected = [sites[site]] if site in sites else []
+
+        found = []
+        for factors in selected:
+            if factor is not None:
+                if factor in factors:
+                    found.extend(factors[factor].overlapping(start, end))
+            else:
+                for windows in factors.values():
+                    found.extend(windows.overlapping(start, end))
+        return sorted(found, key=lambda w: (w.start, w.site, w.factor))
+
+    def __len__(self) -> int:
+        return sum(len(windows.windows) for factors in self._sites.values() for windows in factors.values())
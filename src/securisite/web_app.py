@@ -4,17 +4,18 @@ Interface utilisateur pour l'analyse des risques de chantier
 Conçue pour Marc - Responsable sécurité non-technophile
 """
 
-from flask import Flask, render_template, jsonify, request, send_file, session, redirect, url_for, flash
+from flask import Flask, Response, render_template, jsonify, request, send_file, session, redirect, url_for, flash, stream_with_context
 import json
 import asyncio
-import toml
 import hashlib
 from datetime import datetime, timedelta
 from pathlib import Path
 import os
 import sys
+import threading
 from flask_cors import CORS
 from functools import wraps
+from werkzeug.http import is_resource_modified
 
 # Add current directory to path for imports
 current_dir = Path(__file__).parent
@@ -23,6 +24,18 @@ sys.path.insert(0, str(current_dir.parent))
 sys.path.insert(0, str(project_root))
 
 from .orchestrator import SecuriSiteOrchestrator
+from .utils.image_manifest import AssetsManifest, discover_cameras
+from .utils.asset_watcher import AssetsWatcher
+from .utils.sqlite_store import SecuriSiteStore
+from .utils.weather_sources import FileWeatherSource
+from .utils.weather_windows import RiskWindowIndex
+from .utils.pdf_export import PdfExportPool, content_key, image_fingerprint
+from .utils.annotated_images import AnnotatedImageCache
+from .utils.risk_index import PAGE_ORDERS, RiskIndex, decode_cursor, page_risks, project, summarize
+from .utils.user_store import UserStore
+from .utils.response_cache import CachedBody, ResponseCache
+from .utils.report_history import ReportHistory
+from .agents.weather_context_agent import WeatherContextAgent
 
 app = Flask(__name__)
 CORS(app)
@@ -35,59 +48,43 @@ app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=8)
 # Initialize orchestrator
 orchestrator = SecuriSiteOrchestrator()
 
-def load_users():
-    """Load user credentials from TOML file"""
-    users_file = project_root / "users.toml"
-    if users_file.exists():
-        try:
-            return toml.load(users_file)
-        except Exception as e:
-            print(f"Error loading users.toml: {e}")
-    return {"users": {}, "config": {"require_authentication": False}}
+# Directory listing of the camera image folders, used to route image requests
+# (cameras of exports added later are registered by the assets watcher)
+IMAGE_MANIFEST = AssetsManifest(project_root / "assets", discover_cameras(project_root / "assets"))
+
+# Reads and indexes assets/weather_info.json (again only if the file changes)
+WEATHER_AGENT = WeatherContextAgent(source=FileWeatherSource(project_root / "assets" / "weather_info.json"))
+
+# users.toml kept in memory (reloaded when it changes), with cached verified sessions
+USER_STORE = UserStore(project_root / "users.toml")
 
 def verify_password(username, password):
-    """Verify user credentials"""
-    users_data = load_users()
-    users = users_data.get("users", {})
-    
-    if username in users:
-        stored_password = users[username].get("password", "")
-        # Simple password comparison (in production, use proper hashing)
-        return stored_password == password
-    return False
+    """Verify user credentials (salted hash, constant-time comparison)"""
+    return USER_STORE.verify_password(username, password)
 
 def get_user_info(username):
-    """Get user information"""
-    users_data = load_users()
-    users = users_data.get("users", {})
-    
-    if username in users:
-        user_data = users[username].copy()
-        user_data["username"] = username
-        return user_data
-    return None
+    """Get user information (never the password hash)"""
+    return USER_STORE.user_info(username)
 
 def require_auth(f):
     """Decorator to require authentication for routes"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        users_data = load_users()
-        require_auth = users_data.get("config", {}).get("require_authentication", False)
-        
-        if not require_auth:
+        if not USER_STORE.require_authentication:
             return f(*args, **kwargs)
             
         if 'username' not in session:
             return redirect(url_for('login'))
             
-        # Check session timeout
-        if 'login_time' in session:
-            timeout_minutes = users_data.get("config", {}).get("session_timeout_minutes", 480)
-            login_time = datetime.fromisoformat(session['login_time'])
-            if datetime.now() - login_time > timedelta(minutes=timeout_minutes):
-                session.clear()
-                flash('Session expirée. Veuillez vous reconnecter.', 'warning')
-                return redirect(url_for('login'))
+        # Check that the user still exists and the session has not timed out
+        expiry = USER_STORE.session_expiry(session['username'], session.get('login_time'))
+        if expiry is None:
+            session.clear()
+            return redirect(url_for('login'))
+        if datetime.now() > expiry:
+            session.clear()
+            flash('Session expirée. Veuillez vous reconnecter.', 'warning')
+            return redirect(url_for('login'))
         
         return f(*args, **kwargs)
     return decorated_function
@@ -95,10 +92,7 @@ def require_auth(f):
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     """Login page and authentication"""
-    users_data = load_users()
-    require_auth = users_data.get("config", {}).get("require_authentication", False)
-    
-    if not require_auth:
+    if not USER_STORE.require_authentication:
         # If authentication is disabled, redirect to dashboard
         return redirect(url_for('dashboard'))
     
@@ -132,34 +126,27 @@ def logout():
 def load_real_data():
     """Load real data from assets folder"""
     try:
-        # Load EST-1 data
-        est1_path = project_root / "assets" / "images_EST-1.json"
-        est2_path = project_root / "assets" / "images_EST-2.json"
-        weather_path = project_root / "assets" / "weather_info.json"
-        
         all_images = {}
         
-        if est1_path.exists():
-            with open(est1_path, 'r', encoding='utf-8') as f:
-                est1_data = json.load(f)
-                all_images.update(est1_data.get('images', {}))
-        
-        if est2_path.exists():
-            with open(est2_path, 'r', encoding='utf-8') as f:
-                est2_data = json.load(f)
-                all_images.update(est2_data.get('images', {}))
-        
-        weather_data = {}
-        if weather_path.exists():
-            with open(weather_path, 'r', encoding='utf-8') as f:
-                weather_data = json.load(f)
+        # Every camera export (EST-1, EST-2 and any other images_<camera>.json)
+        for camera in discover_cameras(project_root / "assets"):
+            export_path = project_root / "assets" / f"images_{camera}.json"
+            if export_path.exists():
+                with open(export_path, 'r', encoding='utf-8') as f:
+                    all_images.update(json.load(f).get('images', {}))
         
-        return all_images, weather_data
+        return all_images, load_weather_data()
     except Exception as e:
         print(f"Error loading real data: {e}")
         return {}, {}
 
-def analyze_real_risks(images_data, weather_data):
+def load_weather_data():
+    """Load weather data from assets folder"""
+    if not WEATHER_AGENT.weather_source.path.exists():
+        return {}
+    return WEATHER_AGENT.weather_source.load()
+
+def analyze_real_risks(images_data, weather_table):
     """Analyze real risks from actual detection data"""
     risks = []
     
@@ -180,14 +167,14 @@ def analyze_real_risks(images_data, weather_data):
             continue
         
         # Analyze detections for safety risks
-        risk_analysis = analyze_detections_for_risks(detections, image_filename, timestamp, photo_id, weather_data)
+        risk_analysis = analyze_detections_for_risks(detections, image_filename, timestamp, photo_id, weather_table)
         
         if risk_analysis:
             risks.extend(risk_analysis)
     
     return risks
 
-def analyze_detections_for_risks(detections, image_filename, timestamp, photo_id, weather_data):
+def analyze_detections_for_risks(detections, image_filename, timestamp, photo_id, weather_table):
     """Analyze detections and create risk assessments"""
     risks = []
     
@@ -201,6 +188,7 @@ def analyze_detections_for_risks(detections, image_filename, timestamp, photo_id
     date_str = dt.strftime("%Y-%m-%d")
     time_str = dt.strftime("%H:%M")
     risk_id_base = f"risk_{photo_id}"
+    weather = get_weather_for_hour(weather_table, date_str, dt.hour)
     
     # Risk 1: Person without PPE
     for i, person in enumerate(persons):
@@ -211,13 +199,14 @@ def analyze_detections_for_risks(detections, image_filename, timestamp, photo_id
             severity = min(int(no_ppe * 10), 9)
             risks.append({
                 "id": f"{risk_id_base}_ppe_{i}",
+                "risk_type": "person_without_ppe",
                 "title": "Absence d'EPI - Casque",
                 "severity": severity,
                 "location": "Zone de construction active",
                 "timestamp": f"{date_str} {time_str}",
                 "image_path": image_filename,
                 "description": f"Personne détectée sans équipement de protection individuelle (casque de sécurité). Confiance de détection: {no_ppe:.1%}",
-                "weather": get_weather_for_date(date_str, weather_data),
+                "weather": weather,
                 "regulation": {
                     "reference": "Code du Travail, Art. R4534-1",
                     "rule": "Le port du casque de protection est obligatoire sur tous les chantiers."
@@ -256,13 +245,14 @@ def analyze_detections_for_risks(detections, image_filename, timestamp, photo_id
             if crane_risk:
                 risks.append({
                     "id": f"{risk_id_base}_crane_{i}",
+                    "risk_type": "crane_near_people",
                     "title": "Proximité dangereuse avec grue",
                     "severity": 7,
                     "location": "Zone de grutage",
                     "timestamp": f"{date_str} {time_str}",
                     "image_path": image_filename,
                     "description": f"Personnel détecté dans la zone d'évolution de la grue. {len(proximity_persons)} personne(s) concernée(s).",
-                    "weather": get_weather_for_date(date_str, weather_data),
+                    "weather": weather,
                     "regulation": {
                         "reference": "Code du Travail, Art. R4323-55",
                         "rule": "Une distance de sécurité doit être respectée autour des engins en mouvement."
@@ -307,13 +297,14 @@ def analyze_detections_for_risks(detections, image_filename, timestamp, photo_id
             if proximity_persons:
                 risks.append({
                     "id": f"{risk_id_base}_excavator_{i}",
+                    "risk_type": "excavator_near_people",
                     "title": "Proximité dangereuse avec excavatrice",
                     "severity": 8,
                     "location": "Zone d'excavation",
                     "timestamp": f"{date_str} {time_str}",
                     "image_path": image_filename,
                     "description": f"Personnel détecté à proximité immédiate de l'excavatrice en fonctionnement. {len(proximity_persons)} personne(s) à risque.",
-                    "weather": get_weather_for_date(date_str, weather_data),
+                    "weather": weather,
                     "regulation": {
                         "reference": "Code du Travail, Art. R4323-55",
                         "rule": "Une distance de sécurité doit être respectée autour des engins en mouvement."
@@ -340,142 +331,661 @@ def analyze_detections_for_risks(detections, image_filename, timestamp, photo_id
     
     return risks
 
-def get_weather_for_date(date_str, weather_data):
-    """Get weather information for a specific date"""
-    # Simple weather simulation based on date
-    import random
-    random.seed(hash(date_str))
+# Shown when weather_info.json has nothing for the day or hour
+UNAVAILABLE_WEATHER = {
+    "condition": "Données indisponibles",
+    "wind": "—",
+    "visibility": "—"
+}
+
+def describe_weather(observation):
+    """Display form of a weather observation (conditions, wind, visibility)"""
+    precipitation = observation.get('precipitation', 0) or 0
+    wind_speed = observation.get('wind_speed', 0) or 0
+    visibility = observation.get('visibility', 10000)
     
-    conditions = ["Ensoleillé", "Nuageux", "Pluie légère", "Vent fort"]
-    condition = random.choice(conditions)
-    wind_speed = random.randint(5, 40)
+    if observation.get('condition'):
+        condition = observation['condition']
+    elif precipitation > 5:
+        condition = "Pluie forte"
+    elif precipitation > 0:
+        condition = "Pluie légère"
+    elif wind_speed > 25:
+        condition = "Vent fort"
+    elif visibility < 1000:
+        condition = "Brouillard"
+    else:
+        condition = "Temps sec"
     
-    if condition == "Pluie légère":
-        visibility = "Réduite"
-    elif condition == "Vent fort":
-        visibility = "Bonne"
+    if visibility < 1000:
+        visibility_label = "Mauvaise"
+    elif visibility < 5000:
+        visibility_label = "Réduite"
+    elif visibility < 8000:
+        visibility_label = "Bonne"
     else:
-        visibility = "Excellente"
+        visibility_label = "Excellente"
     
     return {
         "condition": condition,
-        "wind": f"{wind_speed} km/h",
-        "visibility": visibility
+        "wind": f"{round(wind_speed)} km/h",
+        "visibility": visibility_label
     }
 
+def build_weather_table(weather_data):
+    """
+    Per-day list of 24 hourly display dicts, computed once per data load.
+    Hours covered by the same observation share one dict; treat it as read-only.
+    """
+    displays = {}
+    table = {}
+    for day, observations in WEATHER_AGENT.hourly_weather_table(weather_data).items():
+        hours = []
+        for observation in observations:
+            if observation is None:
+                # No observation close enough to this hour
+                hours.append(UNAVAILABLE_WEATHER)
+                continue
+            display = displays.get(id(observation))
+            if display is None:
+                display = displays[id(observation)] = describe_weather(observation)
+            hours.append(display)
+        table[day] = hours
+    return table
+
+def get_weather_for_hour(weather_table, date_str, hour):
+    """Shared weather entry for a date and hour (not a copy)"""
+    hours = weather_table.get(date_str)
+    return hours[hour] if hours else UNAVAILABLE_WEATHER
+
+# Optional SQLite store (SECURISITE_DB=path): routes query it instead of in-memory lists
+DB_PATH = os.getenv('SECURISITE_DB')
+RISK_STORE = SecuriSiteStore(Path(DB_PATH)) if DB_PATH else None
+
 # Load real data on startup
 try:
-    REAL_IMAGES_DATA, WEATHER_DATA = load_real_data()
-    REAL_RISKS = analyze_real_risks(REAL_IMAGES_DATA, WEATHER_DATA)
+    if RISK_STORE is not None and RISK_STORE.count_images():
+        # Already built by another worker or a previous run; exports modified
+        # since then are ingested once ingest_images is defined (see below)
+        WEATHER_DATA = load_weather_data()
+        WEATHER_TABLE = build_weather_table(WEATHER_DATA)
+    else:
+        REAL_IMAGES_DATA, WEATHER_DATA = load_real_data()
+        WEATHER_TABLE = build_weather_table(WEATHER_DATA)
+        REAL_RISKS = analyze_real_risks(REAL_IMAGES_DATA, WEATHER_TABLE)
+        if RISK_STORE is not None:
+            RISK_STORE.import_assets(project_root / "assets", discover_cameras(project_root / "assets"))
+            RISK_STORE.upsert_risks(REAL_RISKS)
+    if RISK_STORE is not None:
+        # Keep only read-through views; the working set stays on disk
+        REAL_IMAGES_DATA, REAL_RISKS = RISK_STORE.records, []
+    total_risks = RISK_STORE.count_risks() if RISK_STORE is not None else len(REAL_RISKS)
     print("🔍 Données chargées:")
     print(f"  • {len(REAL_IMAGES_DATA)} images analysées")
-    print(f"  • {len(REAL_RISKS)} risques détectés")
-    print(f"  • Sources: EST-1, EST-2")
+    print(f"  • {total_risks} risques détectés")
+    print(f"  • Sources: {', '.join(IMAGE_MANIFEST.cameras)}")
 except Exception as e:
     print(f"❌ Erreur lors du chargement des données: {e}")
-    REAL_IMAGES_DATA, WEATHER_DATA = {}, {}
+    REAL_IMAGES_DATA, WEATHER_DATA, WEATHER_TABLE = {}, {}, {}
     REAL_RISKS = []
 
+# Serializes updates of REAL_IMAGES_DATA / REAL_RISKS made by the watcher
+DATA_LOCK = threading.Lock()
+
+# Risks by id and by day with per-day aggregates, rebuilt whenever REAL_RISKS changes
+RISK_INDEX = RiskIndex(REAL_RISKS)
+
+# Serialized dashboard and API bodies per (route, arguments), dropped whenever the data changes
+RESPONSE_CACHE = ResponseCache()
+
+def image_camera(image_name, cameras=None):
+    """Camera of an image: the images_<camera>.json it came from, else its directory"""
+    if cameras and image_name in cameras:
+        return cameras[image_name]
+    located = IMAGE_MANIFEST.locate(image_name)
+    return located[0] if located else None
+
+def ingest_images(new_images, cameras=None):
+    """
+    Analyze new or changed image records and merge them into the in-memory data.
+    cameras maps each filename to the camera export it was read from.
+    """
+    new_risks = analyze_real_risks(new_images, WEATHER_TABLE)
+    
+    if RISK_STORE is not None:
+        by_camera = {}
+        for name, record in new_images.items():
+            by_camera.setdefault(image_camera(name, cameras) or 'unknown', {})[name] = record
+        for camera, records in by_camera.items():
+            RISK_STORE.upsert_records(camera, records.items())
+        previous_ids = RISK_STORE.risk_ids_for_images(new_images)
+        RISK_STORE.replace_risks_for_images(new_images, new_risks)
+        RESPONSE_CACHE.invalidate()
+        reschedule_inspections(previous_ids, new_risks, cameras)
+        print(f"🔄 {len(new_images)} image(s) intégrée(s), {len(new_risks)} nouveau(x) risque(s)")
+        return
+    
+    with DATA_LOCK:
+        changed = {name for name in new_images if name in REAL_IMAGES_DATA}
+        previous_ids = []
+        if changed:
+            # Drop risks computed from the previous version of these images
+            previous_ids = [r['id'] for r in REAL_RISKS if r['image_path'] in changed]
+            REAL_RISKS[:] = [r for r in REAL_RISKS if r['image_path'] not in changed]
+        REAL_IMAGES_DATA.update(new_images)
+        REAL_RISKS.extend(new_risks)
+        RISK_INDEX.rebuild(REAL_RISKS)
+        RESPONSE_CACHE.invalidate()
+    reschedule_inspections(previous_ids, new_risks, cameras)
+    
+    print(f"🔄 {len(new_images)} image(s) intégrée(s), {len(new_risks)} nouveau(x) risque(s)")
+
+def remove_images(removed):
+    """Drop images that no camera export lists any more, with their risks and inspections"""
+    if RISK_STORE is not None:
+        removed_ids = RISK_STORE.risk_ids_for_images(removed)
+        RISK_STORE.delete_images(removed)
+    else:
+        with DATA_LOCK:
+            removed_ids = [r['id'] for r in REAL_RISKS if r['image_path'] in removed]
+            REAL_RISKS[:] = [r for r in REAL_RISKS if r['image_path'] not in removed]
+            for name in removed:
+                REAL_IMAGES_DATA.pop(name, None)
+            RISK_INDEX.rebuild(REAL_RISKS)
+    RESPONSE_CACHE.invalidate()
+    for risk_id in removed_ids:
+        INSPECTIONS.discard(risk_id)
+    print(f"🗑️  {len(removed)} image(s) retirée(s), {len(removed_ids)} risque(s) supprimé(s)")
+
+def weather_for_risk(risk):
+    """Hourly weather display of a risk ("YYYY-MM-DD HH:MM" timestamp)"""
+    return get_weather_for_hour(WEATHER_TABLE, risk['timestamp'][:10], int(risk['timestamp'][11:13]))
+
+def reload_weather():
+    """weather_info.json changed: rebuild the hourly table, the risks' weather and the risk windows"""
+    global WEATHER_DATA, WEATHER_TABLE
+    weather_data = load_weather_data()
+    weather_table = build_weather_table(weather_data)
+    with DATA_LOCK:
+        WEATHER_DATA, WEATHER_TABLE = weather_data, weather_table
+        if RISK_STORE is not None:
+            # Rewritten one page at a time: the store's risks are never all in memory
+            for batch in RISK_STORE.iter_risk_batches():
+                RISK_STORE.update_risks(dict(risk, weather=weather_for_risk(risk)) for risk in batch)
+        else:
+            REAL_RISKS[:] = [dict(risk, weather=weather_for_risk(risk)) for risk in REAL_RISKS]
+            RISK_INDEX.rebuild(REAL_RISKS)
+        RESPONSE_CACHE.invalidate()
+    refresh_risk_windows()
+    print(f"🌦️  Météo rechargée: {len(weather_table)} jour(s) couverts")
+
+# Watch mode: poll the assets folder every SECURISITE_WATCH_INTERVAL seconds (0 = off)
+WATCH_INTERVAL = float(os.getenv('SECURISITE_WATCH_INTERVAL', '0'))
+ASSETS_WATCHER = AssetsWatcher(project_root / "assets", REAL_IMAGES_DATA, ingest_images,
+                               manifest=IMAGE_MANIFEST, interval=WATCH_INTERVAL, on_remove=remove_images)
+ASSETS_WATCHER.watch_file(WEATHER_AGENT.weather_source.path, reload_weather)
+if WATCH_INTERVAL > 0:
+    ASSETS_WATCHER.start()
+
+# Annotated/resized images (thumbnail, tablet, full) rendered server-side, cached on disk
+ANNOTATED_IMAGES = AnnotatedImageCache(
+    Path(os.getenv('SECURISITE_IMAGE_CACHE', project_root / "data" / "image_cache")),
+    max_bytes=int(os.getenv('SECURISITE_IMAGE_CACHE_MB', '256')) * 1024 * 1024)
+IMAGE_MAX_AGE = 7 * 24 * 3600
+
+# PDF exports rendered by a process pool, cached on disk by report content hash
+PDF_EXPORTS = PdfExportPool(Path(os.getenv('SECURISITE_PDF_CACHE', project_root / "data" / "pdf_cache")),
+                            max_workers=int(os.getenv('SECURISITE_PDF_WORKERS', '0')) or None)
+
+# Weather risk windows (e.g. crane stoppage for high wind), computed off the request path
+SITE_NAME = os.getenv('SECURISITE_SITE', 'chantier')
+RISK_WINDOWS = RiskWindowIndex()
+orchestrator.regulation_agent.weather_windows = RISK_WINDOWS
+
+# Day-over-day report snapshots, shared by every worker
+orchestrator.report_agent.history = ReportHistory(
+    Path(os.getenv('SECURISITE_REPORT_HISTORY', project_root / "data" / "report_history")))
+
+def refresh_risk_windows():
+    """Recompute the weather risk windows of the site from the loaded weather series"""
+    try:
+        RISK_WINDOWS.replace_site(SITE_NAME, WEATHER_AGENT.compute_risk_windows(WEATHER_DATA, SITE_NAME))
+        # The dashboard shows the windows
+        RESPONSE_CACHE.invalidate()
+    except Exception as e:
+        print(f"❌ Erreur lors du calcul des fenêtres météo: {e}")
+
+threading.Thread(target=refresh_risk_windows, name="risk-windows", daemon=True).start()
+
+# Open violations of every camera, ordered by inspection deadline then priority.
+# With the SQLite store they live in the database: every worker sees the same
+# queue and acknowledged violations stay closed across restarts
+if RISK_STORE is not None:
+    orchestrator.regulation_agent.inspection_scheduler = RISK_STORE.inspections
+INSPECTIONS = orchestrator.regulation_agent.inspection_scheduler
+
+def schedule_risk_inspections(risks, cameras=None):
+    """Queue an inspection for each risk, due its weather-adjusted ITV after detection"""
+    by_image = {}
+    for risk in risks:
+        by_image.setdefault(risk['image_path'], []).append(risk)
+    for image_name, image_risks in by_image.items():
+        detected_at = datetime.strptime(image_risks[0]['timestamp'], "%Y-%m-%d %H:%M")
+        orchestrator.regulation_agent.schedule_inspections(
+            image_risks, detected_at, WEATHER_AGENT._get_weather_for_time(detected_at, WEATHER_DATA),
+            site=SITE_NAME, camera=image_camera(image_name, cameras))
+
+def reschedule_inspections(previous_ids, new_risks, cameras=None):
+    """Close inspections of risks that disappeared on re-analysis, queue the new ones"""
+    new_ids = {risk['id'] for risk in new_risks}
+    for risk_id in previous_ids:
+        if risk_id not in new_ids:
+            INSPECTIONS.discard(risk_id)
+    schedule_risk_inspections(new_risks, cameras)
+
+if RISK_STORE is not None:
+    # One page of risks at a time: workers never hold the whole store in memory
+    for risk_batch in RISK_STORE.iter_risk_batches():
+        schedule_risk_inspections(risk_batch)
+    # Exports written while the server was stopped
+    try:
+        assets_dir = project_root / "assets"
+        new_images, new_cameras, export_signatures = RISK_STORE.export_changes(
+            assets_dir, discover_cameras(assets_dir))
+        if new_images:
+            ingest_images(new_images, new_cameras)
+        RISK_STORE.mark_exports(export_signatures)
+    except Exception as e:
+        print(f"❌ Erreur lors de l'intégration des nouveaux exports: {e}")
+else:
+    schedule_risk_inspections(REAL_RISKS)
+
+def weather_windows_for_date(date_str):
+    """Weather risk windows overlapping a YYYY-MM-DD day"""
+    try:
+        return RISK_WINDOWS.overlapping(f"{date_str}T00:00:00", f"{date_str}T23:59:59")
+    except ValueError:
+        return []
+
+def risks_for_date(date_str):
+    """Risks whose timestamp starts with date_str"""
+    if RISK_STORE is not None:
+        return RISK_STORE.risks_for_date(date_str)
+    return RISK_INDEX.for_date(date_str)
+
+def day_summary(date_str):
+    """Risk count, global score (mean severity), level and color of a day"""
+    if RISK_STORE is not None:
+        return summarize(RISK_STORE.risks_for_date(date_str))
+    return RISK_INDEX.summary(date_str)
+
+def find_risk(risk_id):
+    """Risk by id, or None"""
+    if RISK_STORE is not None:
+        return RISK_STORE.get_risk(risk_id)
+    return RISK_INDEX.get(risk_id)
+
+def json_body(payload):
+    response = jsonify(payload)
+    return CachedBody(response.get_data(), response.content_type)
+
+def cached_response(key, render):
+    """
+    Response of a read-only route served from RESPONSE_CACHE with ETag and
+    Last-Modified; a client already holding the current data version gets
+    a 304 before anything is rendered
+    """
+    version = RESPONSE_CACHE.version
+    etag = RESPONSE_CACHE.etag(key, version)
+    last_modified = RESPONSE_CACHE.last_modified
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        RESPONSE_CACHE.stats["not_modified"] += 1
+        response = Response(status=304)
+    else:
+        cached, version = RESPONSE_CACHE.get(key, render)
+        response = Response(cached.body, content_type=cached.content_type)
+        etag = RESPONSE_CACHE.etag(key, version)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # Behind authentication: browser cache only, revalidated on every poll
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 @app.route('/')
 @require_auth
 def dashboard():
     """Dashboard page showing risk overview"""
     selected_date = request.args.get('date', datetime.now().strftime("%Y-%m-%d"))
     
-    # Filter risks by date
-    filtered_risks = [r for r in REAL_RISKS if r['timestamp'].startswith(selected_date)]
-    
-    # Calculate global risk score
-    if filtered_risks:
-        global_score = sum(r['severity'] for r in filtered_risks) / len(filtered_risks)
-        risk_level = "RISQUE ÉLEVÉ" if global_score >= 7 else "RISQUE MODÉRÉ" if global_score >= 5 else "RISQUE FAIBLE"
-        risk_color = "#D32F2F" if global_score >= 7 else "#F57C00" if global_score >= 5 else "#388E3C"
-    else:
-        global_score = 2.0  # Default low risk
-        risk_level = "AUCUN RISQUE"
-        risk_color = "#388E3C"
-    
-    # Format date display
-    try:
-        current_date_display = datetime.strptime(selected_date, "%Y-%m-%d").strftime("%d %B %Y")
-    except:
-        current_date_display = selected_date
-    
     # Get current user info
     user_info = session.get('user_info', {})
     user_display_name = user_info.get('full_name', 'Utilisateur')
     
-    return render_template('dashboard.html', 
-                         risks=filtered_risks,
-                         risk_score=round(global_score, 1),
-                         risk_level=risk_level,
-                         risk_color=risk_color,
-                         selected_date=selected_date,
-                         current_date_display=current_date_display,
-                         current_date=selected_date,
-                         user_name=user_display_name)
+    def render():
+        # Filter risks by date (indexed), with the day's precomputed global score
+        filtered_risks = risks_for_date(selected_date)
+        summary = day_summary(selected_date)
+        
+        # Format date display
+        try:
+            current_date_display = datetime.strptime(selected_date, "%Y-%m-%d").strftime("%d %B %Y")
+        except:
+            current_date_display = selected_date
+        
+        html = render_template('dashboard.html', 
+                               risks=filtered_risks,
+                               risk_score=round(summary.mean_severity, 1),
+                               risk_level=summary.level,
+                               risk_color=summary.color,
+                               selected_date=selected_date,
+                               current_date_display=current_date_display,
+                               current_date=selected_date,
+                               weather_windows=weather_windows_for_date(selected_date),
+                               user_name=user_display_name)
+        return CachedBody(html.encode('utf-8'), 'text/html; charset=utf-8')
+    
+    return cached_response(('dashboard', selected_date, user_display_name), render)
 
 @app.route('/risk/<risk_id>')
 @require_auth
 def risk_detail(risk_id):
     """Risk detail page"""
     # Find the specific risk
-    risk = None
-    for r in REAL_RISKS:
-        if r['id'] == risk_id:
-            risk = r
-            break
+    risk = find_risk(risk_id)
     
     if not risk:
         return "Risk not found", 404
     
     return render_template('risk_detail.html', risk=risk)
 
+def send_rendition(image_name, annotations, size):
+    """
+    Cached rendering of an image; the ETag is its content address, so
+    tablets revalidate with a 304 and re-download only changed images
+    """
+    located = IMAGE_MANIFEST.locate(image_name)
+    if not located:
+        return "Image not found", 404
+    try:
+        path = ANNOTATED_IMAGES.get(located[1], annotations, size)
+    except ValueError:
+        return "Unknown image size", 400
+    if path is None:
+        return "Image not found", 404
+    response = send_file(str(path), mimetype='image/jpeg', etag=path.stem,
+                         max_age=IMAGE_MAX_AGE, conditional=True)
+    # Behind authentication: browser cache only, never shared proxies
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
 @app.route('/api/images/<image_name>')
 @require_auth
 def serve_image(image_name):
-    """Serve images from assets folder"""
-    # Try EST-1 first, then EST-2
-    for camera in ['EST-1', 'EST-2']:
-        image_path = project_root / "assets" / f"images_{camera}" / image_name
-        if image_path.exists():
-            return send_file(str(image_path))
+    """Serve images from assets folder (?size=thumbnail|tablet|full: resized copy)"""
+    size = request.args.get('size')
+    if size:
+        return send_rendition(image_name, [], size)
+    # Route through the manifest (EST-1 first, then EST-2) instead of probing the disk
+    located = IMAGE_MANIFEST.locate(image_name)
+    if located:
+        _, image_path = located
+        return send_file(str(image_path))
     
     return "Image not found", 404
 
+@app.route('/api/risk/<risk_id>/image')
+@require_auth
+def risk_image(risk_id):
+    """Image of a risk with its annotations drawn, ?size=thumbnail|tablet|full (default tablet)"""
+    risk = find_risk(risk_id)
+    if not risk:
+        return "Risk not found", 404
+    return send_rendition(risk['image_path'], risk.get('annotations', []), request.args.get('size', 'tablet'))
+
+# Risks per page of /api/report/latest
+REPORT_PAGE_SIZE = 50
+REPORT_MAX_PAGE_SIZE = 200
+
+def report_summary(date_str):
+    """Compact view of a day: score, level and risk counts, without the risks themselves"""
+    filtered_risks = risks_for_date(date_str)
+    summary = day_summary(date_str)
+    by_level = {"high": 0, "moderate": 0, "low": 0}
+    by_type = {}
+    for risk in filtered_risks:
+        by_level["high" if risk['severity'] >= 7 else "moderate" if risk['severity'] >= 5 else "low"] += 1
+        by_type[risk['risk_type']] = by_type.get(risk['risk_type'], 0) + 1
+    return {
+        "global_score": round(summary.mean_severity, 1),
+        "risk_level": summary.level,
+        "risk_color": summary.color,
+        "total_risks": len(filtered_risks),
+        "max_severity": max((r['severity'] for r in filtered_risks), default=0),
+        "by_level": by_level,
+        "by_type": by_type,
+        "analysis_date": date_str
+    }
+
 @app.route('/api/report/latest')
 @require_auth
 def latest_report():
-    """API endpoint for latest risk report"""
+    """
+    API endpoint for latest risk report, one page at a time:
+    ?limit= (default 50, max 200), ?order=severity|time (most severe / most
+    recent first), ?cursor= (next_cursor of the previous page), ?fields=id,title,...
+    (only these risk fields), ?summary=1 (counts only, no risks)
+    """
     selected_date = request.args.get('date', datetime.now().strftime("%Y-%m-%d"))
-    filtered_risks = [r for r in REAL_RISKS if r['timestamp'].startswith(selected_date)]
+    if request.args.get('summary', '').lower() in ('1', 'true', 'yes'):
+        return cached_response(('report-summary', selected_date), lambda: json_body(report_summary(selected_date)))
     
-    if filtered_risks:
-        global_score = sum(r['severity'] for r in filtered_risks) / len(filtered_risks)
-    else:
-        global_score = 2.0
+    order = request.args.get('order', 'severity')
+    cursor = request.args.get('cursor') or None
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    try:
+        limit = int(request.args.get('limit', REPORT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if not 1 <= limit <= REPORT_MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {REPORT_MAX_PAGE_SIZE}"}), 400
+    if order not in PAGE_ORDERS:
+        return jsonify({"error": f"order must be one of {', '.join(PAGE_ORDERS)}"}), 400
+    if cursor:
+        try:
+            decode_cursor(cursor, order)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
     
+    def render():
+        filtered_risks = risks_for_date(selected_date)
+        page = page_risks(filtered_risks, order=order, limit=limit, cursor=cursor)
+        return json_body({
+            "global_score": round(day_summary(selected_date).mean_severity, 1),
+            "total_risks": len(filtered_risks),
+            "risks": [project(risk, fields) for risk in page.risks],
+            "next_cursor": page.next_cursor,
+            "order": order,
+            "analysis_date": selected_date
+        })
+    
+    return cached_response(('report', selected_date, order, limit, cursor, tuple(fields)), render)
+
+def report_data_for_risks(risks, date_str, site=None):
+    """
+    Report agent input (cv, weather, regulatory) built from web risks of one day;
+    with a site, the report is compared with the site's previous day
+    """
+    by_image = {}
+    for risk in risks:
+        by_image.setdefault(risk['image_path'], []).append(risk)
+    batch = []
+    for image_name, image_risks in by_image.items():
+        detected_at = datetime.strptime(image_risks[0]['timestamp'], "%Y-%m-%d %H:%M")
+        located = IMAGE_MANIFEST.locate(image_name)
+        batch.append({
+            "risks": image_risks,
+            "timestamp": detected_at.isoformat(),
+            "weather_conditions": WEATHER_AGENT._get_weather_for_time(detected_at, WEATHER_DATA),
+            "site": SITE_NAME,
+            "camera": located[0] if located else None
+        })
+    regulatory = asyncio.run(orchestrator.regulation_agent.process_site(batch))
+    noon = f"{date_str}T12:00:00"
+    weather = WEATHER_AGENT._get_weather_for_time(noon, WEATHER_DATA) if WEATHER_DATA else {}
+    return {
+        "cv_analysis": {
+            "risk_scores": [
+                {**risk, "area": risk['location'], "image_id": risk['image_path'], "equipment_involved": []}
+                for risk in risks
+            ],
+            "image_analysis": by_image
+        },
+        "weather_context": {
+            "weather_conditions": weather,
+            "risk_modifiers": WEATHER_AGENT._assess_weather_risks(weather) if weather else []
+        },
+        "regulatory_analysis": regulatory,
+        "site": site,
+        "report_date": date_str
+    }
+
+@app.route('/api/report/markdown')
+@require_auth
+def download_report():
+    """Markdown report of ?date=, streamed to the client as it is rendered"""
+    selected_date = request.args.get('date', datetime.now().strftime("%Y-%m-%d"))
+    chunks = orchestrator.report_agent.stream(
+        report_data_for_risks(risks_for_date(selected_date), selected_date, site=SITE_NAME))
+    return Response(stream_with_context(chunks), mimetype='text/markdown; charset=utf-8', headers={
+        "Content-Disposition": f'attachment; filename="securisite_report_{selected_date}.md"'
+    })
+
+def report_images(risks):
+    """Annotated image entries of a PDF export, one per risk"""
+    images = []
+    for risk in risks:
+        located = IMAGE_MANIFEST.locate(risk['image_path'])
+        if located:
+            images.append({
+                "path": located[1],
+                "annotations": risk.get('annotations', []),
+                "caption": f"{risk.get('title', risk['risk_type'])} - {risk['image_path']} ({risk['timestamp']})"
+            })
+    return images
+
+def export_pdf(risks, date_str, title, site=None):
+    """
+    Queue the PDF of a report over risks (no-op if already rendered or queued).
+    Site reports show the changes since the previous report, which is part of
+    the content key; exporting does not add the report to the site's history.
+    """
+    images = report_images(risks)
+    previous = orchestrator.report_agent.history.previous(site, date_str) if site is not None else None
+    key = content_key(title, risks, [image_fingerprint(image['path']) for image in images], previous)
+    status = PDF_EXPORTS.status(key)
+    if status is None or status['status'] == 'failed':
+        markdown_text = ''.join(orchestrator.report_agent.stream(report_data_for_risks(risks, date_str, site=site),
+                                                                 remember=False))
+        status = PDF_EXPORTS.submit(key, markdown_text, images, title=title)
+    return pdf_job_response(status)
+
+def pdf_job_response(status):
+    """Job status with its polling and download URLs; 202 until the PDF is ready"""
+    body = dict(status,
+                status_url=url_for('pdf_export_status', job_id=status['job_id']),
+                download_url=url_for('download_pdf_export', job_id=status['job_id']))
+    return jsonify(body), 200 if status['status'] in ('done', 'failed') else 202
+
+@app.route('/api/risk/<risk_id>/export-pdf')
+@require_auth
+def export_risk_pdf(risk_id):
+    """Start (or look up) the PDF export of one risk"""
+    risk = find_risk(risk_id)
+    if not risk:
+        return jsonify({"error": "Risk not found"}), 404
+    return export_pdf([risk], risk['timestamp'][:10], f"SecuriSite - {risk.get('title', risk_id)}")
+
+@app.route('/api/report/pdf')
+@require_auth
+def export_report_pdf():
+    """Start (or look up) the PDF export of the ?date= report"""
+    selected_date = request.args.get('date', datetime.now().strftime("%Y-%m-%d"))
+    return export_pdf(risks_for_date(selected_date), selected_date, f"SecuriSite - Rapport du {selected_date}",
+                      site=SITE_NAME)
+
+@app.route('/api/export/<job_id>')
+@require_auth
+def pdf_export_status(job_id):
+    """Status of a PDF export job"""
+    status = PDF_EXPORTS.status(job_id)
+    if status is None:
+        return jsonify({"error": "Export not found"}), 404
+    return pdf_job_response(status)
+
+@app.route('/api/export/<job_id>/pdf')
+@require_auth
+def download_pdf_export(job_id):
+    """Rendered PDF of an export job"""
+    status = PDF_EXPORTS.status(job_id)
+    if status is None or status['status'] != 'done':
+        return jsonify({"error": "Export not ready"}), 404
+    return send_file(str(PDF_EXPORTS.pdf_path(job_id)), mimetype='application/pdf',
+                     download_name=f"securisite_{job_id[:12]}.pdf")
+
+@app.route('/api/weather/windows')
+@require_auth
+def api_weather_windows():
+    """Weather risk windows active at ?start= or overlapping ?start=&end="""
+    start = request.args.get('start', datetime.now().isoformat(timespec='seconds'))
+    try:
+        windows = RISK_WINDOWS.overlapping(start, request.args.get('end'),
+                                           site=request.args.get('site'),
+                                           factor=request.args.get('factor'))
+    except ValueError:
+        return jsonify({"error": "Invalid start/end timestamp"}), 400
+    return jsonify({"windows": [w.to_dict() for w in windows]})
+
+@app.route('/api/inspections/due')
+@require_auth
+def api_inspections_due():
+    """Inspections due within ?hours= (default 24) of ?now= (default: current time)"""
+    try:
+        hours = float(request.args.get('hours', 24))
+        now = datetime.fromisoformat(request.args['now']) if 'now' in request.args else None
+    except ValueError:
+        return jsonify({"error": "Invalid hours/now parameter"}), 400
+    due = INSPECTIONS.due_within(hours, now)
+    return jsonify({"total": len(due), "inspections": [i.to_dict() for i in due]})
+
+@app.route('/api/inspections/plan')
+@require_auth
+def api_inspection_plan():
+    """Ordered inspection plan over all open violations (?limit= to truncate)"""
+    try:
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        return jsonify({"error": "Invalid limit parameter"}), 400
     return jsonify({
-        "global_score": round(global_score, 1),
-        "total_risks": len(filtered_risks),
-        "risks": filtered_risks,
-        "analysis_date": selected_date
+        "open_violations": len(INSPECTIONS),
+        "inspections": [i.to_dict() for i in INSPECTIONS.plan(limit)]
     })
 
 @app.route('/api/risk/<risk_id>')
 @require_auth
 def api_risk_detail(risk_id):
     """API endpoint for risk details"""
-    risk = next((r for r in REAL_RISKS if r['id'] == risk_id), None)
+    risk = find_risk(risk_id)
     if not risk:
         return jsonify({"error": "Risk not found"}), 404
-    return jsonify(risk)
+    return cached_response(('risk', risk_id), lambda: json_body(risk))
 
 @app.route('/api/risk/<risk_id>/ack', methods=['POST'])
 @require_auth
 def acknowledge_risk(risk_id):
-    """Mark a risk as acknowledged/treated"""
-    # In a real system, this would update a database
+    """Mark a risk as acknowledged/treated (persisted with the SQLite store)"""
+    INSPECTIONS.complete(risk_id)
     return jsonify({"status": "acknowledged", "risk_id": risk_id})
 
 if __name__ == '__main__':
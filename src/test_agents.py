@@ -23,9 +23,7 @@ class TestAgents(unittest.TestCase):
     def setUp(self):
         """Set up test data from real dataset"""
         self.project_root = Path(__file__).parent.parent
-        self.test_images = data_loader.get_risk_annotated_images()
-        self.test_image = next((img for img in self.test_images 
-                              if img.camera == 'EST-1'), None)
+        self.test_image = next(data_loader.iter_images(camera='EST-1', min_score=0.5), None)
         
         if self.test_image:
             print(f"Test image: {self.test_image.image_id} from {self.test_image.camera}")
@@ -0,0 +1,541 @@
+"""
+Phase 1: Unit & Integration Testing - Step 3
+Data Pipeline Validation (manifests, loader queries, ingestion, risk index)
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+from securisite.utils.image_manifest import AssetsManifest, DirectoryManifest, discover_cameras
+from securisite.utils.data_loader import SecuriSiteDataLoader
+from securisite.utils.asset_watcher import AssetsWatcher
+from securisite.utils import data_preprocessing
+from securisite.utils.inspection_scheduler import Inspection, InspectionScheduler
+from securisite.utils.sqlite_store import SecuriSiteStore
+from securisite.utils.risk_index import RiskIndex, decode_cursor, encode_cursor, page_risks, project
+
+
+def _detection(label, score=0.9, **attributes):
+    """Build a detection record in the camera export format"""
+    detection = {
+        'label': label,
+        'score': score,
+        'bounding_box_start_x': 0.1,
+        'bounding_box_end_x': 0.2,
+        'bounding_box_start_y': 0.1,
+        'bounding_box_end_y': 0.2,
+    }
+    if attributes:
+        detection['attributes'] = attributes
+    return detection
+
+
+class DataPipelineTestCase(unittest.TestCase):
+    """Builds a small throw-away assets directory for each test"""
+
+    def setUp(self):
+        self.project_root = Path(tempfile.mkdtemp())
+        self.assets_dir = self.project_root / 'assets'
+        self.assets_dir.mkdir()
+        self.write_camera('EST-1', {
+            'a.jpg': ('2025:06:10 08:00:00', [_detection('person', no_ppe=0.9)]),
+            'b.jpg': ('2025:06:11 09:30:00', [_detection('tower_crane', 0.4)]),
+            'c.jpg': ('2025:06:11 10:00:00', []),
+        })
+        self.write_camera('EST-2', {
+            'd.jpg': ('2025:06:12 14:15:00', [_detection('excavator', 0.8)]),
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.project_root, ignore_errors=True)
+
+    def write_camera(self, camera, images, create_files=True):
+        """Write images_<camera>.json and touch the listed image files"""
+        images_dir = self.assets_dir / f'images_{camera}'
+        images_dir.mkdir(exist_ok=True)
+        metadata = {'images': {}}
+        for filename, (shooting, detections) in images.items():
+            metadata['images'][filename] = {
+                'photo_id': filename.replace('.jpg', ''),
+                'image_shooting': shooting,
+                'detections': detections,
+            }
+            if create_files:
+                (images_dir / filename).write_bytes(b'\xff\xd8\xff')
+        with open(self.assets_dir / f'images_{camera}.json', 'w', encoding='utf-8') as f:
+            json.dump(metadata, f)
+
+
+class TestImageManifest(DataPipelineTestCase):
+    """Directory manifest used for validation and image routing"""
+
+    def test_manifest_lists_directory(self):
+        manifest = DirectoryManifest(self.assets_dir / 'images_EST-1')
+        self.assertTrue(manifest.exists)
+        self.assertEqual(manifest.files, {'a.jpg', 'b.jpg', 'c.jpg'})
+        self.assertIsNone(manifest.path_for('d.jpg'))
+
+    def test_missing_directory(self):
+        manifest = DirectoryManifest(self.assets_dir / 'images_EST-9')
+        self.assertFalse(manifest.exists)
+        self.assertEqual(len(manifest), 0)
+
+    def test_incremental_refresh(self):
+        manifest = DirectoryManifest(self.assets_dir / 'images_EST-1')
+        images_dir = self.assets_dir / 'images_EST-1'
+        (images_dir / 'e.jpg').write_bytes(b'')
+        (images_dir / 'a.jpg').unlink()
+        # Make sure the directory mtime moves even on coarse-grained filesystems
+        stat = os.stat(images_dir)
+        os.utime(images_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        added, removed = manifest.refresh()
+        self.assertEqual(added, {'e.jpg'})
+        self.assertEqual(removed, {'a.jpg'})
+        self.assertEqual(manifest.refresh(), (set(), set()))
+
+    def test_locate_routes_to_camera(self):
+        manifest = AssetsManifest(self.assets_dir)
+        camera, path = manifest.locate('d.jpg')
+        self.assertEqual(camera, 'EST-2')
+        self.assertEqual(path, self.assets_dir / 'images_EST-2' / 'd.jpg')
+        self.assertIsNone(manifest.locate('../images_EST-1.json'))
+
+    def test_cameras_added_while_locating(self):
+        manifest = AssetsManifest(self.assets_dir)
+        errors = []
+
+        def add_cameras():
+            try:
+                for n in range(300):
+                    manifest.camera(f'EST-{n + 10}')
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=add_cameras)
+        thread.start()
+        while thread.is_alive():
+            self.assertEqual(manifest.locate('d.jpg')[0], 'EST-2')
+            manifest.refresh()
+        thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(manifest.cameras), 302)
+
+    def test_loader_validates_against_manifest(self):
+        (self.assets_dir / 'images_EST-1' / 'c.jpg').unlink()
+        loader = SecuriSiteDataLoader(self.project_root)
+        images = loader.get_image_data()
+        self.assertEqual(len(images), 4)
+        self.assertEqual({img.camera for img in images}, {'EST-1', 'EST-2'})
+
+
+class TestLoaderQueries(DataPipelineTestCase):
+    """Memoized dataset and predicate pushdown in SecuriSiteDataLoader"""
+
+    def setUp(self):
+        super().setUp()
+        self.loader = SecuriSiteDataLoader(self.project_root)
+
+    def ids(self, **predicates):
+        return [img.image_id for img in self.loader.query(**predicates)]
+
+    def test_dataset_is_memoized(self):
+        first = self.loader.get_image_data()
+        second = self.loader.get_image_data()
+        self.assertIs(first[0], second[0])
+
+    def test_changed_metadata_is_reparsed(self):
+        self.loader.get_image_data()
+        self.write_camera('EST-2', {
+            'd.jpg': ('2025:06:12 14:15:00', []),
+            'e.jpg': ('2025:06:13 07:00:00', [_detection('person', no_ppe=0.1)]),
+        })
+        self.assertEqual(self.ids(camera='EST-2'), ['d', 'e'])
+
+    def test_min_confidence_is_applied(self):
+        risky = self.loader.get_risk_annotated_images(min_confidence=0.5)
+        self.assertEqual(sorted(img.image_id for img in risky), ['a', 'd'])
+
+    def test_predicates(self):
+        self.assertEqual(self.ids(camera='EST-1'), ['a', 'b', 'c'])
+        self.assertEqual(self.ids(labels=['tower_crane']), ['b'])
+        self.assertEqual(self.ids(labels=['tower_crane'], min_score=0.5), [])
+        self.assertEqual(self.ids(has_person=True), ['a'])
+        self.assertEqual(self.ids(start_date='2025-06-11', end_date='2025-06-11'), ['b', 'c'])
+        self.assertEqual(self.ids(end_date=datetime(2025, 6, 11, 9, 30)), ['a', 'b'])
+
+
+class TestAssetsWatcher(DataPipelineTestCase):
+    """Polling ingestion of new and changed image records"""
+
+    def setUp(self):
+        super().setUp()
+        self.images = {}
+        for camera in ('EST-1', 'EST-2'):
+            with open(self.assets_dir / f'images_{camera}.json', encoding='utf-8') as f:
+                self.images.update(json.load(f)['images'])
+        self.batches = []
+        self.removed = []
+        self.manifest = AssetsManifest(self.assets_dir)
+        self.watcher = AssetsWatcher(self.assets_dir, self.images,
+                                     lambda changed, cameras: self.batches.append((changed, cameras)),
+                                     manifest=self.manifest, on_remove=self.remove)
+
+    def remove(self, names):
+        self.removed.append(names)
+        for name in names:
+            del self.images[name]
+
+    def test_unchanged_files_are_not_reparsed(self):
+        self.assertEqual(self.watcher.poll(), {})
+        self.assertEqual(self.batches, [])
+
+    def test_only_new_and_changed_records_are_ingested(self):
+        self.write_camera('EST-2', {
+            'd.jpg': ('2025:06:12 14:15:00', [_detection('excavator', 0.95)]),
+            'e.jpg': ('2025:06:13 07:00:00', []),
+        })
+        changed = self.watcher.poll()
+        self.assertEqual(set(changed), {'d.jpg', 'e.jpg'})
+        self.assertEqual(self.batches, [(changed, {'d.jpg': 'EST-2', 'e.jpg': 'EST-2'})])
+
+    def test_new_camera_file_is_discovered(self):
+        self.write_camera('EST-3', {'f.jpg': ('2025:06:14 12:00:00', [])})
+        stat = os.stat(self.assets_dir)
+        os.utime(self.assets_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertEqual(set(self.watcher.poll()), {'f.jpg'})
+        self.assertEqual(self.batches[0][1], {'f.jpg': 'EST-3'})
+        # The new camera's images can be served
+        self.assertEqual(self.manifest.locate('f.jpg'), ('EST-3', self.assets_dir / 'images_EST-3' / 'f.jpg'))
+
+    def test_partially_written_export_is_retried(self):
+        path = self.assets_dir / 'images_EST-2.json'
+        complete = path.read_text(encoding='utf-8').replace('}}}', '}}, "e.jpg": {"image_shooting": "2025:06:13 07:00:00", "detections": []}}}')
+        path.write_text(complete[:len(complete) // 2 + 10], encoding='utf-8')
+        self.assertEqual(self.watcher.poll(), {})
+        self.assertEqual(self.removed, [])
+        path.write_text(complete, encoding='utf-8')
+        self.assertEqual(set(self.watcher.poll()), {'e.jpg'})
+
+    def test_removed_records_are_reported(self):
+        self.write_camera('EST-1', {
+            'a.jpg': ('2025:06:10 08:00:00', [_detection('person', no_ppe=0.9)]),
+            'b.jpg': ('2025:06:11 09:30:00', [_detection('tower_crane', 0.4)]),
+        })
+        self.assertEqual(self.watcher.poll(), {})
+        self.assertEqual(self.removed, [{'c.jpg'}])
+
+        # A record moved to another export is not removed
+        self.write_camera('EST-2', {
+            'b.jpg': ('2025:06:11 09:30:00', [_detection('tower_crane', 0.4)]),
+            'd.jpg': ('2025:06:12 14:15:00', [_detection('excavator', 0.8)]),
+        })
+        self.write_camera('EST-1', {'a.jpg': ('2025:06:10 08:00:00', [_detection('person', no_ppe=0.9)])})
+        self.watcher.poll()
+        self.assertEqual(self.removed, [{'c.jpg'}])
+
+        os.remove(self.assets_dir / 'images_EST-2.json')
+        self.watcher.poll()
+        self.assertEqual(self.removed, [{'c.jpg'}, {'b.jpg', 'd.jpg'}])
+        self.assertEqual(set(self.images), {'a.jpg'})
+
+    def test_watched_file_change_runs_callback(self):
+        weather_path = self.assets_dir / 'weather_info.json'
+        weather_path.write_text('{}', encoding='utf-8')
+        reloads = []
+        self.watcher.watch_file(weather_path, lambda: reloads.append(weather_path.read_text(encoding='utf-8')))
+        self.watcher.poll()
+        self.assertEqual(reloads, [])
+        weather_path.write_text('{"weather_by_date": {}}', encoding='utf-8')
+        self.watcher.poll()
+        self.watcher.poll()
+        self.assertEqual(reloads, ['{"weather_by_date": {}}'])
+
+
+def _count_shard_lines(shard_path):
+    """Worker function for map_shards (must be module-level to be picklable)"""
+    return sum(1 for _ in data_preprocessing.read_shard(shard_path))
+
+
+class TestNdjsonShards(DataPipelineTestCase):
+    """Streaming export conversion into per-day NDJSON shards"""
+
+    def setUp(self):
+        super().setUp()
+        self.shards_dir = self.project_root / 'shards'
+        for camera in ('EST-1', 'EST-2'):
+            result = data_preprocessing.convert_to_ndjson_shards(
+                self.assets_dir / f'images_{camera}.json', self.shards_dir, camera)
+            self.assertEqual(result['status'], 'success')
+
+    def test_stream_handles_both_layouts_and_small_chunks(self):
+        flat_path = self.project_root / 'flat.json'
+        with open(flat_path, 'w', encoding='utf-8') as f:
+            json.dump({'x.jpg': {'image_shooting': '2025:06:10 08:00:00', 'detections': []},
+                       'camera': 'EST-1'}, f)
+        self.assertEqual([name for name, _ in data_preprocessing.iter_export_records(flat_path)],
+                         ['x.jpg'])
+
+        records = list(data_preprocessing.iter_export_records(
+            self.assets_dir / 'images_EST-1.json', chunk_size=7))
+        self.assertEqual([name for name, _ in records], ['a.jpg', 'b.jpg', 'c.jpg'])
+        self.assertEqual(records[1][1]['detections'][0]['score'], 0.4)
+
+    def test_one_shard_per_day_and_camera(self):
+        index = data_preprocessing.load_shard_index(self.shards_dir)
+        self.assertEqual(sorted(index['shards']['EST-1']), ['2025-06-10', '2025-06-11'])
+        self.assertEqual(index['shards']['EST-1']['2025-06-11']['records'], 2)
+        self.assertEqual(
+            [name for name, _ in data_preprocessing.iter_shard_records(
+                self.shards_dir, start_date='2025-06-11', end_date='2025-06-12')],
+            ['b.jpg', 'c.jpg', 'd.jpg'])
+
+    def test_append_and_reconvert(self):
+        data_preprocessing.append_to_shards(self.shards_dir, 'EST-2', [
+            ('e.jpg', {'image_shooting': '2025:06:12 16:00:00', 'detections': []}),
+        ])
+        index = data_preprocessing.load_shard_index(self.shards_dir)
+        self.assertEqual(index['shards']['EST-2']['2025-06-12']['records'], 2)
+
+        data_preprocessing.convert_to_ndjson_shards(
+            self.assets_dir / 'images_EST-2.json', self.shards_dir, 'EST-2')
+        index = data_preprocessing.load_shard_index(self.shards_dir)
+        self.assertEqual(index['shards']['EST-2']['2025-06-12']['records'], 1)
+
+    def test_append_skips_sharded_records(self):
+        self.write_camera('EST-1', {
+            'a.jpg': ('2025:06:10 08:00:00', [_detection('person', no_ppe=0.9)]),
+            'g.jpg': ('2025:06:10 17:00:00', []),
+        })
+        for _ in range(2):
+            result = data_preprocessing.convert_to_ndjson_shards(
+                self.assets_dir / 'images_EST-1.json', self.shards_dir, 'EST-1', append=True)
+            self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['shards'], {})
+        index = data_preprocessing.load_shard_index(self.shards_dir)
+        self.assertEqual(index['shards']['EST-1']['2025-06-10']['records'], 2)
+        self.assertEqual([name for name, _ in data_preprocessing.iter_shard_records(
+            self.shards_dir, camera='EST-1', end_date='2025-06-10')], ['a.jpg', 'g.jpg'])
+
+    def test_large_value_is_not_decoded_quadratically(self):
+        path = self.project_root / 'large.json'
+        record = {'image_shooting': '2025:06:10 08:00:00', 'detections': [_detection('person')] * 200}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'images': {'big.jpg': record}}, f)
+        reads = []
+        real_open = open
+
+        class CountingFile:
+            def __init__(self, f):
+                self.f = f
+
+            def read(self, size):
+                reads.append(size)
+                return self.f.read(size)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                self.f.close()
+
+        with patch.object(data_preprocessing, 'open', lambda *a, **kw: CountingFile(real_open(*a, **kw)), create=True):
+            records = list(data_preprocessing.iter_export_records(path, chunk_size=64))
+        self.assertEqual(records, [('big.jpg', record)])
+        # Roughly log2(file size / chunk size) reads instead of file size / chunk size
+        self.assertLess(len(reads), 20)
+
+    def test_parallel_map(self):
+        counts = data_preprocessing.map_shards(self.shards_dir, _count_shard_lines, max_workers=2)
+        self.assertEqual(counts[('EST-1', '2025-06-11')], 2)
+        self.assertEqual(sum(counts.values()), 4)
+
+    def test_loader_reads_shards(self):
+        loader = SecuriSiteDataLoader(self.project_root, shards_dir=self.shards_dir)
+        self.assertEqual([img.image_id for img in loader.query(camera='EST-1')], ['a', 'b', 'c'])
+
+
+class TestSQLiteStore(DataPipelineTestCase):
+    """Indexed SQLite store behind the loader and the web routes"""
+
+    def setUp(self):
+        super().setUp()
+        self.store = SecuriSiteStore(self.project_root / 'securisite.db')
+        self.assertEqual(self.store.import_assets(self.assets_dir, ('EST-1', 'EST-2')), 4)
+
+    def tearDown(self):
+        self.store.close()
+        super().tearDown()
+
+    def test_wal_mode(self):
+        mode = self.store.connection.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, 'wal')
+
+    def test_loader_queries_match_memory(self):
+        memory = SecuriSiteDataLoader(self.project_root)
+        stored = SecuriSiteDataLoader(self.project_root, store=self.store)
+        for predicates in ({}, {'camera': 'EST-1'}, {'min_score': 0.5},
+                           {'labels': ['tower_crane'], 'min_score': 0.5},
+                           {'has_person': False},
+                           {'start_date': '2025-06-11', 'end_date': '2025-06-11'},
+                           {'end_date': datetime(2025, 6, 11, 9, 30)}):
+            with self.subTest(**{k: str(v) for k, v in predicates.items()}):
+                self.assertEqual([img.filename for img in stored.query(**predicates)],
+                                 [img.filename for img in memory.query(**predicates)])
+
+    def test_risks_by_date_and_id(self):
+        self.store.upsert_risks([
+            {'id': 'r1', 'image_path': 'a.jpg', 'timestamp': '2025-06-10 08:00', 'severity': 9},
+            {'id': 'r2', 'image_path': 'd.jpg', 'timestamp': '2025-06-12 14:15', 'severity': 7},
+        ])
+        self.assertEqual([r['id'] for r in self.store.risks_for_date('2025-06-10')], ['r1'])
+        self.assertEqual(self.store.get_risk('r2')['severity'], 7)
+        self.assertIsNone(self.store.get_risk('missing'))
+
+        self.store.replace_risks_for_images(['a.jpg'], [])
+        self.assertEqual(self.store.risks_for_date('2025-06-10'), [])
+        self.assertEqual([r['id'] for r in self.store.risks_by_severity(5)], ['r2'])
+
+    def test_risk_batches_and_in_place_update(self):
+        self.store.upsert_risks([{'id': f'r{n}', 'image_path': 'a.jpg', 'timestamp': '2025-06-10 08:00',
+                                  'severity': 5, 'weather': None} for n in range(5)])
+        batches = []
+        for batch in self.store.iter_risk_batches(size=2):
+            batches.append([r['id'] for r in batch])
+            self.store.update_risks(dict(risk, weather={'condition': 'Temps sec'}) for risk in batch)
+        self.assertEqual(batches, [['r0', 'r1'], ['r2', 'r3'], ['r4']])
+        self.assertEqual(self.store.get_risk('r3')['weather'], {'condition': 'Temps sec'})
+        self.assertEqual(self.store.count_risks(), 5)
+
+    def test_exports_changed_while_stopped(self):
+        cameras = discover_cameras(self.assets_dir)
+        self.assertEqual(self.store.export_changes(self.assets_dir, cameras), ({}, {}, {}))
+
+        self.write_camera('EST-2', {
+            'd.jpg': ('2025:06:12 14:15:00', [_detection('excavator', 0.8)]),
+            'e.jpg': ('2025:06:13 07:00:00', []),
+        })
+        self.write_camera('EST-3', {'f.jpg': ('2025:06:14 12:00:00', [])})
+        cameras = discover_cameras(self.assets_dir)
+        self.assertEqual(cameras, ('EST-1', 'EST-2', 'EST-3'))
+        records, record_cameras, signatures = self.store.export_changes(self.assets_dir, cameras)
+        self.assertEqual(set(records), {'e.jpg', 'f.jpg'})
+        self.assertEqual(record_cameras, {'e.jpg': 'EST-2', 'f.jpg': 'EST-3'})
+        self.assertEqual(set(signatures), {'EST-2', 'EST-3'})
+
+        # Nothing is marked until the caller has ingested the records
+        self.assertEqual(set(self.store.export_changes(self.assets_dir, cameras)[0]), {'e.jpg', 'f.jpg'})
+        self.store.mark_exports(signatures)
+        self.assertEqual(self.store.export_changes(self.assets_dir, cameras), ({}, {}, {}))
+
+    def test_delete_images(self):
+        self.store.upsert_risks([{'id': 'r1', 'image_path': 'a.jpg', 'timestamp': '2025-06-10 08:00', 'severity': 9}])
+        self.store.delete_images(['a.jpg'])
+        self.assertNotIn('a.jpg', self.store.records)
+        self.assertIsNone(self.store.get_risk('r1'))
+        self.assertEqual(self.store.count_images(), 3)
+
+    def test_inspections_shared_and_acknowledged(self):
+        start = datetime(2025, 6, 10, 8)
+        inspections = [Inspection(f'r{n}', start + timedelta(hours=n % 7, microseconds=n), n % 3, 'CARSAT',
+                                  'EST', 'EST-1', {'risk_type': 'person_without_ppe', 'articles': ['R4323-58']})
+                       for n in range(30)]
+        memory = InspectionScheduler()
+        for inspection in inspections:
+            self.store.inspections.add(inspection)
+            memory.add(inspection)
+        self.assertEqual(self.store.inspections.plan(), memory.plan())
+        self.assertEqual(self.store.inspections.due_within(3, now=start), memory.due_within(3, now=start))
+
+        # Another worker (or a restart) sees the acknowledgement
+        self.assertTrue(self.store.inspections.complete('r0'))
+        self.assertFalse(self.store.inspections.complete('r0'))
+        other = SecuriSiteStore(self.store.db_path)
+        self.addCleanup(other.close)
+        self.assertNotIn('r0', other.inspections)
+        self.assertIn('r1', other.inspections)
+        self.assertEqual(len(other.inspections), 29)
+        # Scheduling its risk again does not reopen it
+        other.inspections.add(inspections[0])
+        self.assertNotIn('r0', self.store.inspections)
+        self.assertEqual(self.store.inspections.peek().violation_id, 'r7')
+
+        self.assertTrue(other.inspections.discard('r1'))
+        self.assertFalse(other.inspections.discard('r0'))
+        self.assertEqual(len(self.store.inspections), 28)
+        self.assertEqual(sum(map(len, self.store.inspections.by_referent().values())), 28)
+
+    def test_records_view(self):
+        self.assertIn('a.jpg', self.store.records)
+        self.assertEqual(self.store.records['d.jpg']['photo_id'], 'd')
+        self.assertIsNone(self.store.records.get('zzz.jpg'))
+
+
+class TestRiskIndex(unittest.TestCase):
+    """Web risk lookups by id and day with precomputed aggregates"""
+
+    RISKS = [
+        {'id': 'a', 'severity': 9, 'timestamp': '2025-06-10 08:00'},
+        {'id': 'b', 'severity': 7, 'timestamp': '2025-06-10 14:30'},
+        {'id': 'c', 'severity': 4, 'timestamp': '2025-06-11 09:00'},
+        {'id': 'd', 'severity': 6, 'timestamp': '2025-07-01 10:00'},
+    ]
+
+    def test_lookups_and_aggregates(self):
+        index = RiskIndex(self.RISKS)
+        self.assertIs(index.get('c'), self.RISKS[2])
+        self.assertIsNone(index.get('z'))
+        self.assertEqual([r['id'] for r in index.for_date('2025-06-10')], ['a', 'b'])
+        self.assertEqual([r['id'] for r in index.for_date('2025-06')], ['a', 'b', 'c'])
+        self.assertEqual(index.for_date('2025-06-12'), [])
+        self.assertEqual(index.summary('2025-06-10'), (2, 8.0, "RISQUE ÉLEVÉ", "#D32F2F"))
+        self.assertEqual(index.summary('2025-06-11').level, "RISQUE FAIBLE")
+        self.assertEqual(index.summary('2025-06').count, 3)
+        self.assertEqual(index.summary('2025-06-12'), (0, 2.0, "AUCUN RISQUE", "#388E3C"))
+
+    def test_rebuild_swaps_tables(self):
+        index = RiskIndex(self.RISKS)
+        version = index.version
+        june_10 = index.for_date('2025-06-10')
+        index.rebuild(self.RISKS[2:])
+        self.assertEqual(index.version, version + 1)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.for_date('2025-06-10'), [])
+        self.assertEqual(len(june_10), 2)
+
+    def test_pages_and_cursors(self):
+        risks = [{'id': f'r{i}', 'severity': 5 + i % 3, 'timestamp': f'2025-06-10 0{i}:00'} for i in range(7)]
+        ids, cursor = [], None
+        while True:
+            page = page_risks(risks, order='severity', limit=3, cursor=cursor)
+            ids += [r['id'] for r in page.risks]
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(ids, ['r5', 'r2', 'r4', 'r1', 'r6', 'r3', 'r0'])
+        self.assertEqual([r['id'] for r in page_risks(risks, order='time', limit=2).risks], ['r6', 'r5'])
+
+        # A risk added after the first page does not shift the next one
+        first = page_risks(risks, limit=3)
+        risks.append({'id': 'r9', 'severity': 9, 'timestamp': '2025-06-10 09:00'})
+        self.assertEqual([r['id'] for r in page_risks(risks, limit=3, cursor=first.next_cursor).risks],
+                         ['r1', 'r6', 'r3'])
+        with self.assertRaises(ValueError):
+            decode_cursor(first.next_cursor, 'time')
+        with self.assertRaises(ValueError):
+            page_risks(risks, cursor='not-a-cursor')
+        for key in (('x', 'y', 'z'), (5, 3, 'r0'), (True, '2025-06-10 08:00', 'r0')):
+            with self.assertRaises(ValueError):
+                page_risks(risks, cursor=encode_cursor('severity', key))
+        self.assertEqual(project(risks[0], ['severity', 'missing']), {'id': 'r0', 'severity': 5})
+
+
+if __name__ == '__main__':
+    unittest.main()
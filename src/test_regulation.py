@@ -0,0 +1,286 @@
+"""
+Phase 1: Unit & Integration Testing - Step 5
+Regulation Knowledge Base Validation (compiled tables, batch matching, article search,
+memoized weather modifiers, inspection scheduling, violation aggregation)
+"""
+
+import asyncio
+import json
+import random
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from securisite.agents.regulation_agent import RegulationAgent
+from securisite.utils.inspection_scheduler import Inspection, InspectionScheduler
+from securisite.utils.regulation_kb import (
+    DEFAULT_KB_PATH, RegulationKnowledgeBase, load_knowledge_base
+)
+from securisite.utils.regulation_search import (
+    RegulationSearchIndex, open_search_index, tokenize
+)
+
+RISKS = [
+    {'risk_type': 'person_without_ppe', 'severity': 9},
+    {'risk_type': 'crane_near_people', 'severity': 7},
+    {'risk_type': 'proximite_homme_machine', 'severity': 5},
+]
+
+
+class TestRegulationKnowledgeBase(unittest.TestCase):
+    """Versioned regulation data file loaded into read-only tables"""
+
+    def test_loaded_once_and_read_only(self):
+        kb = load_knowledge_base()
+        self.assertIs(kb, load_knowledge_base(DEFAULT_KB_PATH))
+        self.assertTrue(kb.version)
+        with self.assertRaises(TypeError):
+            kb.regulations['person_without_ppe']['itv'] = 1
+        with self.assertRaises(TypeError):
+            kb.risk_mapping['new_risk'] = 'person_without_ppe'
+
+    def test_lookups(self):
+        kb = load_knowledge_base()
+        self.assertEqual(kb.category('crane_near_people'), 'tower_crane_operation')
+        self.assertEqual(kb.category('proximite_homme_machine'), kb.default_category)
+        self.assertEqual(kb.penalty('URGENTE'), 20)
+        self.assertEqual(kb.penalty('ABSENTE'), kb.default_penalty)
+        self.assertEqual(kb.regulation('unknown')['severity'], 'INCONNUE')
+
+    def test_invalid_file(self):
+        tmp_dir = Path(tempfile.mkdtemp())
+        try:
+            path = tmp_dir / 'regulations.json'
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'version': 'x', 'regulations': {}}, f)
+            with self.assertRaises(ValueError):
+                RegulationKnowledgeBase.from_file(path)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+class TestRegulationBatch(unittest.TestCase):
+    """Batch regulatory analysis over many images"""
+
+    def setUp(self):
+        self.agent = RegulationAgent()
+
+    def test_batch_matches_single_processing(self):
+        batch = [
+            {'risks': RISKS, 'weather_conditions': {'wind_speed': 30}},
+            {'risks': RISKS[:1], 'weather_conditions': {}},
+            {'risks': [], 'weather_conditions': {}},
+        ]
+        results = asyncio.run(self.agent.process_batch(batch))
+        for data, result in zip(batch, results):
+            expected = asyncio.run(self.agent.process(data))
+            self.assertEqual(result['regulatory_analysis'], expected['regulatory_analysis'])
+            self.assertEqual(result['compliance_score'], expected['compliance_score'])
+        self.assertEqual(results[0]['total_penalty_score'], 20 + 15 + 5)
+        self.assertEqual(results[0]['regulatory_analysis'][0]['articles'], ['R4534-15', 'R4312-1', 'R4312-2'])
+
+    def test_batch_shares_matching(self):
+        calls = []
+        original = self.agent._match_regulation
+
+        def counting_match(risk):
+            calls.append(risk['risk_type'])
+            return original(risk)
+
+        self.agent._match_regulation = counting_match
+        asyncio.run(self.agent.process_batch([{'risks': RISKS} for _ in range(50)]))
+        self.assertEqual(len(calls), len(RISKS))
+
+
+class TestWeatherModifierCache(unittest.TestCase):
+    """Memoized ITV weather modifiers"""
+
+    WEATHERS = [{}, {'wind_speed': 30}, {'wind_speed': 40, 'precipitation': 8},
+                {'temperature': -3}, {'temperature': 38, 'precipitation': 6, 'wind_speed': 26}]
+
+    def setUp(self):
+        self.agent = RegulationAgent()
+
+    def test_modifiers_match_formula(self):
+        for weather in self.WEATHERS:
+            multiplier = 1.0
+            if weather.get('wind_speed', 0) > 25:
+                multiplier *= 0.7
+            if weather.get('precipitation', 0) > 5:
+                multiplier *= 0.8
+            if not 0 <= weather.get('temperature', 20) <= 35:
+                multiplier *= 0.9
+            for risk in RISKS:
+                regulation = self.agent._match_regulation(risk)
+                modified = self.agent._apply_weather_modifiers(regulation, weather)
+                with self.subTest(weather=weather, risk=risk['risk_type']):
+                    expected = max(int(regulation['scaled_itv_hours'] * multiplier), 2)
+                    self.assertEqual(modified['adjusted_itv'], expected)
+                    self.assertIsInstance(modified['weather_conditions'], list)
+
+    def test_repeated_combinations_hit_the_cache(self):
+        batch = [{'risks': RISKS, 'weather_conditions': {'wind_speed': 30 + i % 5}} for i in range(20)]
+        asyncio.run(self.agent.process_batch(batch))
+        self.assertEqual(self.agent.modifier_cache_stats['misses'], len(RISKS))
+        self.assertEqual(self.agent.modifier_cache_stats['hits'], 19 * len(RISKS))
+
+    def test_adjusted_itvs_and_bounded_size(self):
+        agent = RegulationAgent(modifier_cache_size=2)
+        itvs = agent.adjusted_itvs(RISKS, {'wind_speed': 30})
+        expected = [agent._apply_weather_modifiers(agent._match_regulation(r), {'wind_speed': 30})['adjusted_itv']
+                    for r in RISKS]
+        self.assertEqual(itvs, expected)
+        self.assertEqual(len(agent._modifier_cache), 2)
+        self.assertGreater(agent.modifier_cache_stats['evictions'], 0)
+
+
+class TestInspectionScheduler(unittest.TestCase):
+    """Heap-ordered inspection queue across sites and cameras"""
+
+    START = datetime(2025, 6, 10, 8, 0)
+
+    def inspection(self, violation_id, hours, priority=10, referent='CARSAT'):
+        return Inspection(violation_id, self.START + timedelta(hours=hours), priority, referent)
+
+    def test_order_complete_and_reschedule(self):
+        scheduler = InspectionScheduler()
+        scheduler.add(self.inspection('a', 24, priority=5))
+        scheduler.add(self.inspection('b', 24, priority=20))
+        scheduler.add(self.inspection('c', 12))
+        self.assertEqual([i.violation_id for i in scheduler.plan()], ['c', 'b', 'a'])
+
+        self.assertTrue(scheduler.complete('c'))
+        self.assertFalse(scheduler.complete('c'))
+        scheduler.add(self.inspection('a', 2, priority=5))
+        self.assertEqual(scheduler.peek().violation_id, 'a')
+        self.assertEqual([i.violation_id for i in scheduler.plan(limit=1)], ['a'])
+        self.assertEqual(len(scheduler), 2)
+
+    def test_due_within_matches_full_scan(self):
+        scheduler = InspectionScheduler()
+        rng = random.Random(7)
+        deadlines = {}
+        for n in range(20000):
+            hours = rng.randint(-48, 24 * 14)
+            scheduler.add(self.inspection(f'v{n}', hours, priority=rng.choice([5, 10, 15, 20])))
+            deadlines[f'v{n}'] = hours
+        for n in range(0, 20000, 3):
+            scheduler.complete(f'v{n}')
+            del deadlines[f'v{n}']
+
+        due = scheduler.due_within(24, now=self.START)
+        self.assertEqual({i.violation_id for i in due}, {v for v, h in deadlines.items() if h <= 24})
+        self.assertTrue(all(a.deadline <= b.deadline for a, b in zip(due, due[1:])))
+        self.assertEqual(sum(len(items) for items in scheduler.by_referent().values()), len(scheduler))
+
+    def test_agent_schedules_violations(self):
+        agent = RegulationAgent()
+        result = asyncio.run(agent.process({'risks': RISKS, 'timestamp': '2025:06:10 08:00:00', 'camera': 'EST-1'}))
+        plan = result['inspection_plan']
+        self.assertEqual(len(plan), len(RISKS))
+        self.assertEqual(plan[0]['risk_type'], 'crane_near_people')
+        self.assertTrue(result['next_inspection_schedule'].startswith("Inspection avant le 10/06/2025"))
+        # Analysis only reports the plan; queueing is explicit
+        self.assertEqual(len(agent.inspection_scheduler), 0)
+        asyncio.run(agent.process_site([{'risks': RISKS, 'timestamp': '2025:06:10 08:00:00'}]))
+        self.assertEqual(len(agent.inspection_scheduler), 0)
+
+        queued = agent.schedule_inspections(RISKS, datetime(2025, 6, 10, 8), {}, camera='EST-1')
+        self.assertEqual(len(agent.inspection_scheduler), len(RISKS))
+        self.assertEqual(sorted((i.details['risk_type'], i.deadline.isoformat()) for i in queued),
+                         sorted((i['risk_type'], i['deadline']) for i in plan))
+
+
+class TestViolationAggregation(unittest.TestCase):
+    """Site-level grouping of violations before scoring"""
+
+    def setUp(self):
+        self.agent = RegulationAgent()
+
+    def site_day(self, day, images=40):
+        return [
+            {'risks': [{'risk_type': 'person_without_ppe', 'severity': 9, 'area': f'person_{n % 3 + 1}'},
+                       {'risk_type': 'crane_near_people', 'severity': 7, 'area': 'crane_zone'}],
+             'timestamp': f'2025:06:{day} {8 + n % 9:02d}:{n % 60:02d}:00'}
+            for n in range(images)
+        ]
+
+    def test_busy_day_is_scored_on_distinct_violations(self):
+        result = asyncio.run(self.agent.process_site(self.site_day(10)))
+        self.assertEqual(result['total_violations'], 80)
+        self.assertEqual(result['distinct_violations'], 2)
+        self.assertEqual(result['total_penalty_score'], 20 + 15)
+        self.assertEqual(result['compliance_score'], 65)
+        occurrences = {g['zone']: g['occurrences'] for g in result['violation_groups']}
+        self.assertEqual(occurrences, {'person': 40, 'crane_zone': 40})
+        self.assertEqual(len(result['critical_violations']), 1)
+
+    def test_recommendations_once_per_group_in_stable_order(self):
+        first = asyncio.run(self.agent.process_site(self.site_day(10)))
+        second = asyncio.run(self.agent.process_site(self.site_day(10)))
+        self.assertEqual(first['recommendations'], second['recommendations'])
+        self.assertEqual(len(first['recommendations']), len(set(first['recommendations'])))
+
+    def test_time_windows_split_groups(self):
+        result = asyncio.run(self.agent.process_site(self.site_day(10) + self.site_day(11)))
+        self.assertEqual(result['distinct_violations'], 4)
+        shift_agent = RegulationAgent(aggregation_window_hours=8)
+        result = asyncio.run(shift_agent.process_site(self.site_day(10)))
+        self.assertEqual(sorted({g['window_start'] for g in result['violation_groups']}),
+                         ['2025-06-10T08:00:00', '2025-06-10T16:00:00'])
+
+
+class TestRegulationSearch(unittest.TestCase):
+    """BM25 index over local Code du Travail articles"""
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.corpus_dir = self.tmp_dir / 'corpus'
+        self.corpus_dir.mkdir()
+        self.write_article('R1', "Grues", "Arrêt du grutage par vent fort.")
+        self.write_article('R2', "Casque", "Le port du casque de protection est obligatoire.")
+        self.write_article('R3', "Accès", "Les voies de circulation restent dégagées.")
+        self.index_path = self.tmp_dir / 'index.json'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def write_article(self, article_id, title, text):
+        (self.corpus_dir / f'{article_id}.txt').write_text(f"{title}\n{text}", encoding='utf-8')
+
+    def test_tokenize_folds_accents_and_plurals(self):
+        self.assertEqual(tokenize("Les Grues à l'arrêt"), ['grue', 'arret'])
+
+    def test_ranking_and_query_cache(self):
+        index = open_search_index(self.corpus_dir)
+        self.assertEqual(index.search("grue vent", k=1)[0]['article'], 'R1')
+        self.assertEqual(index.search("vent grues", k=1)[0]['article'], 'R1')
+        self.assertEqual(index.stats, {'hits': 1, 'misses': 1})
+        self.assertEqual(index.search("rien", k=3), [])
+
+    def test_persisted_and_incrementally_reindexed(self):
+        open_search_index(self.corpus_dir, self.index_path)
+        self.assertEqual(len(RegulationSearchIndex.load(self.index_path)), 3)
+
+        self.write_article('R2', "Casque", "Le port du casque et du gilet est obligatoire.")
+        (self.corpus_dir / 'R3.txt').unlink()
+        index = RegulationSearchIndex.load(self.index_path)
+        self.assertEqual(index.sync({'R1': ("Grues", "Arrêt du grutage par vent fort."),
+                                     'R2': ("Casque", "Le port du casque et du gilet est obligatoire.")}), (1, 1))
+
+        reopened = open_search_index(self.corpus_dir, self.index_path)
+        self.assertEqual(reopened.search("gilet")[0]['article'], 'R2')
+        self.assertEqual(reopened.search("circulation"), [])
+        self.assertNotIn('circulation', RegulationSearchIndex.load(self.index_path).postings)
+
+    def test_agent_returns_related_articles(self):
+        agent = RegulationAgent()
+        result = asyncio.run(agent.process({'risks': [{'risk_type': 'tower_crane_operation', 'severity': 6}]}))
+        articles = [a['article'] for a in result['regulatory_analysis'][0]['related_articles']]
+        self.assertIn('R4534-26', articles)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,420 @@
+"""
+Phase 1: Unit & Integration Testing - Step 6
+Report Generation Validation (template caching, streaming, PDF export, batch reports, day-over-day diffs)
+"""
+
+import asyncio
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+from securisite.agents.report_agent import ReportGenerationAgent, REPORT_TEMPLATE
+from securisite.agents.weather_context_agent import WeatherContextAgent
+from securisite.batch_reports import INDEX_NAME, collect_partitions, load_index, run_batch
+from securisite.orchestrator import SecuriSiteOrchestrator
+from securisite.utils.data_loader import SecuriSiteDataLoader
+from securisite.utils.weather_sources import FileWeatherSource
+from securisite.utils.annotated_images import AnnotatedImageCache, draw_annotations
+from securisite.utils.pdf_export import PdfExportPool, content_key, markdown_flowables, render_pdf
+from securisite.utils.report_history import ReportHistory
+
+
+class ReportTestCase(unittest.TestCase):
+    """Temporary template folder and bytecode cache"""
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.templates_dir = self.tmp_dir / 'templates'
+        self.templates_dir.mkdir()
+        self.cache_dir = self.tmp_dir / 'bytecode'
+        self.write_template("# Rapport\nScore: {{ compliance_score }}%\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def write_template(self, content, mtime=None):
+        path = self.templates_dir / REPORT_TEMPLATE
+        path.write_text(content, encoding='utf-8')
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def agent(self):
+        return ReportGenerationAgent(templates_dir=self.templates_dir, bytecode_cache_dir=self.cache_dir)
+
+
+class TestTemplateCache(ReportTestCase):
+    """Package-relative loader, compiled template cache and bytecode cache"""
+
+    def test_compiled_once_and_shared(self):
+        first = asyncio.run(self.agent()._load_template())
+        second = asyncio.run(self.agent()._load_template())
+        self.assertIs(first, second)
+        self.assertTrue(any(self.cache_dir.iterdir()))
+
+    def test_reloaded_when_file_changes(self):
+        agent = self.agent()
+        self.write_template("Score: {{ compliance_score }}%", mtime=1_000_000)
+        self.assertEqual(asyncio.run(agent._load_template()).render(compliance_score=80), "Score: 80%")
+        self.write_template("Conformité: {{ compliance_score }}%", mtime=2_000_000)
+        self.assertEqual(asyncio.run(agent._load_template()).render(compliance_score=80), "Conformité: 80%")
+
+    def test_independent_of_working_directory(self):
+        cwd = os.getcwd()
+        try:
+            os.chdir(self.tmp_dir)
+            template = asyncio.run(ReportGenerationAgent()._load_template())
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(template.name, REPORT_TEMPLATE)
+
+    def test_missing_template_falls_back_to_default(self):
+        (self.templates_dir / REPORT_TEMPLATE).unlink()
+        result = asyncio.run(self.agent().process({}))
+        self.assertTrue(result['report'].startswith("# Rapport SecuriSite"))
+
+
+class TestReportStreaming(ReportTestCase):
+    """Chunked rendering to files and HTTP responses"""
+
+    RISK_TEMPLATE = ("{% for risk in structural_risks %}{{ risk.risk_type }}:{{ risk.severity }}\n{% endfor %}"
+                     "{% for risk in personnel_risks %}P{{ risk.severity }}\n{% endfor %}")
+
+    def site_data(self, count):
+        risks = [{'risk_type': 'crane_near_people' if i % 2 else 'person_without_ppe', 'severity': i % 10}
+                 for i in range(count)]
+        return {'cv_analysis': {'risk_scores': risks}, 'regulatory_analysis': {'compliance_score': 72}}
+
+    def test_stream_matches_render(self):
+        self.write_template(self.RISK_TEMPLATE)
+        agent = self.agent()
+        data = self.site_data(500)
+        rendered = asyncio.run(agent.process(data))['report']
+        chunks = list(agent.stream(data, buffer_size=16))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), rendered)
+
+    def test_stream_is_lazy(self):
+        self.write_template(self.RISK_TEMPLATE)
+        consumed = []
+
+        def risks():
+            for i in range(10_000):
+                consumed.append(i)
+                yield {'risk_type': 'excavator_near_people', 'severity': 3}
+
+        class Risks:
+            def __len__(self):
+                return 10_000
+
+            def __iter__(self):
+                return risks()
+
+        chunks = self.agent().stream({'cv_analysis': {'risk_scores': Risks()}}, buffer_size=8)
+        next(chunks)
+        self.assertLess(len(consumed), 100)
+
+    def test_write_report_to_path_and_file(self):
+        self.write_template(self.RISK_TEMPLATE)
+        agent = self.agent()
+        data = self.site_data(50)
+        path = self.tmp_dir / 'report.md'
+        metadata = agent.write_report(data, path)
+        buffer = io.StringIO()
+        agent.write_report(data, buffer)
+        self.assertEqual(path.read_text(encoding='utf-8'), buffer.getvalue())
+        self.assertNotIn('report', metadata)
+        self.assertEqual(metadata['summary']['total_risks'], 50)
+        self.assertEqual(sorted(metadata['summary']['risk_categories']),
+                         ['crane_near_people', 'person_without_ppe'])
+
+
+    def test_save_report_renders_once(self):
+        orchestrator = SecuriSiteOrchestrator()
+        path = self.tmp_dir / 'saved.md'
+        rendered = {'analysis': dict(self.site_data(3), report={'report': '# Rapport déjà rendu\n'})}
+        with patch.object(orchestrator.report_agent, 'write_report') as write_report:
+            orchestrator.save_report(rendered, str(path))
+        write_report.assert_not_called()
+        self.assertEqual(path.read_text(encoding='utf-8'), '# Rapport déjà rendu\n')
+
+        # analyze_site_risks(render_report=False): streamed by save_report
+        summarized = {'analysis': dict(self.site_data(3), report=orchestrator.report_agent.summarize(self.site_data(3)))}
+        orchestrator.save_report(summarized, str(path))
+        self.assertIn('Score de conformité: 72%', path.read_text(encoding='utf-8'))
+
+
+class TestReportDiff(unittest.TestCase):
+    """Day-over-day diffs and section fragment reuse with the bundled template"""
+
+    def day(self, report_date, risks, score, critical=()):
+        return {
+            'site': 'EST',
+            'report_date': report_date,
+            'cv_analysis': {'risk_scores': [{'risk_type': t, 'area': a, 'severity': 6, 'equipment_involved': []}
+                                            for t, a in risks]},
+            'weather_context': {'weather_conditions': {'temperature': 20}},
+            'regulatory_analysis': {'compliance_score': score, 'critical_violations': list(critical),
+                                    'recommendations': ['Port du casque immédiate']}
+        }
+
+    def test_diff_against_previous_day(self):
+        agent = ReportGenerationAgent()
+        first = asyncio.run(agent.process(self.day('2025-06-10', [('person_without_ppe', 'person_1'),
+                                                                  ('crane_near_people', 'crane_zone')], 60)))
+        self.assertIsNone(first['diff'])
+        self.assertNotIn('Évolution', first['report'])
+
+        second = asyncio.run(agent.process(self.day('2025-06-11', [('person_without_ppe', 'person_1'),
+                                                                   ('person_without_ppe', 'person_2'),
+                                                                   ('container_obstruction', 'access_zone')], 75)))
+        diff = second['diff']
+        self.assertEqual(diff['previous_date'], '10/06/2025')
+        self.assertEqual(diff['compliance_change'], 15)
+        self.assertEqual(diff['new_risks'], [{'risk_type': 'container_obstruction', 'zone': 'access_zone', 'count': 1}])
+        self.assertEqual(diff['resolved_risks'], [{'risk_type': 'crane_near_people', 'zone': 'crane_zone', 'previous_count': 1}])
+        self.assertEqual(diff['persisting_risks'], [{'risk_type': 'person_without_ppe', 'zone': 'person',
+                                                     'count': 2, 'previous_count': 1}])
+        self.assertIn('## Évolution depuis le 10/06/2025', second['report'])
+        self.assertIn('60% → 75% (+15 points)', second['report'])
+
+        # Re-running an earlier day compares with the day before it, not with the latest report
+        again = asyncio.run(agent.process(self.day('2025-06-10', [], 60)))
+        self.assertIsNone(again['diff'])
+
+    def test_unchanged_sections_are_reused(self):
+        agent = ReportGenerationAgent()
+        data = self.day('2025-06-11', [('person_without_ppe', 'person_1')], 70)
+        first = asyncio.run(agent.process(data))['report']
+        rendered = agent.section_stats['rendered']
+        data['regulatory_analysis']['compliance_score'] = 65
+        second = asyncio.run(agent.process(data))['report']
+        self.assertEqual(agent.section_stats['rendered'] - rendered, 1)
+        self.assertEqual(agent.section_stats['reused'], rendered - 1)
+        undated = lambda report: re.sub(r'Date: .*', '', report)
+        self.assertEqual(undated(second), undated(first).replace('conformité: 70%', 'conformité: 65%'))
+
+        full = ReportGenerationAgent()
+        del data['site']
+        self.assertEqual(undated(asyncio.run(full.process(data))['report']), undated(second))
+
+    def test_section_digest_follows_each_risk(self):
+        agent = ReportGenerationAgent()
+        template = agent._get_template()
+        data = self.day('2025-06-11', [('person_without_ppe', 'person_1'), ('crane_near_people', 'crane_zone')], 70)
+        digest = lambda: agent._section_digest(template, 'risks', agent._prepare_report_data(data))
+        first = digest()
+        self.assertEqual(digest(), first)
+        data['cv_analysis']['risk_scores'][1]['severity'] = 7
+        changed = digest()
+        self.assertNotEqual(changed, first)
+        # Same risks, one moved from the structural to the personnel selection
+        data['cv_analysis']['risk_scores'][1]['risk_type'] = 'crane_near_person'
+        self.assertNotEqual(digest(), changed)
+
+    def test_stream_and_write_reuse_sections(self):
+        agent = ReportGenerationAgent()
+        data = self.day('2025-06-11', [('person_without_ppe', 'person_1')], 70)
+        report = asyncio.run(agent.process(data))['report']
+        rendered, reused = agent.section_stats['rendered'], agent.section_stats['reused']
+        self.assertEqual(''.join(agent.stream(data, buffer_size=2)), report)
+        buffer = io.StringIO()
+        agent.write_report(data, buffer)
+        self.assertEqual(buffer.getvalue(), report)
+        self.assertEqual(agent.section_stats['rendered'], rendered)
+        self.assertEqual(agent.section_stats['reused'], reused + 2 * rendered)
+
+    def test_history_shared_through_directory(self):
+        tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        # Two workers of the same site, e.g. two web processes
+        first = ReportGenerationAgent(history=ReportHistory(tmp_dir, days=2))
+        second = ReportGenerationAgent(history=ReportHistory(tmp_dir, days=2))
+        asyncio.run(first.process(self.day('2025-06-10', [('person_without_ppe', 'person_1')], 60)))
+        diff = asyncio.run(second.process(self.day('2025-06-11', [], 80)))['diff']
+        self.assertEqual(diff['previous_date'], '10/06/2025')
+        self.assertEqual(diff['resolved_risks'], [{'risk_type': 'person_without_ppe', 'zone': 'person',
+                                                   'previous_count': 1}])
+
+        asyncio.run(first.process(self.day('2025-06-12', [], 80)))
+        asyncio.run(first.process(self.day('../../évasion', [], 80)))
+        self.assertEqual(second.history.dates('EST'), ['2025-06-11', '2025-06-12'])
+        self.assertEqual(sorted(p.name for p in (tmp_dir / 'EST').iterdir()), ['2025-06-11.json', '2025-06-12.json'])
+
+
+class TestPdfExport(ReportTestCase):
+    """Annotated images and PDF rendering in the worker pool"""
+
+    MARKDOWN = "# Rapport\n\n## ⚠️ Alertes\n- **Article**: R4534-15\n- ✅ Port du casque\n\n---\n"
+    ANNOTATIONS = [
+        {'type': 'box', 'x1': 0.1, 'y1': 0.1, 'x2': 0.5, 'y2': 0.5, 'color': '#FF9800'},
+        {'type': 'circle', 'x': 0.75, 'y': 0.75, 'radius': 0.1, 'color': '#D32F2F'},
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.image_path = self.tmp_dir / 'photo.jpg'
+        Image.new('RGB', (400, 300), 'white').save(self.image_path)
+        self.images = [{'path': self.image_path, 'annotations': self.ANNOTATIONS, 'caption': 'Grue'}]
+
+    def test_annotations_drawn_in_normalized_coordinates(self):
+        annotated = draw_annotations(Image.new('RGB', (400, 300), 'white'), self.ANNOTATIONS)
+        self.assertEqual(annotated.getpixel((40, 100)), (255, 152, 0))
+        self.assertEqual(annotated.getpixel((100, 100)), (255, 255, 255))
+        self.assertEqual(annotated.getpixel((300, 195)), (211, 47, 47))
+
+    def test_markdown_blocks(self):
+        flowables = markdown_flowables(self.MARKDOWN)
+        texts = [getattr(f, 'text', None) for f in flowables]
+        self.assertEqual(texts[:4], ['Rapport', 'Alertes', '<strong>Article</strong>: R4534-15', 'Port du casque'])
+
+    def test_render_pdf(self):
+        path = render_pdf(self.MARKDOWN, self.images, str(self.tmp_dir / 'report.pdf'), title="Rapport")
+        self.assertTrue(Path(path).read_bytes().startswith(b'%PDF'))
+        self.assertEqual([p.name for p in self.tmp_dir.glob('*.tmp')], [])
+
+    def test_pool_renders_once_per_content(self):
+        pool = PdfExportPool(self.tmp_dir / 'pdf', max_workers=2)
+        key = content_key(self.MARKDOWN, 'photo.jpg')
+        try:
+            self.assertIn(pool.submit(key, self.MARKDOWN, self.images)['status'], ('queued', 'running'))
+            self.assertEqual(pool.wait(key, timeout=60)['status'], 'done')
+            self.assertTrue(pool.pdf_path(key).read_bytes().startswith(b'%PDF'))
+            # Workers are not forked from the (multithreaded) web process
+            self.assertNotEqual(pool._executor._mp_context.get_start_method(), 'fork')
+        finally:
+            pool.shutdown()
+        # The finished job is no longer tracked; its PDF on disk answers for it
+        self.assertEqual(pool._jobs, {})
+        self.assertEqual(pool.status(key), {'job_id': key, 'status': 'done'})
+
+        restarted = PdfExportPool(self.tmp_dir / 'pdf')
+        self.assertEqual(restarted.submit(key, self.MARKDOWN, self.images), {'job_id': key, 'status': 'done'})
+        self.assertIsNone(restarted._executor)
+        self.assertIsNone(restarted.status(content_key('autre rapport')))
+        self.assertIsNone(restarted.status('../secret'))
+
+
+class TestAnnotatedImageCache(unittest.TestCase):
+    """Server-side renditions and their LRU disk cache"""
+
+    ANNOTATIONS = [{'type': 'circle', 'x': 0.5, 'y': 0.5, 'radius': 0.1, 'color': '#D32F2F'}]
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.images = []
+        for i in range(3):
+            path = self.tmp_dir / f'photo_{i}.jpg'
+            Image.effect_noise((1600, 1200), 64 + i).convert('RGB').save(path)
+            self.images.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_sizes_and_content_addressing(self):
+        cache = AnnotatedImageCache(self.tmp_dir / 'cache')
+        thumbnail = cache.get(self.images[0], self.ANNOTATIONS, 'thumbnail')
+        with Image.open(thumbnail) as image:
+            self.assertEqual(image.size, (320, 240))
+        with Image.open(cache.get(self.images[0], self.ANNOTATIONS, 'full')) as image:
+            self.assertEqual(image.size, (1600, 1200))
+        self.assertEqual(cache.get(self.images[0], self.ANNOTATIONS, 'thumbnail'), thumbnail)
+        self.assertNotEqual(cache.get(self.images[0], [], 'thumbnail'), thumbnail)
+        self.assertEqual(cache.stats, {'hits': 1, 'misses': 3, 'evictions': 0})
+        self.assertIsNone(cache.get(self.tmp_dir / 'missing.jpg', [], 'tablet'))
+        with self.assertRaises(ValueError):
+            cache.get(self.images[0], [], 'poster')
+
+    def test_lru_eviction(self):
+        probe = AnnotatedImageCache(self.tmp_dir / 'probe')
+        size = probe.get(self.images[0], [], 'tablet').stat().st_size
+        cache = AnnotatedImageCache(self.tmp_dir / 'cache', max_bytes=int(size * 2.5))
+        first = cache.get(self.images[0], [], 'tablet')
+        second = cache.get(self.images[1], [], 'tablet')
+        cache.get(self.images[0], [], 'tablet')
+        cache.get(self.images[2], [], 'tablet')
+        self.assertTrue(first.exists())
+        self.assertFalse(second.exists())
+        self.assertEqual(cache.stats['evictions'], 1)
+        self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+
+        reopened = AnnotatedImageCache(self.tmp_dir / 'cache', max_bytes=cache.max_bytes)
+        self.assertEqual((len(reopened), reopened.total_bytes), (2, cache.total_bytes))
+
+
+class TestBatchReports(unittest.TestCase):
+    """Per (site, camera, day) reports, index file and resumable reruns"""
+
+    PERSON = {'label': 'person', 'score': 0.9, 'bounding_box_start_x': 0.1, 'bounding_box_end_x': 0.2,
+              'bounding_box_start_y': 0.1, 'bounding_box_end_y': 0.4, 'attributes': {'no_ppe': 0.95}}
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.assets = self.tmp_dir / 'assets'
+        (self.assets / 'images_EST-1').mkdir(parents=True)
+        (self.assets / 'images_EST-2').mkdir()
+        self.write_camera('EST-1', {
+            'a.jpg': {'image_shooting': '2025:06:10 08:00:00', 'detections': [self.PERSON]},
+            'b.jpg': {'image_shooting': '2025:06:10 15:00:00', 'detections': []},
+            'c.jpg': {'image_shooting': '2025:06:11 09:00:00', 'detections': [self.PERSON]},
+        })
+        self.write_camera('EST-2', {
+            'd.jpg': {'image_shooting': '2025:06:11 10:00:00', 'detections': []},
+        })
+        with open(self.assets / 'weather_info.json', 'w', encoding='utf-8') as f:
+            json.dump({'weather_by_date': {
+                '2025-06-10': {'temperature': 18, 'wind_speed': 10, 'precipitation': 0, 'visibility': 9000},
+                '2025-06-11': {'temperature': 22, 'wind_speed': 30, 'precipitation': 0, 'visibility': 9000},
+            }}, f)
+        self.output = self.tmp_dir / 'reports'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def write_camera(self, camera, images):
+        with open(self.assets / f'images_{camera}.json', 'w', encoding='utf-8') as f:
+            json.dump({'images': images}, f)
+
+    def partitions(self):
+        loader = SecuriSiteDataLoader(project_root=self.tmp_dir)
+        agent = WeatherContextAgent(source=FileWeatherSource(self.assets / 'weather_info.json'))
+        return collect_partitions(loader, 'EST', agent)
+
+    def test_partitions_by_camera_and_day(self):
+        partitions = self.partitions()
+        self.assertEqual([p.key for p in partitions], ['EST/EST-1/2025-06-10', 'EST/EST-1/2025-06-11', 'EST/EST-2/2025-06-11'])
+        self.assertEqual(len(partitions[0].records), 2)
+        self.assertEqual(partitions[1].weather[0]['weather_conditions']['wind_speed'], 30)
+
+    def test_index_and_resumable_rerun(self):
+        summary = run_batch(self.output, self.partitions(), workers=2)
+        self.assertEqual((summary['rendered'], summary['skipped'], summary['failed']), (3, 0, []))
+        entries = load_index(self.output)['partitions']
+        self.assertEqual(entries['EST/EST-1/2025-06-10']['risks'], 1)
+        self.assertEqual(entries['EST/EST-1/2025-06-10']['images'], 2)
+        report = (self.output / entries['EST/EST-1/2025-06-11']['report']).read_text(encoding='utf-8')
+        self.assertIn('R4534-15', report)
+
+        self.assertEqual(run_batch(self.output, self.partitions(), workers=1)['skipped'], 3)
+
+        self.write_camera('EST-2', {'d.jpg': {'image_shooting': '2025:06:11 10:00:00', 'detections': [self.PERSON]}})
+        os.utime(self.assets / 'images_EST-2.json', (2_000_000_000, 2_000_000_000))
+        summary = run_batch(self.output, self.partitions(), workers=1)
+        self.assertEqual((summary['rendered'], summary['skipped']), (1, 2))
+        self.assertEqual(load_index(self.output)['partitions']['EST/EST-2/2025-06-11']['risks'], 1)
+
+        (self.output / 'EST' / 'EST-1' / '2025-06-10.md').unlink()
+        self.assertEqual(run_batch(self.output, self.partitions(), workers=1)['rendered'], 1)
+        self.assertEqual(run_batch(self.output, self.partitions(), workers=1, force=True)['rendered'], 3)
+        self.assertTrue((self.output / INDEX_NAME).exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
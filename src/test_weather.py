@@ -0,0 +1,415 @@
+"""
+Phase 1: Unit & Integration Testing - Step 4
+Weather Context Validation (time index, caching, batch assessment)
+"""
+
+import asyncio
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+from aiohttp import web
+
+from securisite.agents.regulation_agent import RegulationAgent
+from securisite.agents.weather_context_agent import WeatherContextAgent
+from securisite.utils.weather_index import WeatherTimeIndex, parse_timestamp
+from securisite.utils.weather_sources import (
+    CachedWeatherSource, FileWeatherSource, HttpWeatherSource, WeatherSource
+)
+from securisite.utils.weather_windows import RiskWindowIndex
+
+WEATHER_DATA = {
+    'weather_by_date': {
+        '2025-06-10': {'temperature': 18, 'wind_speed': 10, 'precipitation': 0, 'visibility': 9000},
+        '2025-06-11': {'temperature': 22, 'wind_speed': 30, 'precipitation': 0, 'visibility': 9000},
+        '2025-06-12': {
+            'hourly': [
+                {'time': '08:00', 'temperature': 20, 'wind_speed': 5, 'precipitation': 8, 'visibility': 800},
+                {'time': '10:00', 'temperature': 24, 'wind_speed': 15, 'precipitation': 0, 'visibility': 5000},
+            ]
+        },
+    }
+}
+
+
+class TestWeatherTimeIndex(unittest.TestCase):
+    """Sorted time index over weather_info.json"""
+
+    def setUp(self):
+        self.index = WeatherTimeIndex.from_weather_data(WEATHER_DATA)
+
+    def test_timestamp_formats(self):
+        expected = datetime(2025, 6, 10, 8, 5)
+        self.assertEqual(parse_timestamp('2025:06:10 08:05:00'), expected)
+        self.assertEqual(parse_timestamp('2025-06-10T08:05:00'), expected)
+
+    def test_daily_summary_matches_its_own_day(self):
+        self.assertEqual(self.index.lookup('2025:06:10 00:40:00')['temperature'], 18)
+        self.assertEqual(self.index.lookup('2025:06:10 23:10:00')['temperature'], 18)
+        self.assertEqual(self.index.lookup('2025:06:11 07:00:00')['wind_speed'], 30)
+
+    def test_hourly_nearest_and_interpolated(self):
+        self.assertEqual(self.index.lookup('2025:06:12 08:20:00')['visibility'], 800)
+        blended = self.index.lookup('2025:06:12 09:00:00', interpolate=True)
+        self.assertEqual(blended['temperature'], 22)
+        self.assertEqual(blended['wind_speed'], 10)
+
+    def test_batch_lookup_preserves_input_order(self):
+        stamps = ['2025:06:12 10:00:00', '2025:06:10 09:00:00', '2025:06:11 12:00:00', '2030:01:01 00:00:00']
+        batch = self.index.lookup_many(stamps)
+        self.assertEqual(batch, [self.index.lookup(ts) for ts in stamps])
+
+    def test_no_data_beyond_max_gap(self):
+        # A daily summary covers its whole day, not the days around it
+        self.assertIsNone(self.index.lookup('2025:06:09 23:00:00'))
+        self.assertIsNone(self.index.lookup('2025:07:01 08:00:00'))
+        # An hourly observation covers the few hours around it
+        self.assertEqual(self.index.lookup('2025:06:12 13:00:00')['visibility'], 5000)
+        self.assertIsNone(self.index.lookup('2025:06:12 14:00:00'))
+        self.assertIsNone(self.index.lookup('2025:06:12 14:00:00', interpolate=True))
+        # Midnight belongs to the day it starts
+        self.assertEqual(self.index.lookup('2025:06:10 00:00:00')['temperature'], 18)
+        self.assertEqual(self.index.lookup('2025:06:11 00:00:00')['wind_speed'], 30)
+        self.assertIsNone(self.index.lookup('2025:06:12 00:00:00'))
+        # The previous day's summary still covers its evening, even with hourly data closer
+        self.assertEqual(self.index.lookup('2025:06:11 23:00:00')['wind_speed'], 30)
+        stamps = ['2025:06:09 23:00:00', '2025:06:12 14:00:00', '2025:06:12 13:00:00']
+        self.assertEqual(self.index.lookup_many(stamps), [self.index.lookup(ts) for ts in stamps])
+
+        gap = WeatherTimeIndex.from_weather_data({'hourly': [
+            {'datetime': '2025-06-10T08:00:00', 'temperature': 10},
+            {'datetime': '2025-06-20T08:00:00', 'temperature': 30}]})
+        self.assertIsNone(gap.lookup('2025:06:15 08:00:00', interpolate=True))
+        self.assertEqual(gap.lookup('2025:06:10 10:00:00', interpolate=True)['temperature'], 10)
+
+        agent = WeatherContextAgent()
+        frame = agent.join_weather(['2025:07:01 08:00:00', '2025:06:10 08:00:00'], WEATHER_DATA)
+        self.assertTrue(pd.isna(frame['weather_time'][0]))
+        self.assertEqual(frame['temperature'].tolist(), [agent.default_weather['temperature'], 18])
+
+    def test_empty_index(self):
+        self.assertIsNone(WeatherTimeIndex.from_weather_data({}).lookup('2025:06:10 08:00:00'))
+
+    def test_agent_uses_image_timestamp(self):
+        agent = WeatherContextAgent()
+        first = agent._get_weather_for_time('2025:06:10 12:00:00', WEATHER_DATA)
+        second = agent._get_weather_for_time('2025:06:11 12:00:00', WEATHER_DATA)
+        self.assertEqual((first['temperature'], second['temperature']), (18, 22))
+        self.assertEqual(agent._get_weather_for_time('2025:06:10 12:00:00', {}), agent.default_weather)
+
+    def test_hourly_table_shares_observations(self):
+        table = WeatherContextAgent().hourly_weather_table(WEATHER_DATA)
+        self.assertEqual(list(table), ['2025-06-10', '2025-06-11', '2025-06-12'])
+        self.assertTrue(all(len(hours) == 24 for hours in table.values()))
+        self.assertIs(table['2025-06-10'][0], table['2025-06-10'][23])
+        self.assertEqual(table['2025-06-12'][8]['visibility'], 800)
+        self.assertEqual(table['2025-06-12'][10]['visibility'], 5000)
+        # Hours of 06-12 far from both hourly observations have no weather
+        self.assertIsNone(table['2025-06-12'][2])
+        self.assertIsNone(table['2025-06-12'][20])
+
+    def test_hourly_table_leaves_gaps_unset(self):
+        table = WeatherContextAgent().hourly_weather_table({'weather_by_date': {
+            '2025-06-10': {'condition': 'Sunny'}, '2025-06-20': {'condition': 'Storm'}}})
+        self.assertEqual(list(table), ['2025-06-10', '2025-06-20'])
+        self.assertEqual({hour['condition'] for hour in table['2025-06-10']}, {'Sunny'})
+
+
+class TestBatchWeatherAssessment(unittest.TestCase):
+    """Vectorized image-to-weather join and risk assessment"""
+
+    STAMPS = ['2025:06:12 08:20:00', '2025:06:10 09:00:00', '2025:06:11 12:00:00', '2025:06:12 10:10:00']
+
+    def setUp(self):
+        self.agent = WeatherContextAgent()
+
+    def test_join_matches_index_lookup(self):
+        frame = self.agent.join_weather(self.STAMPS, WEATHER_DATA)
+        index = WeatherTimeIndex.from_weather_data(WEATHER_DATA)
+        self.assertEqual(list(frame['temperature']), [index.lookup(ts)['temperature'] for ts in self.STAMPS])
+
+        # Hourly and daily data with gaps, every half hour over the days around them
+        gapped = {'weather_by_date': {
+            '2025-06-10': {'temperature': 18},
+            '2025-06-12': {'hourly': [{'time': '08:00', 'temperature': 10}, {'time': '09:00', 'temperature': 11},
+                                      {'time': '17:00', 'temperature': 15}]},
+            '2025-06-13': {'temperature': 25}}}
+        index = WeatherTimeIndex.from_weather_data(gapped)
+        stamps = [f'2025:06:{day:02d} {minutes // 60:02d}:{minutes % 60:02d}:00'
+                  for day in range(9, 15) for minutes in range(0, 24 * 60, 30)][::-1]
+        frame = self.agent.join_weather(stamps, gapped)
+        expected = [index.lookup(ts) for ts in stamps]
+        self.assertEqual(frame['weather_time'].isna().tolist(), [weather is None for weather in expected])
+        self.assertEqual(list(frame['temperature']),
+                         [(weather or self.agent.default_weather)['temperature'] for weather in expected])
+
+    def test_batch_matches_per_image_assessment(self):
+        frame = self.agent.assess_weather_frame(self.agent.join_weather(self.STAMPS, WEATHER_DATA))
+        contexts = self.agent._frame_to_contexts(frame)
+        for ts, context in zip(self.STAMPS, contexts):
+            weather = self.agent._get_weather_for_time(ts, WEATHER_DATA)
+            self.assertEqual(context['risk_modifiers'], self.agent._assess_weather_risks(weather))
+        self.assertEqual(contexts[0]['risk_multiplier'], 3.6)
+        self.assertEqual(contexts[0]['max_severity'], 10)
+        self.assertEqual(contexts[1]['risk_multiplier'], 1.0)
+
+    def test_half_hour_snaps_like_per_image_path(self):
+        weather_data = {'weather_by_date': {'2025-06-10': {'hourly': [
+            {'time': '08:00', 'wind_speed': 24}, {'time': '09:00', 'wind_speed': 27},
+            {'time': '10:00', 'wind_speed': 20}, {'time': '11:00', 'wind_speed': 26}]}}}
+        stamps = ['2025:06:10 08:30:00', '2025:06:10 09:30:00', '2025:06:10 10:29:59']
+        contexts = self.agent._frame_to_contexts(
+            self.agent.assess_weather_frame(self.agent.join_weather(stamps, weather_data)))
+        for ts, context in zip(stamps, contexts):
+            weather = self.agent._get_weather_for_time(ts, weather_data)
+            self.assertEqual(context['risk_modifiers'], self.agent._assess_weather_risks(weather))
+        self.assertEqual(list(self.agent.join_weather(stamps, weather_data)['wind_speed']), [27, 20, 20])
+
+    def test_missing_values_use_defaults(self):
+        frame = self.agent.assess_weather_frame(
+            self.agent.join_weather(['2025:06:10 08:00:00'], {}))
+        self.assertEqual(frame['max_severity'].tolist(), [0])
+        self.assertEqual(frame['risk_multiplier'].tolist(), [1.0])
+
+
+class TestRiskWindows(unittest.TestCase):
+    """Precomputed weather risk windows and their interval index"""
+
+    def setUp(self):
+        self.windows = WeatherContextAgent().compute_risk_windows(WEATHER_DATA, 'EST')
+        self.index = RiskWindowIndex()
+        self.index.replace_site('EST', self.windows)
+
+    def test_contiguous_windows(self):
+        summary = [(w.factor, w.start, w.end, w.max_severity) for w in self.windows]
+        self.assertEqual(summary, [
+            ('high_wind', datetime(2025, 6, 11, 0), datetime(2025, 6, 12, 0), 6),
+            ('heavy_rain', datetime(2025, 6, 12, 5), datetime(2025, 6, 12, 9, 0, 0, 1), 10),
+            ('low_visibility', datetime(2025, 6, 12, 5), datetime(2025, 6, 12, 9, 0, 0, 1), 10),
+        ])
+
+    def test_windows_follow_lookup(self):
+        agent = WeatherContextAgent()
+        for hour in pd.date_range('2025-06-10', '2025-06-13', freq='h'):
+            ts = hour.strftime('%Y:%m:%d %H:%M:%S')
+            modifiers = agent._assess_weather_risks(agent._get_weather_for_time(ts, WEATHER_DATA))
+            active = {w.factor for w in self.index.overlapping(hour.to_pydatetime())}
+            self.assertEqual(active, {m['weather_factor'] for m in modifiers}, ts)
+
+    def test_gapped_daily_data(self):
+        agent = WeatherContextAgent()
+        weather_data = {'weather_by_date': {
+            '2025-07-01': {'temperature': 20, 'wind_speed': 60, 'precipitation': 0, 'visibility': 9000},
+            '2025-07-11': {'temperature': 20, 'wind_speed': 5, 'precipitation': 0, 'visibility': 9000},
+        }}
+        windows = agent.compute_risk_windows(weather_data, 'EST')
+        self.assertEqual([(w.factor, w.start, w.end) for w in windows],
+                         [('high_wind', datetime(2025, 7, 1), datetime(2025, 7, 2))])
+        self.assertEqual(agent._get_weather_for_time('2025:07:05 10:00:00', weather_data), agent.default_weather)
+        index = RiskWindowIndex()
+        index.replace_site('EST', windows)
+        self.assertEqual(index.overlapping('2025-07-05T10:00:00'), [])
+
+        lone = agent.compute_risk_windows({'weather_by_date': {'2025-07-01': weather_data['weather_by_date']['2025-07-01']}}, 'EST')
+        self.assertEqual([(w.start, w.end) for w in lone], [(datetime(2025, 7, 1), datetime(2025, 7, 2))])
+
+    def test_point_and_range_queries(self):
+        self.assertEqual([w.factor for w in self.index.overlapping('2025-06-11T05:00:00')], ['high_wind'])
+        self.assertEqual([w.factor for w in self.index.overlapping('2025-06-11T22:00:00')], ['high_wind'])
+        self.assertEqual(self.index.overlapping('2025-06-12T00:00:00', factor='high_wind'), [])
+        self.assertEqual(len(self.index.overlapping('2025-06-11T12:00:00', '2025-06-12T12:00:00')), 3)
+        self.assertEqual(self.index.overlapping('2025-06-10T00:00:00', '2025-06-10T23:59:59'), [])
+        self.assertEqual(self.index.overlapping('2025-06-11T05:00:00', site='OUEST'), [])
+
+    def test_regulation_agent_plans_around_windows(self):
+        agent = RegulationAgent(weather_windows=self.index)
+        result = asyncio.run(agent.process({'risks': [], 'timestamp': '2025:06:10 18:00:00', 'site': 'EST'}))
+        self.assertEqual([w['factor'] for w in result['weather_windows']], ['high_wind'])
+        self.assertIn("Suspendre les opérations de grutage du 11/06 00:00 au 12/06 00:00 (vent fort)",
+                      result['recommendations'])
+
+
+class FakeClock:
+    """Manually advanced clock for TTL tests"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SlowWeatherSource(WeatherSource):
+    """Counts fetched hours; each fetch takes delay seconds"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.fetched = []
+
+    async def fetch(self, hour):
+        self.fetched.append(hour)
+        await asyncio.sleep(self.delay)
+        return {'temperature': hour.hour}
+
+    async def fetch_many(self, hours):
+        self.fetched.extend(hours)
+        await asyncio.sleep(self.delay)
+        return [{'temperature': hour.hour} for hour in hours]
+
+
+class TestWeatherCache(unittest.TestCase):
+    """TTL cache and single-flight coalescing in front of a weather source"""
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.weather_path = self.tmp_dir / 'weather_info.json'
+        with open(self.weather_path, 'w', encoding='utf-8') as f:
+            json.dump(WEATHER_DATA, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_ttl_expiry(self):
+        clock = FakeClock()
+        cache = CachedWeatherSource(FileWeatherSource(self.weather_path), ttl_seconds=60, clock=clock)
+
+        async def lookups():
+            at = datetime(2025, 6, 10, 8, 10)
+            await cache.get(at)
+            await cache.get(datetime(2025, 6, 10, 7, 50))  # same hour
+            clock.now = 61
+            await cache.get(at)
+
+        asyncio.run(lookups())
+        self.assertEqual(cache.stats, {'hits': 1, 'misses': 2, 'coalesced': 0})
+
+    def test_cancelled_fetch_does_not_strand_waiters(self):
+        source = SlowWeatherSource()
+        cache = CachedWeatherSource(source)
+        at = datetime(2025, 6, 10, 8)
+
+        async def scenario():
+            leader = asyncio.create_task(cache.get(at))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(cache.get(at))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await asyncio.wait_for(follower, timeout=1)
+
+        self.assertEqual(asyncio.run(scenario()), {'temperature': 8})
+        self.assertEqual(len(source.fetched), 2)
+
+    def test_concurrent_batches_are_single_flight(self):
+        source = SlowWeatherSource()
+        cache = CachedWeatherSource(source)
+        hours = [datetime(2025, 6, 10, h) for h in (8, 9, 10)]
+
+        async def scenario():
+            return await asyncio.gather(cache.get_many(hours), cache.get_many(hours[1:]), cache.get(hours[0]))
+
+        first, second, single = asyncio.run(scenario())
+        self.assertEqual(sorted(source.fetched), hours)
+        self.assertEqual([w['temperature'] for w in first], [8, 9, 10])
+        self.assertEqual([w['temperature'] for w in second], [9, 10])
+        self.assertEqual(single, {'temperature': 8})
+        self.assertEqual(cache.stats['coalesced'], 3)
+
+    def test_agent_with_file_source(self):
+        agent = WeatherContextAgent(source=FileWeatherSource(self.weather_path))
+        result = asyncio.run(agent.process({'timestamp': '2025:06:12 08:00:00'}))
+        self.assertEqual(result['weather_conditions']['visibility'], 800)
+        factors = {risk['weather_factor'] for risk in result['risk_modifiers']}
+        self.assertEqual(factors, {'heavy_rain', 'low_visibility'})
+
+    def test_agent_batch_with_file_source(self):
+        agent = WeatherContextAgent(source=FileWeatherSource(self.weather_path))
+        contexts = asyncio.run(agent.process_batch(['2025:06:12 08:00:00', '2025:06:11 09:00:00']))
+        self.assertEqual([c['max_severity'] for c in contexts], [10, 6])
+        self.assertEqual(json.loads(json.dumps(contexts))[1]['weather_conditions']['wind_speed'], 30)
+
+    def test_http_provider_coalesces_concurrent_requests(self):
+        requests_seen = []
+
+        async def weather_handler(request):
+            requests_seen.append(request.query['datetime'])
+            await asyncio.sleep(0.05)
+            return web.json_response({'weather': {'temperature': 21, 'wind_speed': 40}})
+
+        async def scenario():
+            app = web.Application()
+            app.router.add_get('/weather', weather_handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+
+            source = HttpWeatherSource(f'http://127.0.0.1:{port}/weather')
+            agent = WeatherContextAgent(source=source)
+            try:
+                same_hour = [agent.process({'timestamp': f'2025:06:10 08:{minute:02d}:00'})
+                             for minute in range(0, 30, 3)]
+                results = await asyncio.gather(*same_hour)
+                batch = await agent.get_weather_for_times(
+                    ['2025:06:10 08:05:00', '2025:06:10 11:00:00', '2025:06:10 11:20:00'])
+            finally:
+                await source.close()
+                await runner.cleanup()
+            return agent, results, batch
+
+        agent, results, batch = asyncio.run(scenario())
+        self.assertEqual(requests_seen, ['2025-06-10T08:00:00', '2025-06-10T11:00:00'])
+        self.assertEqual(agent.weather_cache.stats['coalesced'], 9)
+        self.assertTrue(all(r['risk_modifiers'][0]['weather_factor'] == 'high_wind' for r in results))
+        self.assertEqual([w['temperature'] for w in batch], [21, 21, 21])
+
+
+    def test_http_session_shared_across_event_loops(self):
+        peers = []
+
+        async def weather_handler(request):
+            peers.append(request.transport.get_extra_info('peername'))
+            return web.json_response({'weather': {'temperature': 18}})
+
+        # Provider on its own loop, alive across the callers' asyncio.run calls
+        server_loop = asyncio.new_event_loop()
+        server_thread = threading.Thread(target=server_loop.run_forever, daemon=True)
+        server_thread.start()
+
+        async def start_server():
+            app = web.Application()
+            app.router.add_get('/weather', weather_handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            return runner, site._server.sockets[0].getsockname()[1]
+
+        runner, port = asyncio.run_coroutine_threadsafe(start_server(), server_loop).result(10)
+        source = HttpWeatherSource(f'http://127.0.0.1:{port}/weather')
+        try:
+            sessions = []
+            for hour in range(3):
+                # One short-lived loop per call, as web requests and batch partitions do
+                weather = asyncio.run(source.fetch(datetime(2025, 6, 10, 8 + hour)))
+                self.assertEqual(weather, {'temperature': 18})
+                sessions.append(source._session)
+            self.assertIs(sessions[0], sessions[2])
+            # Keep-alive connection of the shared pool reused for every call
+            self.assertEqual(len(set(peers)), 1)
+        finally:
+            asyncio.run(source.close())
+            asyncio.run_coroutine_threadsafe(runner.cleanup(), server_loop).result(10)
+            server_loop.call_soon_threadsafe(server_loop.stop)
+            server_thread.join()
+            server_loop.close()
+        self.assertIsNone(source._session)
+        self.assertIsNone(source._thread)
+
+if __name__ == '__main__':
+    unittest.main()
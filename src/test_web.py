@@ -0,0 +1,325 @@
+"""
+Phase 1: Unit & Integration Testing - Step 7
+Web Application Validation (user store, response cache and conditional GET,
+report pagination)
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+from securisite.utils.report_history import ReportHistory
+from securisite.utils.response_cache import CachedBody, ResponseCache
+from securisite.utils.risk_index import encode_cursor
+from securisite.utils.user_store import UserStore, check_password, hash_password
+
+WEB_RISK = {
+    'id': 'web-1', 'title': 'Port du casque', 'description': 'Ouvrier sans casque',
+    'risk_type': 'person_without_ppe', 'severity': 8, 'location': 'Zone Est',
+    'timestamp': '2025-06-10 08:00', 'image_path': 'web-1.jpg', 'annotations': [],
+    'recommendations': [], 'regulation': '', 'camera': 'EST-1'
+}
+
+
+class TestUserStore(unittest.TestCase):
+    """users.toml cached in memory, hashed passwords, verified sessions"""
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = self.tmp / "users.toml"
+        self.now = 0.0
+        self.writes = 0
+        self.write_users({"marc": hash_password("chantier", iterations=1000)})
+        self.store = UserStore(self.path, check_interval=5, clock=lambda: self.now)
+
+    def write_users(self, passwords, timeout=60):
+        lines = ["[config]", "require_authentication = true", f"session_timeout_minutes = {timeout}", ""]
+        for name, password in passwords.items():
+            lines += [f"[users.{name}]", f'password = "{password}"', f'full_name = "{name.title()}"', ""]
+        self.path.write_text("\n".join(lines), encoding='utf-8')
+        # Distinct mtime even on coarse-grained filesystems
+        self.writes += 1
+        os.utime(self.path, (1_700_000_000 + self.writes, 1_700_000_000 + self.writes))
+
+    def test_password_hashing(self):
+        stored = hash_password("secret", iterations=1000)
+        self.assertTrue(stored.startswith("pbkdf2_sha256$1000$"))
+        self.assertNotEqual(stored, hash_password("secret", iterations=1000))
+        self.assertTrue(check_password("secret", stored))
+        self.assertFalse(check_password("Secret", stored))
+        self.assertFalse(check_password("secret", "pbkdf2_sha256$broken"))
+        # Plain-text entries of older users.toml files
+        self.assertTrue(check_password("secret", "secret"))
+
+    def test_login_and_user_info(self):
+        self.assertTrue(self.store.require_authentication)
+        self.assertTrue(self.store.verify_password("marc", "chantier"))
+        self.assertFalse(self.store.verify_password("marc", "autre"))
+        self.assertFalse(self.store.verify_password("inconnu", "chantier"))
+        self.assertEqual(self.store.user_info("marc"), {"full_name": "Marc", "username": "marc"})
+        self.assertIsNone(self.store.user_info("inconnu"))
+
+    def test_reload_on_change(self):
+        self.assertIsNotNone(self.store.user_info("marc"))
+        version = self.store.version
+        self.write_users({"marc": "chantier", "julie": "grue"})
+        # Not checked again before check_interval
+        self.assertIsNone(self.store.user_info("julie"))
+        self.now += 10
+        self.assertTrue(self.store.verify_password("julie", "grue"))
+        self.assertEqual(self.store.version, version + 1)
+        self.now += 10
+        self.store.user_info("julie")
+        self.assertEqual(self.store.version, version + 1)
+
+    def test_session_expiry_cache(self):
+        login_time = datetime(2025, 6, 10, 8, 0)
+        expiry = self.store.session_expiry("marc", login_time.isoformat())
+        self.assertEqual(expiry, login_time + timedelta(minutes=60))
+        self.assertIsNone(self.store.session_expiry("inconnu", login_time.isoformat()))
+        self.assertEqual(len(self.store._sessions), 1)
+
+        # Removing the user invalidates its sessions once the file is reloaded
+        self.write_users({"julie": "grue"})
+        self.assertEqual(self.store.session_expiry("marc", login_time.isoformat()), expiry)
+        self.now += 10
+        self.assertIsNone(self.store.session_expiry("marc", login_time.isoformat()))
+
+    def test_missing_file(self):
+        store = UserStore(self.tmp / "absent.toml")
+        self.assertFalse(store.require_authentication)
+        self.assertFalse(store.verify_password("marc", "chantier"))
+
+
+class TestResponseCache(unittest.TestCase):
+    """Serialized bodies per key and data version"""
+
+    def test_cache_and_invalidate(self):
+        cache = ResponseCache(max_entries=2)
+        renders = []
+
+        def render(text):
+            def _render():
+                renders.append(text)
+                return CachedBody(text.encode('utf-8'), 'text/plain')
+            return _render
+
+        body, version = cache.get(('a',), render('A'))
+        self.assertEqual(body.body, b'A')
+        self.assertEqual(cache.get(('a',), render('A2'))[0].body, b'A')
+        self.assertEqual(renders, ['A'])
+
+        etag = cache.etag(('a',))
+        self.assertEqual(etag, cache.etag(('a',), version))
+        self.assertNotEqual(etag, cache.etag(('b',)))
+        cache.invalidate()
+        self.assertNotEqual(etag, cache.etag(('a',)))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get(('a',), render('A2'))[0].body, b'A2')
+
+        cache.get(('b',), render('B'))
+        cache.get(('c',), render('C'))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats['hits'], 1)
+
+    def test_data_change_while_rendering(self):
+        cache = ResponseCache()
+
+        def render():
+            cache.invalidate()
+            return CachedBody(b'stale', 'text/plain')
+
+        body, version = cache.get(('a',), render)
+        self.assertEqual(version, cache.version - 1)
+        self.assertEqual(len(cache), 0)
+
+
+class WebAppTestCase(unittest.TestCase):
+    """Flask test client over the in-memory risks, with test risks added"""
+
+    @classmethod
+    def setUpClass(cls):
+        from securisite import web_app
+        cls.web_app = web_app
+        # The startup weather windows computation invalidates the cache once
+        for thread in threading.enumerate():
+            if thread.name == 'risk-windows':
+                thread.join()
+        cls.client = web_app.app.test_client()
+
+    def setUp(self):
+        web_app = self.web_app
+        if web_app.RISK_STORE is not None:
+            self.skipTest("SQLite store mode")
+        web_app.REAL_RISKS.append(dict(WEB_RISK))
+        web_app.RISK_INDEX.rebuild(web_app.REAL_RISKS)
+        web_app.RESPONSE_CACHE.invalidate()
+
+    def tearDown(self):
+        web_app = self.web_app
+        web_app.REAL_RISKS[:] = [r for r in web_app.REAL_RISKS if not r['id'].startswith('web-')]
+        web_app.RISK_INDEX.rebuild(web_app.REAL_RISKS)
+        web_app.RESPONSE_CACHE.invalidate()
+
+
+class TestConditionalGet(WebAppTestCase):
+    """ETag / Last-Modified on the dashboard and the report and risk API"""
+
+    def test_not_modified(self):
+        for url in ['/api/report/latest?date=2025-06-10', '/api/risk/web-1', '/?date=2025-06-10']:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('private', response.headers['Cache-Control'])
+                etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+
+                response = self.client.get(url, headers={'If-None-Match': etag})
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.data, b'')
+                response = self.client.get(url, headers={'If-Modified-Since': last_modified})
+                self.assertEqual(response.status_code, 304)
+
+    def test_data_change(self):
+        url = '/api/report/latest?date=2025-06-10'
+        response = self.client.get(url)
+        self.assertEqual(response.json['total_risks'], 1)
+        etag = response.headers['ETag']
+
+        web_app = self.web_app
+        web_app.REAL_RISKS.append(dict(WEB_RISK, id='web-2', severity=4))
+        web_app.RISK_INDEX.rebuild(web_app.REAL_RISKS)
+        web_app.RESPONSE_CACHE.invalidate()
+
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['total_risks'], 2)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(self.client.get('/api/risk/absent').status_code, 404)
+
+
+class TestReportPagination(WebAppTestCase):
+    """/api/report/latest pages, projection and summary mode"""
+
+    def setUp(self):
+        super().setUp()
+        web_app = self.web_app
+        web_app.REAL_RISKS.extend(dict(WEB_RISK, id=f'web-{i}', severity=i, timestamp=f'2025-06-10 1{i}:00',
+                                       risk_type='fall' if i % 2 else 'person_without_ppe')
+                                  for i in range(2, 7))
+        web_app.RISK_INDEX.rebuild(web_app.REAL_RISKS)
+        web_app.RESPONSE_CACHE.invalidate()
+
+    def test_pages(self):
+        url = '/api/report/latest?date=2025-06-10&limit=4&fields=severity'
+        first = self.client.get(url).json
+        self.assertEqual(first['total_risks'], 6)
+        self.assertEqual(first['risks'], [{'id': 'web-1', 'severity': 8}, {'id': 'web-6', 'severity': 6},
+                                          {'id': 'web-5', 'severity': 5}, {'id': 'web-4', 'severity': 4}])
+        second = self.client.get(f"{url}&cursor={first['next_cursor']}").json
+        self.assertEqual([r['id'] for r in second['risks']], ['web-3', 'web-2'])
+        self.assertIsNone(second['next_cursor'])
+
+        by_time = self.client.get('/api/report/latest?date=2025-06-10&order=time&limit=1').json
+        self.assertEqual(by_time['risks'][0]['id'], 'web-6')
+        self.assertIn('annotations', by_time['risks'][0])
+
+        wrong_types = encode_cursor('severity', ('x', 'y', 'z'))
+        for query in ['limit=0', 'limit=500', 'limit=abc', 'order=type', 'cursor=abc',
+                      f"order=time&cursor={first['next_cursor']}", f"cursor={wrong_types}"]:
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/report/latest?date=2025-06-10&{query}').status_code, 400)
+
+    def test_summary(self):
+        summary = self.client.get('/api/report/latest?date=2025-06-10&summary=1').json
+        self.assertNotIn('risks', summary)
+        self.assertEqual(summary['total_risks'], 6)
+        self.assertEqual(summary['max_severity'], 8)
+        self.assertEqual(summary['by_level'], {'high': 1, 'moderate': 2, 'low': 3})
+        self.assertEqual(summary['by_type'], {'person_without_ppe': 4, 'fall': 2})
+
+
+class TestWeatherReload(WebAppTestCase):
+    """Watch mode: a changed weather_info.json rebuilds the weather shown"""
+
+    def test_reload_rewrites_risk_weather(self):
+        web_app = self.web_app
+        web_app.find_risk('web-1')['weather'] = {'condition': 'Périmé'}
+        etag = self.client.get('/api/risk/web-1').headers['ETag']
+        web_app.reload_weather()
+        risk = self.client.get('/api/risk/web-1', headers={'If-None-Match': etag}).json
+        self.assertEqual(risk['weather'], web_app.get_weather_for_hour(web_app.WEATHER_TABLE, '2025-06-10', 8))
+        self.assertNotEqual(risk['weather'], {'condition': 'Périmé'})
+
+class TestInspectionsAndReports(WebAppTestCase):
+    """Building a report does not touch the inspection queue"""
+
+    def tearDown(self):
+        self.web_app.INSPECTIONS.complete(WEB_RISK['id'])
+        super().tearDown()
+
+    def test_acknowledged_risk_stays_closed(self):
+        web_app = self.web_app
+        web_app.schedule_risk_inspections([web_app.find_risk('web-1')])
+        self.assertIn('web-1', web_app.INSPECTIONS)
+
+        self.assertEqual(self.client.post('/api/risk/web-1/ack').status_code, 200)
+        self.assertNotIn('web-1', web_app.INSPECTIONS)
+        response = self.client.get('/api/report/markdown?date=2025-06-10')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('web-1.jpg', response.get_data(as_text=True))
+        self.assertNotIn('web-1', web_app.INSPECTIONS)
+        self.assertNotIn('web-1', [i.violation_id for i in web_app.INSPECTIONS.plan()])
+
+
+class TestPdfExportKey(WebAppTestCase):
+    """PDF exports keyed on the report they render, history included"""
+
+    class Pool:
+        def __init__(self):
+            self.submitted = []
+
+        def status(self, key):
+            return None
+
+        def submit(self, key, markdown_text, images, title):
+            self.submitted.append((key, markdown_text))
+            return {'job_id': key, 'status': 'pending'}
+
+    def test_previous_report_in_key(self):
+        web_app = self.web_app
+        pool, history = self.Pool(), ReportHistory()
+        with patch.object(web_app, 'PDF_EXPORTS', pool), \
+                patch.object(web_app.orchestrator.report_agent, 'history', history):
+            self.assertEqual(self.client.get('/api/report/pdf?date=2025-06-10').status_code, 202)
+            self.assertEqual(history.dates(web_app.SITE_NAME), [])
+            history.remember(web_app.SITE_NAME, '2025-06-09', {'risks': {}, 'compliance_score': 50})
+            self.client.get('/api/report/pdf?date=2025-06-10')
+        (first, first_text), (second, second_text) = pool.submitted
+        self.assertNotEqual(first, second)
+        self.assertNotIn('09/06/2025', first_text)
+        self.assertIn('09/06/2025', second_text)
+        self.assertEqual(history.dates(web_app.SITE_NAME), ['2025-06-09'])
+
+
+class TestImageRemoval(WebAppTestCase):
+    """Images dropped from the camera exports leave the data, the index and the queue"""
+
+    def test_remove_images(self):
+        web_app = self.web_app
+        web_app.REAL_IMAGES_DATA['web-1.jpg'] = {'image_shooting': '2025:06:10 08:00:00', 'detections': []}
+        web_app.schedule_risk_inspections([web_app.find_risk('web-1')])
+        etag = self.client.get('/api/risk/web-1').headers['ETag']
+
+        web_app.remove_images({'web-1.jpg'})
+        self.assertNotIn('web-1.jpg', web_app.REAL_IMAGES_DATA)
+        self.assertNotIn('web-1', web_app.INSPECTIONS)
+        self.assertEqual(self.client.get('/api/risk/web-1', headers={'If-None-Match': etag}).status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()